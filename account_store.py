@@ -0,0 +1,189 @@
+"""
+account_store.py — Stockage indexé des comptes web utilisé par auth.py.
+
+Table SQLite (WAL) avec index secondaires sur l'email, le telegram_id et la table
+ip_map : les recherches et mises à jour ne touchent qu'une ligne, quel que soit
+le nombre de comptes.
+
+Migration unique depuis l'ancien `auth_data.json` :
+    python account_store.py
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+import config
+import db
+
+AUTH_FILE = "auth_data.json"
+
+FIELDS = ("password_hash", "created_at", "telegram_id", "email", "email_verified",
+          "failed_attempts", "locked_until", "last_ip")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    username        TEXT PRIMARY KEY,
+    password_hash   TEXT NOT NULL,
+    created_at      TEXT,
+    telegram_id     TEXT NOT NULL DEFAULT '',
+    email           TEXT NOT NULL DEFAULT '',
+    email_verified  INTEGER NOT NULL DEFAULT 0,
+    failed_attempts INTEGER NOT NULL DEFAULT 0,
+    locked_until    INTEGER NOT NULL DEFAULT 0,
+    last_ip         TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_email ON accounts(email) WHERE email != '';
+CREATE INDEX IF NOT EXISTS idx_accounts_telegram ON accounts(telegram_id) WHERE telegram_id != '';
+CREATE TABLE IF NOT EXISTS ip_map (
+    ip              TEXT PRIMARY KEY,
+    username        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key             TEXT PRIMARY KEY,
+    value           TEXT
+);
+"""
+
+
+def _row_to_dict(row):
+    user = {field: row[field] for field in FIELDS}
+    user["email_verified"] = bool(user["email_verified"])
+    return user
+
+
+class SQLiteAccountStore:
+    """Comptes web indexés par username (clé), email, telegram_id et IP."""
+
+    def __init__(self, path=None):
+        self.path = path or config.DB_FILE
+        db.ensure_schema("accounts", SCHEMA, self.path)
+
+    def get(self, username):
+        row = db.get_connection(self.path).execute(
+            "SELECT * FROM accounts WHERE username = ?", (str(username),)
+        ).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def exists(self, username):
+        return db.get_connection(self.path).execute(
+            "SELECT 1 FROM accounts WHERE username = ?", (str(username),)
+        ).fetchone() is not None
+
+    def username_by_ip(self, ip):
+        row = db.get_connection(self.path).execute("SELECT username FROM ip_map WHERE ip = ?", (ip,)).fetchone()
+        return row["username"] if row else None
+
+    def username_by_email(self, email):
+        row = db.get_connection(self.path).execute(
+            "SELECT username FROM accounts WHERE email = ? AND email != '' LIMIT 1", (email,)
+        ).fetchone()
+        return row["username"] if row else None
+
+    def username_by_telegram_id(self, telegram_id):
+        row = db.get_connection(self.path).execute(
+            "SELECT username FROM accounts WHERE telegram_id = ? AND telegram_id != '' LIMIT 1", (str(telegram_id),)
+        ).fetchone()
+        return row["username"] if row else None
+
+    def telegram_ids_by_username(self):
+        """Tous les comptes web : username -> telegram_id ('' si non lié), en une requête."""
+        rows = db.get_connection(self.path).execute("SELECT username, telegram_id FROM accounts")
+        return {row["username"]: row["telegram_id"] for row in rows}
+
+    def create(self, username, record, ip):
+        """
+        Crée le compte et l'entrée ip_map dans une seule transaction.
+        Retourne (True, "") ou (False, "username" | "email" | "ip") selon le conflit.
+        """
+        with db.transaction(self.path) as conn:
+            if conn.execute("SELECT 1 FROM accounts WHERE username = ?", (username,)).fetchone():
+                return False, "username"
+            email = record.get("email") or ""
+            if email and conn.execute(
+                    "SELECT 1 FROM accounts WHERE email = ? AND email != ''", (email,)).fetchone():
+                return False, "email"
+            if conn.execute("SELECT 1 FROM ip_map WHERE ip = ?", (ip,)).fetchone():
+                return False, "ip"
+            conn.execute(
+                f"INSERT INTO accounts (username, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)})",
+                (username,) + tuple(record.get(field) for field in FIELDS)
+            )
+            conn.execute("INSERT INTO ip_map (ip, username) VALUES (?, ?)", (ip, username))
+        return True, ""
+
+    def update(self, username, **fields):
+        """Met à jour quelques champs d'un compte ; retourne False si le compte n'existe pas."""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Champs inconnus : {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with db.transaction(self.path) as conn:
+            cur = conn.execute(
+                f"UPDATE accounts SET {assignments} WHERE username = ?",
+                tuple(fields.values()) + (str(username),)
+            )
+        return cur.rowcount == 1
+
+    def delete_ip(self, ip):
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("DELETE FROM ip_map WHERE ip = ?", (ip,))
+        return cur.rowcount == 1
+
+    def migrate_from_json(self, auth_file=AUTH_FILE):
+        """
+        Importe (une seule fois) `auth_data.json`.
+        Retourne le nombre de comptes importés (0 si déjà fait).
+        """
+        if not os.path.exists(auth_file):
+            return 0
+        with open(auth_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        users = data.get("users", {})
+        with db.transaction(self.path) as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'auth_json_migrated'").fetchone():
+                return 0
+            conn.executemany(
+                f"INSERT OR IGNORE INTO accounts (username, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)})",
+                [(username,
+                  info.get("password_hash", ""),
+                  info.get("created_at"),
+                  str(info.get("telegram_id") or ""),
+                  info.get("email") or "",
+                  int(bool(info.get("email_verified", True))),
+                  int(info.get("failed_attempts", 0) or 0),
+                  int(info.get("locked_until", 0) or 0),
+                  info.get("last_ip"))
+                 for username, info in users.items()]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO ip_map (ip, username) VALUES (?, ?)",
+                list(data.get("ip_map", {}).items())
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('auth_json_migrated', ?)",
+                         (datetime.utcnow().isoformat() + "Z",))
+        return len(users)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Retourne le store des comptes, migrant l'ancien JSON au premier accès."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = SQLiteAccountStore()
+                store.migrate_from_json()
+                _store = store
+    return _store
+
+
+if __name__ == "__main__":
+    n_users = SQLiteAccountStore().migrate_from_json()
+    if n_users:
+        print(f"✅ Migration terminée : {n_users} comptes importés dans {config.DB_FILE}")
+    else:
+        print("ℹ️ Migration déjà effectuée (ou aucune donnée à importer).")
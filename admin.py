@@ -1,15 +1,21 @@
 import json
 import os
 import re
+import sqlite3
 import threading
+from datetime import datetime
 
 import telebot
 
 import auth
+import broadcast
 import config
+import purchase_store
+import robust_engine
+import telegram_dispatcher
 from telebot import types 
-from limiteur import add_credits
-from web_notifications import add_web_notification
+from limiteur import add_credits, get_credit_stats
+from web_notifications import add_web_notification, touch_user_web_notifications
 
 bot_admin = telebot.TeleBot(config.TOKEN_BOT_ADMIN)
 bot_user = telebot.TeleBot(config.TOKEN_BOT_USER)
@@ -40,12 +46,14 @@ def log_admin_action(action, user_id, details=""):
     except Exception:
         pass
 
-def send_telegram_message(bot, target_id, text, log_context=None, log_func=None, **kwargs):
-    """Send a Telegram message and handle delivery errors."""
+def send_telegram_message(bot, target_id, text, log_context=None, log_func=None,
+                          priority=telegram_dispatcher.HIGH, **kwargs):
+    """Send a Telegram message through the rate-limited dispatcher and handle delivery errors."""
     if not target_id:
         return False
     try:
-        bot.send_message(target_id, text, **kwargs)
+        telegram_dispatcher.call(bot, "send_message", target_id, text,
+                                 target_chat=target_id, priority=priority, **kwargs)
         return True
     except Exception as exc:
         if log_func:
@@ -82,13 +90,12 @@ def resolve_telegram_id(user_id):
     if not user_id:
         return None
     try:
-        data = auth.load_auth_data()
-    except (FileNotFoundError, json.JSONDecodeError, OSError) as exc:
+        user = auth.get_user(user_id)
+    except (sqlite3.Error, OSError) as exc:
         log_admin_action("resolve_telegram_id_error", user_id or "unknown", str(exc))
-        data = {}
-    users = data.get("users", {})
-    if user_id in users:
-        return get_valid_telegram_id(users[user_id].get("telegram_id"))
+        user = None
+    if user:
+        return get_valid_telegram_id(user.get("telegram_id"))
     return get_valid_telegram_id(user_id)
 
 # --- FONCTION POUR LIRE LE JSON ---
@@ -115,22 +122,22 @@ def admin_stats(message):
         log_admin_action("unauthorized_access", message.from_user.id, "Tentative d'accès non autorisée à /admin")
         bot_admin.reply_to(message, "⛔ Accès refusé.")
         return
-    DATA_FILE = "users_data.json"
-    if not os.path.exists(DATA_FILE):
+    stats = get_credit_stats(top=10)
+    if not stats["total_users"]:
         bot_admin.reply_to(message, "⚠️ Aucune donnée utilisateur trouvée.")
         return
-    with open(DATA_FILE, "r") as f:
-        data = json.load(f)
-    total_users = len(data)
-    total_credits = sum(u.get('credits', 0) for u in data.values())
+    total_users = stats["total_users"]
+    total_credits = stats["total_credits"]
     user_list = "📊 **DÉTAILS CRÉDITS (Top 10)**\n"
-    for count, (u_id, u_info) in enumerate(data.items()):
-        if count >= 10: break
-        user_list += f"• {u_id} : {u_info.get('credits', 0)} 💰\n"
+    for u_id, credits in stats["top"]:
+        user_list += f"• {u_id} : {credits} 💰\n"
 
+    send_stats = telegram_dispatcher.stats()
     stats_msg = (f"👑 **TABLEAU DE BORD ADMIN**\n━━━━━━━━━━━━━━━━━━\n"
                  f"👥 Utilisateurs totaux : {total_users}\n"
                  f"💎 Crédits en circulation : {total_credits}\n"
+                 f"📮 File d'envoi Telegram : {send_stats['depth']} en attente "
+                 f"({send_stats['sent']} envoyés, {send_stats['failed']} échecs, {send_stats['rate_limited']} × 429)\n"
                  f"━━━━━━━━━━━━━━━━━━\n{user_list}")
 
     markup = types.InlineKeyboardMarkup()
@@ -138,6 +145,69 @@ def admin_stats(message):
     markup.add(btn_maintenance)
     bot_admin.send_message(message.chat.id, stats_msg, reply_markup=markup, parse_mode="Markdown")
 
+# --- COMMANDE /MOTEUR : tableau de scores des stratégies de contournement ---
+@bot_admin.message_handler(commands=['moteur'])
+def engine_scoreboard(message):
+    if message.from_user.id != config.ADMIN_ID:
+        log_admin_action("unauthorized_access", message.from_user.id, "Tentative d'accès non autorisée à /moteur")
+        bot_admin.reply_to(message, "⛔ Accès refusé.")
+        return
+    lines = ["⚙️ **STRATÉGIES DE TÉLÉCHARGEMENT**\n━━━━━━━━━━━━━━━━━━"]
+    for row in robust_engine.scoreboard():
+        latency = f"{row['latency']} s" if row['latency'] is not None else "—"
+        pause = f" | ⏸️ {row['backoff']} s" if row['backoff'] else ""
+        lines.append(f"• {row['profile']} : {row['successes']} ✅ / {row['failures']} ❌ | "
+                     f"{row['success_rate'] * 100:.0f} % | ⏱️ {latency}{pause}")
+    bot_admin.send_message(message.chat.id, "\n".join(lines), parse_mode="Markdown")
+
+# --- COMMANDE /ACHATS : demandes d'achat en attente ---
+@bot_admin.message_handler(commands=['achats'])
+def purchase_backlog(message):
+    if message.from_user.id != config.ADMIN_ID:
+        log_admin_action("unauthorized_access", message.from_user.id, "Tentative d'accès non autorisée à /achats")
+        bot_admin.reply_to(message, "⛔ Accès refusé.")
+        return
+    counts, oldest = purchase_store.get_store().backlog(limit=10)
+    lines = ["🧾 **DEMANDES D'ACHAT**\n━━━━━━━━━━━━━━━━━━",
+             f"⏳ En attente : {counts[purchase_store.PENDING]} | ✅ Validées : {counts[purchase_store.APPROVED]} "
+             f"| ❌ Refusées : {counts[purchase_store.REJECTED]} | 🗄️ Clôturées : {counts[purchase_store.CLOSED]}"]
+    for purchase in oldest:
+        created = datetime.fromtimestamp(purchase["created_at"]).strftime("%d/%m %H:%M")
+        lines.append(f"• #{purchase['id']} {purchase['user_id']} — pack {purchase['pack']} ({purchase['source']}, {created})")
+    if oldest:
+        lines.append("\nDéjà traitée ailleurs ? /clore <id> la retire sans créditer ni prévenir l'utilisateur.")
+    bot_admin.send_message(message.chat.id, "\n".join(lines))
+
+# --- COMMANDE /CLORE <id> : retirer une demande sans crédit ni message ---
+@bot_admin.message_handler(commands=['clore'])
+def close_purchase(message):
+    if message.from_user.id != config.ADMIN_ID:
+        log_admin_action("unauthorized_access", message.from_user.id, "Tentative d'accès non autorisée à /clore")
+        bot_admin.reply_to(message, "⛔ Accès refusé.")
+        return
+    args = message.text.split()[1:]
+    if not args or not args[0].lstrip("#").isdigit():
+        bot_admin.reply_to(message, "Usage : /clore <id de la demande>")
+        return
+    request_id = int(args[0].lstrip("#"))
+    store = purchase_store.get_store()
+    purchase = store.get(request_id)
+    if purchase is None:
+        bot_admin.reply_to(message, f"❌ Demande #{request_id} introuvable")
+        return
+    if not store.close(request_id, str(message.from_user.id)):
+        bot_admin.reply_to(message, f"ℹ️ Demande #{request_id} déjà traitée ({purchase['status']})")
+        return
+    touch_user_web_notifications(purchase["user_id"])
+    bot_admin.reply_to(message, f"🗄️ Demande #{request_id} clôturée ({purchase['user_id']}, pack {purchase['pack']})")
+    log_admin_action("close_purchase", purchase["user_id"], f"Demande #{request_id} clôturée sans crédit")
+
+def _purchase_request_id(u_id, pack, request_part):
+    """Id de la demande visée par un bouton ; les anciens boutons (sans id) visent la plus ancienne en attente."""
+    if request_part and request_part.isdigit():
+        return int(request_part)
+    return purchase_store.get_store().find_pending(u_id, pack)
+
 # --- GESTION DES ACTIONS ---
 @bot_admin.callback_query_handler(func=lambda call: call.data.startswith(("admin_", "broadcast_")))
 def process_admin_actions(call):
@@ -153,31 +223,14 @@ def process_admin_actions(call):
     url_link = config_data["contact_url"]
 
     if call.data == "broadcast_off":
-        DATA_FILE = "users_data.json"
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-        
-        count = 0
-        for u_id in data.keys():
-            try:
-                target_id = resolve_telegram_id(u_id)
-                if not target_id:
-                    continue
-                markup = types.InlineKeyboardMarkup()
-                markup.add(types.InlineKeyboardButton("💬 REJOINDRE LA DISCUSSION", url=url_link))
-                send_telegram_message(
-                    bot_user,
-                    target_id,
-                    msg_text,
-                    log_context="broadcast_maintenance",
-                    reply_markup=markup,
-                    parse_mode="Markdown"
-                )
-                count += 1
-            except Exception:
-                continue
-        bot_admin.answer_callback_query(call.id, f"✅ Envoyé à {count} personnes")
-        log_admin_action("broadcast", "all", f"{count} utilisateurs notifiés")
+        # Diffusion en tâche de fond : le bot admin reste disponible pendant l'envoi
+        started = broadcast.start_broadcast(bot_user, bot_admin, msg_text, url_link, call.message.chat.id)
+        if started is None:
+            bot_admin.answer_callback_query(call.id, "⏳ Une diffusion est déjà en cours")
+            return
+        broadcast_id, total = started
+        bot_admin.answer_callback_query(call.id, f"📢 Diffusion lancée vers {total} personnes")
+        log_admin_action("broadcast", "all", f"Diffusion #{broadcast_id} lancée vers {total} utilisateurs")
 
     else:
         # SÉCURITÉ : Validation du format de callback_data
@@ -199,7 +252,27 @@ def process_admin_actions(call):
                 return
             pack = parts[2]
             amount = 10 if "10" in pack else 50 if "50" in pack else 100
-            add_credits(u_id, amount)
+            store = purchase_store.get_store()
+            request_id = _purchase_request_id(u_id, pack, parts[3] if len(parts) > 3 else None)
+            if request_id is None:
+                # Ancien bouton sans demande enregistrée : on la crée pour garder la trace
+                request_id = store.create(u_id, pack, "telegram")
+            # Transition conditionnelle : un second clic ne crédite pas deux fois
+            if not store.approve(request_id, str(call.from_user.id)):
+                bot_admin.answer_callback_query(call.id, "ℹ️ Demande déjà traitée")
+                return
+            try:
+                credited = add_credits(u_id, amount)
+            except Exception:
+                store.reopen(request_id)
+                raise
+            if not credited:
+                # Compte crédits introuvable : la demande reste en attente, rien n'est annoncé
+                store.reopen(request_id)
+                bot_admin.answer_callback_query(call.id, f"⚠️ Compte crédits introuvable pour {u_id}, demande remise en attente")
+                log_admin_action("approve_purchase_failed", u_id, f"Compte crédits introuvable (demande #{request_id})")
+                return
+            touch_user_web_notifications(u_id)
             bot_admin.edit_message_text(f"✅ Validé (+{amount}) pour {u_id}", call.message.chat.id, call.message.message_id)
             target_id = resolve_telegram_id(u_id)
             telegram_sent = send_telegram_message(
@@ -233,6 +306,12 @@ def process_admin_actions(call):
             log_admin_action("send_maintenance", u_id, "Notification de maintenance")
         
         elif action == "admin_no":
+            request_id = _purchase_request_id(u_id, None, parts[2] if len(parts) > 2 else None)
+            if request_id is not None:
+                if not purchase_store.get_store().reject(request_id, str(call.from_user.id)):
+                    bot_admin.answer_callback_query(call.id, "ℹ️ Demande déjà traitée")
+                    return
+                touch_user_web_notifications(u_id)
             bot_admin.edit_message_text(f"❌ Refusé pour {u_id}", call.message.chat.id, call.message.message_id)
             target_id = resolve_telegram_id(u_id)
             telegram_sent = send_telegram_message(
@@ -262,4 +341,6 @@ def notify_new_user(user):
     bot_admin.send_message(config.ADMIN_ID, msg, parse_mode="Markdown")
 
 def start_admin_bot_thread():
+    # Reprend une diffusion interrompue par un redémarrage
+    broadcast.resume_broadcasts(bot_user, bot_admin)
     threading.Thread(target=bot_admin.infinity_polling, daemon=True).start()
@@ -12,14 +12,24 @@ import json
 import time
 import re
 from threading import Lock
-from flask import Flask, render_template, request, redirect, session, send_file, url_for, flash, make_response
-from downloader import download_content
-from limiteur import get_user_data, spend_credit, add_credits, save_data, DATA_FILE
+from flask import Flask, render_template, request, redirect, session, send_file, url_for, flash, make_response, Response
+import download_jobs
+from file_streaming import stream_file_response, content_disposition
+import media_cache
+import stream_pipeline
+import quality_ladder
+from video_probe import probe, check_limits, VideoUnavailable
+from rate_limiter import RateLimiter
+from limiteur import get_user_data, spend_credit, add_credits, refund_credit
 import telebot
 import config
 import auth
 from admin import resolve_telegram_id, send_telegram_message
-from web_notifications import get_user_web_notifications, clear_user_web_notifications, delete_single_notification
+import web_notifications
+from web_notifications import (get_user_web_notifications, count_user_web_notifications,
+                               mark_user_web_notifications_read, clear_user_web_notifications,
+                               touch_user_web_notifications)
+import purchase_store
 import email_utils
 from flask import jsonify
 
@@ -37,15 +47,11 @@ app.config.update(
 
 # Thread-safety pour auth et autres écritures
 auth_lock = Lock()
-pending_lock = Lock()
 
 # Bots Telegram (Bot admin reçoit les demandes)
 bot_admin = telebot.TeleBot(config.TOKEN_BOT_ADMIN)
 bot_user = telebot.TeleBot(config.TOKEN_BOT_USER)
 
-# Fichier de log / trace des achats (côté site, lecture locale uniquement)
-PENDING_LOG = "pending_purchases.log"
-
 # === Input validation and sanitization ===
 def sanitize_username(username):
     """Valide le nom d'utilisateur pour éviter les injections."""
@@ -79,45 +85,25 @@ def sanitize_telegram_id(telegram_id):
         return None
     return telegram_id
 
-# === Protection basique — rate limiting en mémoire ===
-# Note : c'est un système simple et volatile (ne persiste pas au redémarrage).
+# === Protection basique — rate limiting par IP (rate_limiter.py) ===
+# Mémoire du processus par défaut ; RATE_LIMIT_BACKEND=sqlite pour partager entre workers.
 RATE_WINDOW_SECONDS = 60
 MAX_REQUESTS_PER_WINDOW = 60      # global per IP
 LOGIN_WINDOW_SECONDS = 60
 MAX_LOGIN_ATTEMPTS_PER_WINDOW = 10
 FAILED_LOGIN_LOCK_SECONDS = 300   # 5 minutes lock handled in auth.py
 
-_requests_by_ip = {}   # ip -> [timestamps]
-_login_attempts = {}   # ip -> [timestamps]
-_requests_lock = Lock()
-
-def _cleanup_timestamps(lst, window):
-    now = int(time.time())
-    return [t for t in lst if now - t < window]
-
-def record_request(ip):
-    with _requests_lock:
-        lst = _requests_by_ip.get(ip, [])
-        lst = _cleanup_timestamps(lst, RATE_WINDOW_SECONDS)
-        lst.append(int(time.time()))
-        _requests_by_ip[ip] = lst
-        return len(lst)
+request_limiter = RateLimiter("ip", MAX_REQUESTS_PER_WINDOW, RATE_WINDOW_SECONDS)
+login_limiter = RateLimiter("login", MAX_LOGIN_ATTEMPTS_PER_WINDOW, LOGIN_WINDOW_SECONDS)
 
 def too_many_requests(ip):
-    n = record_request(ip)
-    return n > MAX_REQUESTS_PER_WINDOW
-
-def record_login_attempt(ip):
-    with _requests_lock:
-        lst = _login_attempts.get(ip, [])
-        lst = _cleanup_timestamps(lst, LOGIN_WINDOW_SECONDS)
-        lst.append(int(time.time()))
-        _login_attempts[ip] = lst
-        return len(lst)
+    return not request_limiter.hit(ip)
 
 def too_many_login_attempts(ip):
-    n = record_login_attempt(ip)
-    return n > MAX_LOGIN_ATTEMPTS_PER_WINDOW
+    return login_limiter.blocked(ip)
+
+def record_login_attempt(ip):
+    login_limiter.hit(ip)
 
 # === Security headers applied to every response ===
 def apply_security_headers(response):
@@ -141,11 +127,6 @@ def get_client_ip():
         return xff.split(",")[0].strip()
     return request.remote_addr or "unknown"
 
-def ensure_pending_log():
-    if not os.path.exists(PENDING_LOG):
-        with open(PENDING_LOG, "w", encoding="utf-8") as f:
-            f.write("")
-
 # === Routes d'auth (inscription / connexion / logout) ===
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -346,52 +327,115 @@ def offline():
     return render_template("offline.html")
 
 # === Notifications API ===
-@app.route('/api/notifications')
-def get_notifications():
-    """API endpoint pour récupérer le nombre de notifications."""
-    if 'user_id' not in session:
-        return jsonify({"count": 0, "notifications": []}), 200
-    
-    user_id = session['user_id']
+def collect_notifications(user_id, limit=None, before=None):
+    """
+    Une page de notifications de `user_id`, de la plus récente à la plus ancienne : achats en
+    attente (première page seulement) puis messages de l'admin plus anciens que l'id `before`.
+    """
     notifications = []
-    
-    # Lire les notifications des achats en attente pour cet utilisateur
-    ensure_pending_log()
-    try:
-        with pending_lock:
-            with open(PENDING_LOG, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            entry = json.loads(line)
-                            if entry.get("user") == user_id:
-                                notifications.append({
-                                    "type": "pending_purchase",
-                                    "message": f"Achat de {entry.get('pack')} crédits en attente",
-                                    "timestamp": entry.get("ts", 0)
-                                })
-                        except json.JSONDecodeError:
-                            continue
-    except Exception:
-        app.logger.exception("Erreur lors de la lecture des notifications depuis le fichier pending_purchases.log")
-    
-    # Lire les notifications web (messages de l'admin)
+    total = unread = 0
+    next_cursor = None
+
+    # Achats en attente de cet utilisateur (table purchase_requests, index par utilisateur)
     try:
-        web_notifs = get_user_web_notifications(user_id)
-        for notif in web_notifs:
+        for purchase in purchase_store.get_store().pending_for_user(user_id):
             notifications.append({
-                "type": notif.get("type", "admin_message"),
-                "message": notif.get("message", ""),
-                "timestamp": notif.get("timestamp", 0)
+                "type": "pending_purchase",
+                "request_id": purchase["id"],
+                "message": f"Achat de {purchase['pack']} crédits en attente",
+                "timestamp": purchase["created_at"],
+                "read": False
             })
+        total = unread = len(notifications)
+        if before:
+            notifications = []   # pages suivantes : messages uniquement
+    except Exception:
+        app.logger.exception("Erreur lors de la lecture des achats en attente")
+
+    # Lire les notifications web (messages de l'admin), page par page (curseur = id)
+    try:
+        limit = limit or config.NOTIFICATION_PAGE_SIZE
+        web_notifs = get_user_web_notifications(user_id, limit, before)
+        notifications.sort(key=lambda x: x.get("timestamp", 0), reverse=True)
+        notifications.extend(web_notifs)
+        web_total, web_unread = count_user_web_notifications(user_id)
+        total += web_total
+        unread += web_unread
+        if len(web_notifs) == limit:
+            next_cursor = web_notifs[-1]["id"]
     except Exception:
         app.logger.exception("Erreur lors de la lecture des notifications web")
-    
-    # Trier par timestamp (plus récent en premier)
-    notifications.sort(key=lambda x: x.get("timestamp", 0), reverse=True)
-    
-    return jsonify({"count": len(notifications), "notifications": notifications}), 200
+
+    return {"count": total, "unread": unread, "notifications": notifications, "next_cursor": next_cursor}
+
+@app.route('/api/notifications')
+def get_notifications():
+    """
+    API endpoint pour récupérer les notifications (repli si le flux SSE est indisponible).
+    Paramètres : `limit`, `before` (curseur `next_cursor` de la page précédente). Réponse 304
+    si l'ETag envoyé dans If-None-Match n'a pas changé.
+    """
+    if 'user_id' not in session:
+        return jsonify({"count": 0, "unread": 0, "notifications": [], "next_cursor": None}), 200
+    limit = min(request.args.get('limit', config.NOTIFICATION_PAGE_SIZE, type=int) or 1, 100)
+    before = request.args.get('before', type=int)
+    response = jsonify(collect_notifications(session['user_id'], max(limit, 1), before))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/notifications/read', methods=['POST'])
+def read_notifications():
+    """Marque les messages comme lus (tous, ou jusqu'à l'id `up_to`)."""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Non authentifié"}), 401
+    up_to = request.args.get('up_to', type=int)
+    mark_user_web_notifications_read(session['user_id'], up_to)
+    return jsonify(dict(collect_notifications(session['user_id']), success=True)), 200
+
+_streams_open = 0
+_streams_lock = Lock()
+
+@app.route('/api/notifications/stream')
+def notifications_stream():
+    """
+    Flux server-sent events : l'état des notifications est poussé à chaque changement.
+    Un flux en attente ne coûte qu'un thread endormi ; au-delà de NOTIFICATION_STREAM_MAX_CLIENTS
+    flux, 503 et le navigateur repasse au polling de /api/notifications.
+    """
+    global _streams_open
+    if 'user_id' not in session:
+        return Response(status=204)   # 204 : EventSource ne se reconnecte pas
+    user_id = session['user_id']
+    with _streams_lock:
+        if _streams_open >= config.NOTIFICATION_STREAM_MAX_CLIENTS:
+            return Response(status=503)
+        _streams_open += 1
+
+    def release_slot():
+        global _streams_open
+        with _streams_lock:
+            _streams_open -= 1
+
+    def events():
+        deadline = time.monotonic() + config.NOTIFICATION_STREAM_SECONDS
+        version = web_notifications.current_version()
+        # Le navigateur se reconnecte seul à la fin du flux (durée bornée)
+        yield f"retry: {config.NOTIFICATION_HEARTBEAT_SECONDS * 1000}\n"
+        yield f"event: notifications\ndata: {json.dumps(collect_notifications(user_id))}\n\n"
+        while time.monotonic() < deadline:
+            changed = web_notifications.wait_for_change(user_id, version, config.NOTIFICATION_HEARTBEAT_SECONDS)
+            if changed is None:
+                yield ": ping\n\n"   # détecte les clients partis
+                continue
+            version = changed
+            yield f"event: notifications\ndata: {json.dumps(collect_notifications(user_id))}\n\n"
+
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Place libérée à la fermeture de la réponse, même si le corps n'est jamais lu (HEAD, client parti)
+    response.call_on_close(release_slot)
+    return response
 
 # === Clear Notifications API ===
 @app.route('/api/notifications/clear', methods=['POST'])
@@ -405,25 +449,10 @@ def clear_notifications():
     # Clear web notifications
     clear_user_web_notifications(user_id)
     
-    # Clear pending purchases for this user from the log
-    ensure_pending_log()
+    # Masquer les achats en attente (la demande reste à traiter côté admin)
     try:
-        with pending_lock:
-            remaining_lines = []
-            with open(PENDING_LOG, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            entry = json.loads(line)
-                            if entry.get("user") != user_id:
-                                remaining_lines.append(line)
-                        except json.JSONDecodeError:
-                            remaining_lines.append(line)
-            
-            with open(PENDING_LOG, "w", encoding="utf-8") as f:
-                for line in remaining_lines:
-                    f.write(line + "\n")
+        if purchase_store.get_store().dismiss_pending(user_id):
+            touch_user_web_notifications(user_id)
     except Exception:
         app.logger.exception("Erreur lors de la suppression des notifications")
         return jsonify({"success": False, "message": "Erreur serveur"}), 500
@@ -458,78 +487,186 @@ def update_theme():
     return jsonify({"success": True, "message": "Thème mis à jour"}), 200
 
 # === Téléchargement ===
+def format_download_info(info):
+    """Met en forme les infos yt-dlp pour l'affichage (durée, vues, taille)."""
+    duration = info.get('duration', 0)
+    duration_str = f"{duration // 60}:{duration % 60:02d}" if duration else "N/A"
+    views = info.get('view_count', 0)
+    views_str = f"{views:,}".replace(',', ' ') if views else "N/A"
+    filesize = info.get('filesize', 0)
+    if filesize:
+        if filesize > 1024 * 1024:
+            filesize_str = f"{filesize / (1024 * 1024):.1f} MB"
+        else:
+            filesize_str = f"{filesize / 1024:.1f} KB"
+    else:
+        filesize_str = None
+
+    return {
+        'title': info.get('title', 'Unknown'),
+        'uploader': info.get('uploader', 'Unknown'),
+        'duration_str': duration_str,
+        'views_str': views_str,
+        'resolution': info.get('resolution', None),
+        'filesize_str': filesize_str,
+    }
+
+# Paliers proposés dans le formulaire : [(mode, palier, libellé)]
+QUALITY_CHOICES = [(mode, q, quality_ladder.LABELS[q]) for mode, tiers in quality_ladder.TIERS.items() for q in tiers]
+
+def preflight(url, mode, quality):
+    """
+    Analyse la vidéo (métadonnées en cache) avant tout débit. Retourne (message de refus
+    ou None, palier retenu) ; un palier absent ou invalide devient le palier par défaut.
+    """
+    try:
+        meta = probe(url)
+    except VideoUnavailable:
+        return "Vidéo indisponible (privée, supprimée ou introuvable).", quality
+    except Exception:
+        app.logger.exception("Analyse préalable impossible")
+        meta = None  # Le téléchargement décidera
+    if not quality_ladder.is_valid(mode, quality):
+        quality = quality_ladder.default_quality(mode, meta['sizes'] if meta else None)
+    return (check_limits(meta, mode, quality) if meta else None), quality
+
 @app.route('/download', methods=['GET', 'POST'])
 def download_page():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
     msg = None
-    download_info = None
+    job_id = None
     if request.method == 'POST':
         user_id = session['user_id']
         url = request.form.get('url', '').strip()
-        mode = request.form.get('mode', 'mp3')
+        mode = request.form.get('mode', 'audio')
+        quality = request.form.get('quality', '')
         
         # SÉCURITÉ : Validation de l'URL
         url = sanitize_url(url)
         if not url:
             msg = "URL YouTube invalide ou manquante"
-        elif mode not in ['mp3', 'mp4']:
+        elif mode not in quality_ladder.TIERS:
             msg = "Mode de téléchargement invalide"
         else:
-            if not spend_credit(user_id):
+            error, quality = preflight(url, mode, quality)
+            if error:
+                msg = f"🚫 {error}"
+            elif not spend_credit(user_id):
                 msg = "🔒 Crédits insuffisants. Achetez-en dans la boutique."
             else:
-                try:
-                    file_path, info = download_content(url, mode)
-                    
-                    # Format download info for display
-                    duration = info.get('duration', 0)
-                    duration_str = f"{duration // 60}:{duration % 60:02d}" if duration else "N/A"
-                    views = info.get('view_count', 0)
-                    views_str = f"{views:,}".replace(',', ' ') if views else "N/A"
-                    filesize = info.get('filesize', 0)
-                    if filesize:
-                        if filesize > 1024 * 1024:
-                            filesize_str = f"{filesize / (1024 * 1024):.1f} MB"
-                        else:
-                            filesize_str = f"{filesize / 1024:.1f} KB"
-                    else:
-                        filesize_str = None
-                    
-                    download_info = {
-                        'title': info.get('title', 'Unknown'),
-                        'uploader': info.get('uploader', 'Unknown'),
-                        'duration_str': duration_str,
-                        'views_str': views_str,
-                        'resolution': info.get('resolution', None),
-                        'filesize_str': filesize_str,
-                    }
-                    
-                    # send_file will stream the file to client
-                    response = make_response(send_file(file_path, as_attachment=True))
-                    # cleanup local file after sending (attempt)
-                    try:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                    except Exception:
-                        app.logger.exception("Erreur suppression fichier local après envoi")
-                    return response
-                except Exception as e:
+                def rollback_credit(exc, user_id=user_id):
                     # rollback crédit en cas d'erreur
                     try:
-                        data = {}
-                        if os.path.exists(DATA_FILE):
-                            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                                data = json.load(f)
-                        uid = str(user_id)
-                        if uid in data:
-                            data[uid]['credits'] = data[uid].get('credits', 0) + 1
-                            save_data(data)
+                        refund_credit(user_id)
                     except Exception:
                         app.logger.exception("Erreur rollback crédit")
-                    msg = f"Erreur téléchargement : {e}"
-    return render_template("download.html", msg=msg, download_info=download_info)
+
+                try:
+                    # Le téléchargement tourne dans le pool de workers, la page suit sa progression
+                    job_id = download_jobs.submit(user_id, url, mode, quality, on_error=rollback_credit,
+                                                  paid=True)
+                except download_jobs.QueueFullError as e:
+                    rollback_credit(e)
+                    msg = str(e)
+    return render_template("download.html", msg=msg, job_id=job_id,
+                           direct_delivery=config.STREAM_PIPELINE_ENABLED, qualities=QUALITY_CHOICES)
+
+@app.route('/download/stream', methods=['POST'])
+def download_stream():
+    """Envoi direct : le fichier part vers le navigateur pendant le téléchargement."""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    user_id = session['user_id']
+    url = sanitize_url(request.form.get('url', '').strip())
+    mode = request.form.get('mode', 'audio')
+    if not config.STREAM_PIPELINE_ENABLED or not url or mode not in quality_ladder.TIERS:
+        return download_page()  # Requête invalide ou envoi direct désactivé : parcours classique (job)
+
+    error, quality = preflight(url, mode, request.form.get('quality', ''))
+    if media_cache.contains(media_cache.extract_video_id(url), mode, quality):
+        return download_page()  # Déjà en cache : le job le sert immédiatement (avec reprise possible)
+    if error:
+        return render_template("download.html", msg=f"🚫 {error}", direct_delivery=True, qualities=QUALITY_CHOICES)
+    if not spend_credit(user_id):
+        return render_template("download.html", msg="🔒 Crédits insuffisants. Achetez-en dans la boutique.",
+                               direct_delivery=True, qualities=QUALITY_CHOICES)
+
+    def rollback_credit(exc, user_id=user_id):
+        try:
+            refund_credit(user_id, details="Échec envoi direct")
+        except Exception:
+            app.logger.exception("Erreur rollback crédit")
+
+    try:
+        stream = stream_pipeline.open_stream(url, mode, on_error=rollback_credit, quality=quality)
+    except stream_pipeline.PipelineUnavailable:
+        # Pas de format relayable tel quel (ex : DASH uniquement) : téléchargement complet
+        refund_credit(user_id, details="Envoi direct indisponible")
+        return download_page()
+    except Exception as e:
+        rollback_credit(e)
+        return render_template("download.html", msg=f"Erreur téléchargement : {e}", direct_delivery=True,
+                               qualities=QUALITY_CHOICES)
+
+    headers = {"Content-Disposition": content_disposition(stream.filename), "Accept-Ranges": "none",
+               "X-Accel-Buffering": "no"}
+    if stream.length:
+        headers["Content-Length"] = str(stream.length)
+    response = Response(iter(stream), headers=headers, mimetype=stream.mimetype, direct_passthrough=True)
+    # Source coupée (et place ffmpeg rendue) même si le corps n'est jamais lu
+    response.call_on_close(stream.close)
+    return response
+
+@app.route('/api/download/<job_id>')
+def download_status(job_id):
+    """État d'un job de téléchargement (statut, progression, infos)."""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Non authentifié"}), 401
+
+    job = download_jobs.get_job(job_id, session['user_id'])
+    if not job:
+        return jsonify({"success": False, "message": "Téléchargement introuvable"}), 404
+
+    payload = {
+        "success": True,
+        "status": job["status"],
+        "progress": job["progress"],
+        "error": f"Erreur téléchargement : {job['error']}" if job["error"] else None,
+        "download_info": None,
+        "file_url": None,
+    }
+    if job["status"] == download_jobs.DONE:
+        payload["download_info"] = format_download_info(job["info"])
+        payload["file_url"] = url_for('download_file', job_id=job_id)
+    return jsonify(payload), 200
+
+@app.route('/download/<job_id>/file')
+def download_file(job_id):
+    """Envoie le fichier d'un job terminé en flux (reprise possible via Range), puis libère le job."""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    job = download_jobs.get_job(job_id, session['user_id'])
+    if not job or job["status"] != download_jobs.DONE:
+        flash("Téléchargement introuvable ou pas encore terminé.", "danger")
+        return redirect(url_for('download_page'))
+
+    def on_complete():
+        # Le fichier n'est libéré qu'une fois envoyé en entier ; un envoi coupé peut
+        # reprendre (Range) jusqu'à l'expiration du job (JOB_TTL_SECONDS).
+        try:
+            download_jobs.release(job_id)
+        except Exception:
+            app.logger.exception("Erreur suppression fichier local après envoi")
+
+    try:
+        return stream_file_response(job["file_path"], on_complete=on_complete)
+    except FileNotFoundError:
+        flash("Le fichier n'est plus disponible, relancez le téléchargement.", "danger")
+        return redirect(url_for('download_page'))
 
 # === Boutique web ===
 @app.route('/shop', methods=['GET', 'POST'])
@@ -546,16 +683,14 @@ def shop():
             flash("Pack invalide", "danger")
             return redirect(url_for('shop'))
 
-        # Journal local pour suivi (non exposé en interface admin)
-        ensure_pending_log()
-        with pending_lock:
-            with open(PENDING_LOG, "a", encoding="utf-8") as f:
-                f.write(json.dumps({"user": user_id, "pack": pack, "ts": int(time.time())}) + "\n")
+        # Demande enregistrée en attente ; son id voyage dans les boutons de l'admin
+        request_id = purchase_store.get_store().create(user_id, pack, "web")
+        touch_user_web_notifications(user_id)
 
         # Notifier exclusivement le Bot Admin (Telegram) — l'admin traitera sur Telegram
         markup = telebot.types.InlineKeyboardMarkup()
-        btn_ok = telebot.types.InlineKeyboardButton("✅ ACCEPTER", callback_data=f"admin_ok|{user_id}|{pack}")
-        btn_no = telebot.types.InlineKeyboardButton("❌ REFUSER", callback_data=f"admin_no|{user_id}")
+        btn_ok = telebot.types.InlineKeyboardButton("✅ ACCEPTER", callback_data=f"admin_ok|{user_id}|{pack}|{request_id}")
+        btn_no = telebot.types.InlineKeyboardButton("❌ REFUSER", callback_data=f"admin_no|{user_id}|{request_id}")
         markup.row(btn_ok, btn_no)
         admin_text = (
             "🔔 **NOUVELLE DEMANDE D'ACHAT (WEB)**\n"
@@ -1,11 +1,10 @@
 import json
-import os
 import time
 import re
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+from account_store import get_store
 
-AUTH_FILE = "auth_data.json"
 # Politique de sécurité
 MAX_FAILED = 5            # nombre de tentatives avant lock
 LOCK_SECONDS = 5 * 60     # durée du lock en secondes (ici 5 minutes)
@@ -28,27 +27,20 @@ def log_suspicious_activity(event_type, username, ip, details=""):
     except Exception:
         pass  # Ne pas bloquer sur erreur de log
 
-def load_auth_data():
-    if not os.path.exists(AUTH_FILE):
-        return {"users": {}, "ip_map": {}}
-    with open(AUTH_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_auth_data(data):
-    with open(AUTH_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-
 def user_exists(username):
-    data = load_auth_data()
-    return username in data.get("users", {})
+    return get_store().exists(username)
 
 def get_user(username):
-    data = load_auth_data()
-    return data.get("users", {}).get(username)
+    return get_store().get(username)
 
 def get_user_by_ip(ip):
-    data = load_auth_data()
-    return data.get("ip_map", {}).get(ip)
+    return get_store().username_by_ip(ip)
+
+def get_username_by_telegram_id(telegram_id):
+    return get_store().username_by_telegram_id(telegram_id)
+
+def get_telegram_ids_by_username():
+    return get_store().telegram_ids_by_username()
 
 def current_timestamp():
     return int(time.time())
@@ -59,25 +51,9 @@ def create_user(username, password, ip, telegram_id=None, email=None):
     Retourne (True, "") si ok, (False, "raison") si erreur.
     """
     username = str(username)
-    data = load_auth_data()
-    if username in data.get("users", {}):
-        log_suspicious_activity("duplicate_username", username, ip, "Tentative de création avec nom existant")
-        return False, "Nom d'utilisateur déjà utilisé."
-    
-    # Check if email already exists
-    if email:
-        for user, info in data.get("users", {}).items():
-            if info.get("email") == email:
-                log_suspicious_activity("duplicate_email", username, ip, "Tentative de création avec email existant")
-                return False, "Cette adresse email est déjà utilisée."
-    
-    existing = data.get("ip_map", {}).get(ip)
-    if existing:
-        log_suspicious_activity("multi_account", username, ip, f"IP déjà utilisée par {existing}")
-        return False, "Un compte existe déjà depuis cette IP."
     pwd_hash = generate_password_hash(password)
     now = datetime.utcnow().isoformat() + "Z"
-    data.setdefault("users", {})[username] = {
+    record = {
         "password_hash": pwd_hash,
         "created_at": now,
         "telegram_id": telegram_id or "",
@@ -87,9 +63,19 @@ def create_user(username, password, ip, telegram_id=None, email=None):
         "locked_until": 0,
         "last_ip": ip
     }
-    data.setdefault("ip_map", {})[ip] = username
-    save_auth_data(data)
-    return True, ""
+    # Unicité username / email / IP vérifiée par le store dans une seule transaction
+    ok, conflict = get_store().create(username, record, ip)
+    if ok:
+        return True, ""
+    if conflict == "username":
+        log_suspicious_activity("duplicate_username", username, ip, "Tentative de création avec nom existant")
+        return False, "Nom d'utilisateur déjà utilisé."
+    if conflict == "email":
+        log_suspicious_activity("duplicate_email", username, ip, "Tentative de création avec email existant")
+        return False, "Cette adresse email est déjà utilisée."
+    existing = get_store().username_by_ip(ip)
+    log_suspicious_activity("multi_account", username, ip, f"IP déjà utilisée par {existing}")
+    return False, "Un compte existe déjà depuis cette IP."
 
 def authenticate_user(username, password):
     """
@@ -97,8 +83,7 @@ def authenticate_user(username, password):
     Retourne (True, "") ou (False, "raison").
     Gère le comptage d'échecs et le verrouillage temporaire.
     """
-    data = load_auth_data()
-    user = data.get("users", {}).get(username)
+    user = get_store().get(username)
     if not user:
         log_suspicious_activity("unknown_user", username, "unknown", "Tentative avec utilisateur inexistant")
         return False, "Utilisateur inconnu."
@@ -115,9 +100,8 @@ def authenticate_user(username, password):
 
     if check_password_hash(user.get("password_hash", ""), password):
         # succès : reset counters
-        user["failed_attempts"] = 0
-        user["locked_until"] = 0
-        save_auth_data(data)
+        if user.get("failed_attempts") or user.get("locked_until"):
+            get_store().update(username, failed_attempts=0, locked_until=0)
         return True, ""
     else:
         # échec : incrémenter et éventuellement verrouiller
@@ -128,34 +112,19 @@ def authenticate_user(username, password):
             log_suspicious_activity("account_locked", username, "unknown", f"Compte verrouillé après {MAX_FAILED} tentatives")
         else:
             log_suspicious_activity("failed_login", username, "unknown", f"Tentative {user['failed_attempts']}/{MAX_FAILED}")
-        save_auth_data(data)
+        get_store().update(username, failed_attempts=user["failed_attempts"], locked_until=user.get("locked_until", 0))
         attempts_left = max(0, MAX_FAILED - user.get("failed_attempts", 0))
         return False, f"Mot de passe incorrect. Tentatives restantes avant lock : {attempts_left}"
 
 def link_telegram_id(username, telegram_id):
-    data = load_auth_data()
-    if username not in data.get("users", {}):
-        return False
-    data["users"][username]["telegram_id"] = str(telegram_id)
-    save_auth_data(data)
-    return True
+    return get_store().update(username, telegram_id=str(telegram_id))
 
 def unregister_ip(ip):
-    data = load_auth_data()
-    if ip in data.get("ip_map", {}):
-        del data["ip_map"][ip]
-        save_auth_data(data)
-        return True
-    return False
+    return get_store().delete_ip(ip)
 
 def verify_user_email(username):
     """Mark user's email as verified."""
-    data = load_auth_data()
-    if username not in data.get("users", {}):
-        return False
-    data["users"][username]["email_verified"] = True
-    save_auth_data(data)
-    return True
+    return get_store().update(username, email_verified=True)
 
 def get_user_email(username):
     """Get user's email address."""
@@ -1,5 +1,7 @@
 import telebot
 import config # Indispensable pour utiliser tes tokens centralisés
+import purchase_store
+import telegram_dispatcher
 from telebot import types
 
 # On initialise le Bot 2 (Admin) ici pour envoyer les alertes
@@ -21,7 +23,8 @@ def show_shop_menu(bot, chat_id):
         "Boostez votre compte pour télécharger sans limites !\n\n"
         "💡 **Choisissez un pack ci-dessous :**"
     )
-    bot.send_message(chat_id, text, reply_markup=markup, parse_mode="Markdown")
+    telegram_dispatcher.call(bot, "send_message", chat_id, text, target_chat=chat_id,
+                             reply_markup=markup, parse_mode="Markdown")
 
 def register_boutique_handlers(bot):
     """Gère le clic sur un pack et envoie l'alerte au Bot 2."""
@@ -40,17 +43,19 @@ def register_boutique_handlers(bot):
         
         # 1. Message d'attente pour l'utilisateur sur le Bot 1
         bot.answer_callback_query(call.id)
-        bot.edit_message_text(
+        telegram_dispatcher.call(
+            bot, "edit_message_text", target_chat=call.message.chat.id,
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text=f"⏳ **Demande pour le Pack {pack_name} envoyée.**\n\n_Veuillez patienter, un administrateur vérifie votre compte..._",
             parse_mode="Markdown"
         )
 
-        # 2. Boutons de validation pour l'Admin (Bot 2)
+        # 2. Demande enregistrée en attente, boutons de validation pour l'Admin (Bot 2)
+        request_id = purchase_store.get_store().create(user.id, pack_name, "telegram")
         markup_admin = types.InlineKeyboardMarkup()
-        btn_ok = types.InlineKeyboardButton("✅ ACCEPTER", callback_data=f"admin_ok|{user.id}|{pack_name}")
-        btn_no = types.InlineKeyboardButton("❌ REFUSER", callback_data=f"admin_no|{user.id}")
+        btn_ok = types.InlineKeyboardButton("✅ ACCEPTER", callback_data=f"admin_ok|{user.id}|{pack_name}|{request_id}")
+        btn_no = types.InlineKeyboardButton("❌ REFUSER", callback_data=f"admin_no|{user.id}|{request_id}")
         markup_admin.add(btn_ok, btn_no)
 
         # 3. Message clair pour l'Admin sur le Bot 2
@@ -0,0 +1,192 @@
+"""
+broadcast.py — Diffusion de masse (message de maintenance) en tâche de fond.
+
+Les destinataires sont résolus en une seule passe puis enregistrés dans SQLite ;
+chaque envoi passe par telegram_dispatcher (file "bulk", limites respectées) et son
+statut est sauvegardé au fil de l'eau. Une diffusion interrompue (crash, redémarrage)
+reprend là où elle s'était arrêtée via `resume_broadcasts` ; une erreur inattendue
+la passe en 'failed' pour ne pas bloquer les suivantes.
+"""
+import threading
+import time
+
+from telebot import types
+
+import auth
+import db
+import telegram_dispatcher
+from limiteur import list_user_ids
+
+BATCH_SIZE = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    text        TEXT NOT NULL,
+    contact_url TEXT,
+    report_chat TEXT,
+    status      TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS broadcast_targets (
+    broadcast_id INTEGER NOT NULL,
+    telegram_id  TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    PRIMARY KEY (broadcast_id, telegram_id)
+);
+CREATE INDEX IF NOT EXISTS idx_broadcast_targets_status ON broadcast_targets(broadcast_id, status);
+"""
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def resolve_targets():
+    """
+    Identifiants Telegram uniques de tous les utilisateurs (comptes web résolus en une requête).
+    Un compte web sans Telegram lié est ignoré, même si son nom est numérique.
+    """
+    accounts = auth.get_telegram_ids_by_username()
+    targets = []
+    seen = set()
+    for u_id in list_user_ids():
+        u_id = str(u_id).strip()
+        telegram_id = str(accounts[u_id] or "").strip() if u_id in accounts else u_id
+        if telegram_id.isdigit() and telegram_id not in seen:
+            seen.add(telegram_id)
+            targets.append(telegram_id)
+    return targets
+
+
+def running_broadcast_id():
+    """Identifiant de la diffusion en cours, ou None."""
+    db.ensure_schema("broadcasts", SCHEMA)
+    row = db.get_connection().execute(
+        "SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id LIMIT 1"
+    ).fetchone()
+    return row["id"] if row else None
+
+
+def start_broadcast(bot, report_bot, text, contact_url, report_chat):
+    """
+    Crée une diffusion, enregistre ses destinataires et la lance en arrière-plan.
+    Retourne (id, nb), ou None si une diffusion est déjà en cours (vérifié dans la
+    transaction d'insertion : un double clic n'en lance qu'une).
+    """
+    db.ensure_schema("broadcasts", SCHEMA)
+    targets = resolve_targets()
+    with db.transaction() as conn:
+        if conn.execute("SELECT 1 FROM broadcasts WHERE status = 'running' LIMIT 1").fetchone():
+            return None
+        cur = conn.execute(
+            "INSERT INTO broadcasts (text, contact_url, report_chat, status, created_at) VALUES (?, ?, ?, 'running', ?)",
+            (text, contact_url, str(report_chat), time.time())
+        )
+        broadcast_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO broadcast_targets (broadcast_id, telegram_id) VALUES (?, ?)",
+            [(broadcast_id, telegram_id) for telegram_id in targets]
+        )
+    _launch(bot, report_bot, broadcast_id)
+    return broadcast_id, len(targets)
+
+
+def resume_broadcasts(bot, report_bot):
+    """Relance les diffusions restées 'running' (ex : après un redémarrage)."""
+    db.ensure_schema("broadcasts", SCHEMA)
+    rows = db.get_connection().execute("SELECT id FROM broadcasts WHERE status = 'running'").fetchall()
+    for row in rows:
+        _launch(bot, report_bot, row["id"])
+    return len(rows)
+
+
+def _launch(bot, report_bot, broadcast_id):
+    with _running_lock:
+        if broadcast_id in _running:
+            return
+        _running.add(broadcast_id)
+    threading.Thread(target=_run, args=(bot, report_bot, broadcast_id), daemon=True,
+                     name=f"broadcast-{broadcast_id}").start()
+
+
+def _counts(conn, broadcast_id):
+    rows = conn.execute(
+        "SELECT status, COUNT(*) AS n FROM broadcast_targets WHERE broadcast_id = ? GROUP BY status",
+        (broadcast_id,)
+    ).fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+
+def _mark_failed(broadcast_id):
+    try:
+        with db.transaction() as tx:
+            tx.execute("UPDATE broadcasts SET status = 'failed', finished_at = ? WHERE id = ? AND status = 'running'",
+                       (time.time(), broadcast_id))
+    except Exception as e:
+        print(f"❌ Diffusion #{broadcast_id} : statut 'failed' non enregistré : {e}")
+
+
+def _run(bot, report_bot, broadcast_id):
+    broadcast = None
+    try:
+        conn = db.get_connection()
+        broadcast = conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        while True:
+            batch = [row["telegram_id"] for row in conn.execute(
+                "SELECT telegram_id FROM broadcast_targets WHERE broadcast_id = ? AND status = 'pending' LIMIT ?",
+                (broadcast_id, BATCH_SIZE)
+            )]
+            if not batch:
+                break
+            futures = []
+            for telegram_id in batch:
+                markup = types.InlineKeyboardMarkup()
+                if broadcast["contact_url"]:
+                    markup.add(types.InlineKeyboardButton("💬 REJOINDRE LA DISCUSSION", url=broadcast["contact_url"]))
+                futures.append((telegram_id, telegram_dispatcher.submit(
+                    bot, "send_message", telegram_id, broadcast["text"],
+                    target_chat=telegram_id, priority=telegram_dispatcher.BULK,
+                    reply_markup=markup, parse_mode="Markdown"
+                )))
+            results = []
+            for telegram_id, future in futures:
+                try:
+                    future.result()
+                    results.append(("sent", broadcast_id, telegram_id))
+                except Exception:
+                    results.append(("failed", broadcast_id, telegram_id))
+            # Point de reprise : le lot est marqué avant de passer au suivant
+            with db.transaction() as tx:
+                tx.executemany(
+                    "UPDATE broadcast_targets SET status = ? WHERE broadcast_id = ? AND telegram_id = ?", results
+                )
+
+        with db.transaction() as tx:
+            tx.execute("UPDATE broadcasts SET status = 'done', finished_at = ? WHERE id = ?",
+                       (time.time(), broadcast_id))
+            counts = _counts(tx, broadcast_id)
+        if broadcast["report_chat"]:
+            telegram_dispatcher.submit(
+                report_bot, "send_message", broadcast["report_chat"],
+                f"✅ Diffusion #{broadcast_id} terminée : {counts.get('sent', 0)} envoyés, "
+                f"{counts.get('failed', 0)} échecs.",
+                target_chat=broadcast["report_chat"], priority=telegram_dispatcher.HIGH
+            )
+    except Exception as e:
+        # Ne pas laisser la ligne en 'running' : elle bloquerait toute nouvelle diffusion
+        # et serait relancée (puis planterait de nouveau) à chaque démarrage
+        print(f"❌ Diffusion #{broadcast_id} interrompue : {e}")
+        _mark_failed(broadcast_id)
+        if broadcast is not None and broadcast["report_chat"]:
+            try:
+                telegram_dispatcher.submit(
+                    report_bot, "send_message", broadcast["report_chat"],
+                    f"❌ Diffusion #{broadcast_id} interrompue : {e}",
+                    target_chat=broadcast["report_chat"], priority=telegram_dispatcher.HIGH
+                )
+            except Exception:
+                pass
+    finally:
+        with _running_lock:
+            _running.discard(broadcast_id)
@@ -41,4 +41,84 @@ ADMIN_ID = int(get_required_env("ADMIN_ID", "5732047363"))
 MAIL_SERVER = os.getenv("MAIL_SERVER", 'smtp.gmail.com')
 MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))  # Correction : 587 est le port SMTP correct avec TLS
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")  # None si non configuré
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")  # None si non configuré
\ No newline at end of file
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")  # None si non configuré
+
+# Stockage des données (SQLite en mode WAL par défaut)
+DB_FILE = os.getenv("DB_FILE", "genius.db")
+CREDIT_BACKEND = os.getenv("CREDIT_BACKEND", "sqlite")  # "sqlite" ou "json" (ancien format)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" (par processus) ou "sqlite" (partagé)
+OTP_BACKEND = os.getenv("OTP_BACKEND", "memory")                # codes email : "memory" ou "sqlite" (partagé)
+OTP_SWEEP_INTERVAL = int(os.getenv("OTP_SWEEP_INTERVAL", "60"))  # s entre deux purges des codes expirés
+
+# Téléchargements web asynchrones
+WEB_DOWNLOAD_WORKERS = int(os.getenv("WEB_DOWNLOAD_WORKERS", "4"))  # téléchargements simultanés côté site
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "200"))        # jobs en attente/en cours max
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "1800"))          # durée de conservation d'un job terminé
+
+# File d'attente du bot Telegram
+BOT_DOWNLOAD_SLOTS = int(os.getenv("BOT_DOWNLOAD_SLOTS", "3"))          # téléchargements simultanés
+MAX_DOWNLOADS_PER_USER = int(os.getenv("MAX_DOWNLOADS_PER_USER", "1"))  # en parallèle par utilisateur
+
+# Cache des médias téléchargés (partagé site + bot)
+MEDIA_CACHE_ENABLED = os.getenv("MEDIA_CACHE_ENABLED", "1") == "1"
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_MB", "2048")) * 1024 * 1024
+MEDIA_CACHE_TTL_SECONDS = int(os.getenv("MEDIA_CACHE_TTL_HOURS", "168")) * 3600
+
+# Progression des téléchargements (secondes minimum entre deux mises à jour)
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "3"))   # éditions Telegram
+WEB_PROGRESS_INTERVAL = float(os.getenv("WEB_PROGRESS_INTERVAL", "1"))     # jobs web
+
+# Envoi des fichiers au navigateur (taille des blocs lus puis envoyés, en Ko)
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_KB", "256")) * 1024
+# Envoi direct (le fichier part pendant le téléchargement) proposé sur le site
+STREAM_PIPELINE_ENABLED = os.getenv("STREAM_PIPELINE_ENABLED", "true").lower() == "true"
+
+# Analyse préalable des vidéos (avant débit du crédit) ; 0 = pas de limite
+VIDEO_INFO_CACHE_SIZE = int(os.getenv("VIDEO_INFO_CACHE_SIZE", "1000"))      # vidéos gardées en mémoire
+VIDEO_INFO_TTL_SECONDS = int(os.getenv("VIDEO_INFO_TTL_SECONDS", "1800"))
+MAX_VIDEO_DURATION = int(os.getenv("MAX_VIDEO_DURATION_MINUTES", "180")) * 60
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_MB", "2000")) * 1024 * 1024
+# Taille max d'un envoi Telegram direct (au-delà : découpage ZIP) ; sert aussi au choix du palier
+TELEGRAM_UPLOAD_LIMIT = int(os.getenv("TELEGRAM_UPLOAD_LIMIT_MB", "45")) * 1024 * 1024
+
+# Réserve d'instances yt-dlp réutilisées entre les téléchargements
+YDL_POOL_SIZE = int(os.getenv("YDL_POOL_SIZE", "4"))                  # instances libres gardées par profil
+YDL_POOL_MAX_USES = int(os.getenv("YDL_POOL_MAX_USES", "50"))         # recyclage après N téléchargements
+YDL_POOL_MAX_AGE = int(os.getenv("YDL_POOL_MAX_AGE_SECONDS", "1800")) # ... ou après cette durée
+
+# Conversion audio (ffmpeg) : processus simultanés max et priorité CPU (nice, 0 = normale)
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", str(os.cpu_count() or 2)))
+TRANSCODE_NICENESS = int(os.getenv("TRANSCODE_NICENESS", "10"))
+
+# Débit des téléchargements : connexions parallèles par job, budget par hôte (0 = illimité)
+DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", "4"))
+HOST_CONNECTION_BUDGET = int(os.getenv("HOST_CONNECTION_BUDGET", "16"))
+HTTP_CHUNK_SIZE = int(os.getenv("HTTP_CHUNK_MB", "10")) * 1024 * 1024   # 0 = une seule requête
+EXTERNAL_DOWNLOADER = os.getenv("EXTERNAL_DOWNLOADER", "")                 # ex : aria2c
+
+# Stratégies de contournement (robust_engine) : échec rapide puis profil suivant
+STRATEGY_SOCKET_TIMEOUT = int(os.getenv("STRATEGY_SOCKET_TIMEOUT", "20"))   # secondes
+STRATEGY_RETRIES = int(os.getenv("STRATEGY_RETRIES", "3"))                  # reprises yt-dlp par essai
+STRATEGY_MAX_ATTEMPTS = max(1, int(os.getenv("STRATEGY_MAX_ATTEMPTS", "3")))  # profils essayés par job (≥ 1)
+STRATEGY_BACKOFF_BASE = int(os.getenv("STRATEGY_BACKOFF_BASE", "30"))       # mise à l'écart après échec (doublée)
+STRATEGY_BACKOFF_MAX = int(os.getenv("STRATEGY_BACKOFF_MAX", "1800"))
+STRATEGY_REFERENCE_LATENCY = float(os.getenv("STRATEGY_REFERENCE_LATENCY", "3"))  # latence "normale" (s)
+
+# Envois sortants vers l'API Telegram (limites par bot)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # messages/seconde, tous chats confondus
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))       # messages/seconde par chat
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))       # rafale tolérée par chat
+TELEGRAM_SEND_WORKERS = int(os.getenv("TELEGRAM_SEND_WORKERS", "4"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))     # nouvelles tentatives après un 429
+
+# Notifications web poussées en direct (server-sent events), polling en repli
+NOTIFICATION_STREAM_MAX_CLIENTS = int(os.getenv("NOTIFICATION_STREAM_MAX_CLIENTS", "100"))  # flux ouverts max
+NOTIFICATION_STREAM_SECONDS = int(os.getenv("NOTIFICATION_STREAM_SECONDS", "600"))          # durée d'un flux avant reconnexion
+NOTIFICATION_HEARTBEAT_SECONDS = int(os.getenv("NOTIFICATION_HEARTBEAT_SECONDS", "25"))
+NOTIFICATION_WATCH_INTERVAL = float(os.getenv("NOTIFICATION_WATCH_INTERVAL", "2"))          # s, changements venus des bots
+
+# Stockage des notifications web (SQLite, par utilisateur)
+NOTIFICATION_PAGE_SIZE = int(os.getenv("NOTIFICATION_PAGE_SIZE", "20"))          # notifications par page (API)
+NOTIFICATION_MAX_PER_USER = int(os.getenv("NOTIFICATION_MAX_PER_USER", "200"))   # les plus anciennes sont supprimées
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
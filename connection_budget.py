@@ -0,0 +1,65 @@
+"""
+connection_budget.py — Budget de connexions simultanées par hôte, partagé par tous les jobs.
+
+Chaque téléchargement demande N connexions (fragments parallèles ou connexions du
+téléchargeur externe) et reçoit sa part du budget de l'hôte : au plus ce qui reste
+libre et au plus budget / (jobs en cours + 1), mais toujours au moins une. Un job
+n'attend jamais : budget épuisé, il part avec une seule connexion. Le parallélisme
+accélère un job isolé sans que la somme des jobs ne déclenche le bridage côté YouTube.
+
+La clé est l'hôte de la page (youtube.com), connu avant l'extraction, et non celui
+des serveurs média (*.googlevideo.com) que contactent réellement les connexions :
+toutes les pages d'un même site partagent ainsi un budget, ce qui revient au même
+tant qu'un site sert ses médias depuis un seul ensemble de serveurs.
+"""
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import config
+
+# Domaines servis par les mêmes serveurs média
+HOST_ALIASES = {"youtu.be": "youtube.com", "music.youtube.com": "youtube.com"}
+
+_in_use = {}   # hôte -> connexions accordées
+_jobs = {}     # hôte -> jobs en cours
+_lock = threading.Lock()
+
+
+def host_key(url):
+    """Hôte normalisé d'une URL (sans www./m.), regroupé par alias."""
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return HOST_ALIASES.get(host, host)
+
+
+@contextmanager
+def reserve(url, wanted):
+    """
+    Réserve jusqu'à `wanted` connexions vers l'hôte de `url` pour la durée du bloc
+    et fournit le nombre accordé :
+        with connection_budget.reserve(url, 4) as connections: ...
+    """
+    host = host_key(url)
+    budget = config.HOST_CONNECTION_BUDGET
+    with _lock:
+        used, jobs = _in_use.get(host, 0), _jobs.get(host, 0)
+        granted = max(1, min(wanted, budget - used, budget // (jobs + 1))) if budget else wanted
+        _in_use[host] = used + granted
+        _jobs[host] = jobs + 1
+    try:
+        yield granted
+    finally:
+        with _lock:
+            _in_use[host] -= granted
+            _jobs[host] -= 1
+            if not _jobs[host]:
+                del _in_use[host], _jobs[host]
+
+
+def in_use():
+    """Connexions accordées par hôte."""
+    with _lock:
+        return dict(_in_use)
@@ -0,0 +1,269 @@
+"""
+credit_store.py — Moteurs de stockage des crédits utilisés par limiteur.py.
+
+- SQLiteCreditStore (défaut) : une ligne par utilisateur, débit/crédit atomiques
+  et journal des transactions écrit dans la même transaction.
+- JSONCreditStore : ancien format `users_data.json` (réécriture complète du fichier),
+  conservé pour compatibilité (CREDIT_BACKEND=json).
+
+Migration unique depuis l'ancien format :
+    python credit_store.py
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+import config
+import db
+
+DATA_FILE = "users_data.json"
+CREDIT_LOG = "credit_transactions.log"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credits (
+    user_id     TEXT PRIMARY KEY,
+    credits     INTEGER NOT NULL DEFAULT 0,
+    expiration  TEXT,
+    statut      TEXT
+);
+CREATE TABLE IF NOT EXISTS credit_transactions (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp   TEXT NOT NULL,
+    user_id     TEXT NOT NULL,
+    amount      INTEGER NOT NULL,
+    type        TEXT NOT NULL,
+    details     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_credit_tx_user ON credit_transactions(user_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+"""
+
+
+def _utc_now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class JSONCreditStore:
+    """Ancien stockage : tout le fichier JSON est relu et réécrit à chaque opération."""
+
+    def __init__(self, data_file=DATA_FILE, log_file=CREDIT_LOG):
+        self.data_file = data_file
+        self.log_file = log_file
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.data_file):
+            return {}
+        with open(self.data_file, "r") as f:
+            return json.load(f)
+
+    def _save(self, data):
+        with open(self.data_file, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def _log(self, user_id, amount, transaction_type, details):
+        try:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "timestamp": _utc_now(),
+                    "user_id": str(user_id),
+                    "amount": amount,
+                    "type": transaction_type,
+                    "details": details
+                }) + "\n")
+        except Exception:
+            pass  # Ne pas bloquer sur erreur de log
+
+    def get_or_create(self, user_id, defaults):
+        """Retourne (données, créé) ; crée l'utilisateur avec `defaults` s'il n'existe pas."""
+        user_str = str(user_id)
+        with self._lock:
+            data = self._load()
+            if user_str in data:
+                return data[user_str], False
+            data[user_str] = dict(defaults)
+            self._save(data)
+        self._log(user_id, defaults["credits"], "init", "Nouveaux crédits initiaux")
+        return data[user_str], True
+
+    def spend(self, user_id, amount, details):
+        user_str = str(user_id)
+        with self._lock:
+            data = self._load()
+            if user_str not in data or data[user_str]['credits'] < amount:
+                return False
+            data[user_str]['credits'] -= amount
+            self._save(data)
+        self._log(user_id, -amount, "spend", details)
+        return True
+
+    def add(self, user_id, amount, transaction_type, details):
+        user_str = str(user_id)
+        with self._lock:
+            data = self._load()
+            if user_str not in data:
+                return False
+            data[user_str]['credits'] += amount
+            self._save(data)
+        self._log(user_id, amount, transaction_type, details)
+        return True
+
+    def record_transaction(self, user_id, amount, transaction_type, details=""):
+        self._log(user_id, amount, transaction_type, details)
+
+    def list_user_ids(self):
+        with self._lock:
+            return list(self._load().keys())
+
+    def stats(self, top=10):
+        with self._lock:
+            data = self._load()
+        return {
+            "total_users": len(data),
+            "total_credits": sum(u.get('credits', 0) for u in data.values()),
+            "top": [(u_id, u.get('credits', 0)) for u_id, u in list(data.items())[:top]],
+        }
+
+
+class SQLiteCreditStore:
+    """Stockage SQLite (WAL) : chaque opération ne touche que la ligne de l'utilisateur."""
+
+    def __init__(self, path=None):
+        self.path = path or config.DB_FILE
+        db.ensure_schema("credits", SCHEMA, self.path)
+
+    @staticmethod
+    def _row_to_dict(row):
+        return {"credits": row["credits"], "expiration": row["expiration"], "statut": row["statut"]}
+
+    @staticmethod
+    def _insert_tx(conn, user_id, amount, transaction_type, details, timestamp=None):
+        conn.execute(
+            "INSERT INTO credit_transactions (timestamp, user_id, amount, type, details) VALUES (?, ?, ?, ?, ?)",
+            (timestamp or _utc_now(), str(user_id), amount, transaction_type, details)
+        )
+
+    def get_or_create(self, user_id, defaults):
+        user_str = str(user_id)
+        conn = db.get_connection(self.path)
+        row = conn.execute("SELECT * FROM credits WHERE user_id = ?", (user_str,)).fetchone()
+        if row:
+            return self._row_to_dict(row), False
+        with db.transaction(self.path) as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO credits (user_id, credits, expiration, statut) VALUES (?, ?, ?, ?)",
+                (user_str, defaults["credits"], defaults.get("expiration"), defaults.get("statut"))
+            )
+            created = cur.rowcount == 1
+            if created:
+                self._insert_tx(conn, user_str, defaults["credits"], "init", "Nouveaux crédits initiaux")
+            row = conn.execute("SELECT * FROM credits WHERE user_id = ?", (user_str,)).fetchone()
+        return self._row_to_dict(row), created
+
+    def spend(self, user_id, amount, details):
+        user_str = str(user_id)
+        with db.transaction(self.path) as conn:
+            cur = conn.execute(
+                "UPDATE credits SET credits = credits - ? WHERE user_id = ? AND credits >= ?",
+                (amount, user_str, amount)
+            )
+            if cur.rowcount != 1:
+                return False
+            self._insert_tx(conn, user_str, -amount, "spend", details)
+        return True
+
+    def add(self, user_id, amount, transaction_type, details):
+        user_str = str(user_id)
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("UPDATE credits SET credits = credits + ? WHERE user_id = ?", (amount, user_str))
+            if cur.rowcount != 1:
+                return False
+            self._insert_tx(conn, user_str, amount, transaction_type, details)
+        return True
+
+    def record_transaction(self, user_id, amount, transaction_type, details=""):
+        with db.transaction(self.path) as conn:
+            self._insert_tx(conn, user_id, amount, transaction_type, details)
+
+    def list_user_ids(self):
+        conn = db.get_connection(self.path)
+        return [row["user_id"] for row in conn.execute("SELECT user_id FROM credits ORDER BY rowid")]
+
+    def stats(self, top=10):
+        conn = db.get_connection(self.path)
+        total_users, total_credits = conn.execute("SELECT COUNT(*), COALESCE(SUM(credits), 0) FROM credits").fetchone()
+        rows = conn.execute("SELECT user_id, credits FROM credits ORDER BY rowid LIMIT ?", (top,)).fetchall()
+        return {
+            "total_users": total_users,
+            "total_credits": total_credits,
+            "top": [(row["user_id"], row["credits"]) for row in rows],
+        }
+
+    def migrate_from_json(self, data_file=DATA_FILE, log_file=CREDIT_LOG):
+        """
+        Importe (une seule fois) `users_data.json` et `credit_transactions.log`.
+        Retourne (nb_utilisateurs, nb_transactions) importés, (0, 0) si déjà fait.
+        """
+        users = {}
+        if os.path.exists(data_file):
+            with open(data_file, "r") as f:
+                users = json.load(f)
+        transactions = []
+        if os.path.exists(log_file):
+            with open(log_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        transactions.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+
+        with db.transaction(self.path) as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0, 0
+            conn.executemany(
+                "INSERT OR IGNORE INTO credits (user_id, credits, expiration, statut) VALUES (?, ?, ?, ?)",
+                [(str(u_id), int(u.get("credits", 0)), u.get("expiration"), u.get("statut"))
+                 for u_id, u in users.items()]
+            )
+            conn.executemany(
+                "INSERT INTO credit_transactions (timestamp, user_id, amount, type, details) VALUES (?, ?, ?, ?, ?)",
+                [(t.get("timestamp") or _utc_now(), str(t.get("user_id", "")), int(t.get("amount", 0)),
+                  t.get("type", ""), t.get("details", "")) for t in transactions]
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (_utc_now(),))
+        return len(users), len(transactions)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Retourne le store configuré (CREDIT_BACKEND), migrant l'ancien JSON au premier accès SQLite."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if config.CREDIT_BACKEND == "json":
+                    _store = JSONCreditStore()
+                else:
+                    store = SQLiteCreditStore()
+                    if os.path.exists(DATA_FILE):
+                        store.migrate_from_json()
+                    _store = store
+    return _store
+
+
+if __name__ == "__main__":
+    n_users, n_tx = SQLiteCreditStore().migrate_from_json()
+    if n_users or n_tx:
+        print(f"✅ Migration terminée : {n_users} utilisateurs, {n_tx} transactions importés dans {config.DB_FILE}")
+    else:
+        print("ℹ️ Migration déjà effectuée (ou aucune donnée à importer).")
@@ -0,0 +1,62 @@
+"""
+db.py — Connexions SQLite partagées par les différents stores (crédits, comptes, ...).
+
+Chaque thread garde sa propre connexion (sqlite3 n'aime pas le partage entre threads)
+et la base est ouverte en mode WAL : les lectures ne bloquent pas les écritures,
+ce qui convient au bot Telegram et au site Flask qui tournent en parallèle.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import config
+
+BUSY_TIMEOUT_MS = 30000
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schemas_ready = set()
+
+
+def get_connection(path=None):
+    """Retourne la connexion SQLite du thread courant pour `path` (créée au besoin)."""
+    path = path or config.DB_FILE
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        # isolation_level=None : autocommit, les transactions sont ouvertes explicitement
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conns[path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(path=None):
+    """Transaction en écriture (BEGIN IMMEDIATE) : commit si OK, rollback sinon."""
+    conn = get_connection(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def ensure_schema(name, ddl, path=None):
+    """Exécute le DDL `ddl` une seule fois par processus pour le couple (name, path)."""
+    path = path or config.DB_FILE
+    key = (name, path)
+    if key in _schemas_ready:
+        return
+    with _schema_lock:
+        if key in _schemas_ready:
+            return
+        get_connection(path).executescript(ddl)
+        _schemas_ready.add(key)
@@ -0,0 +1,243 @@
+"""
+download_jobs.py — Téléchargements asynchrones pour le site web.
+
+La requête Flask soumet un job et rend la main tout de suite ; un pool borné de
+workers exécute `download_content` et met à jour la progression (mêmes hooks
+yt-dlp que le bot Telegram). Le client interroge ensuite l'état du job puis
+récupère le fichier une fois terminé.
+
+L'état des jobs est dans la base SQLite commune (table `download_jobs`) : avec
+plusieurs workers gunicorn, le suivi et le fichier peuvent être servis par un autre
+processus que celui qui télécharge. Les workers doivent donc partager le disque
+(même machine). Chaque processus rafraîchit régulièrement `updated_at` des jobs
+qu'il détient (en attente ou en cours) : un job sans nouvelle depuis STALE_AFTER
+secondes appartenait à un processus arrêté, il passe en erreur et son crédit est rendu.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import db
+from downloader import download_content
+from limiteur import refund_credit
+from progress_reporter import ProgressReporter
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+HEARTBEAT_INTERVAL = 30               # s entre deux signes de vie des jobs du processus
+STALE_AFTER = 4 * HEARTBEAT_INTERVAL  # au-delà, le processus propriétaire est considéré arrêté
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS download_jobs (
+    id          TEXT PRIMARY KEY,
+    user_id     TEXT NOT NULL,
+    url         TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    quality     TEXT,
+    status      TEXT NOT NULL,
+    progress    TEXT NOT NULL,
+    file_path   TEXT,
+    info        TEXT,
+    error       TEXT,
+    paid        INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_status ON download_jobs(status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_finished ON download_jobs(finished_at);
+"""
+
+class QueueFullError(Exception):
+    """Trop de jobs en attente : la soumission est refusée."""
+
+
+# Progression des jobs, regroupée comme pour les messages Telegram
+_web_progress = ProgressReporter(config.WEB_PROGRESS_INTERVAL, name="web-progress")
+_executor = ThreadPoolExecutor(max_workers=config.WEB_DOWNLOAD_WORKERS, thread_name_prefix="web-dl")
+_owned = set()   # jobs en attente ou en cours dans ce processus
+_owned_lock = threading.Lock()
+_heartbeat = None
+
+
+def _remove_file(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def _update(job_id, expected=None, **fields):
+    """
+    Met à jour le job ; avec `expected`, seulement s'il est encore dans ce statut.
+    Retourne True si la ligne a été modifiée.
+    """
+    fields["updated_at"] = time.time()
+    for name in ("progress", "info"):
+        if name in fields:
+            fields[name] = json.dumps(fields[name], default=str)
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    query = f"UPDATE download_jobs SET {assignments} WHERE id = ?"
+    values = (*fields.values(), job_id)
+    if expected:
+        query += " AND status = ?"
+        values += (expected,)
+    with db.transaction() as conn:
+        return conn.execute(query, values).rowcount > 0
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _owned_lock:
+            owned = list(_owned)
+        if not owned:
+            continue
+        try:
+            with db.transaction() as conn:
+                conn.execute(
+                    f"UPDATE download_jobs SET updated_at = ? WHERE status IN (?, ?) "
+                    f"AND id IN ({', '.join('?' * len(owned))})",
+                    (time.time(), QUEUED, RUNNING, *owned)
+                )
+        except Exception:
+            pass   # base momentanément indisponible : nouvel essai au prochain tour
+
+
+def _own(job_id):
+    global _heartbeat
+    with _owned_lock:
+        _owned.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_loop, daemon=True, name="web-dl-heartbeat")
+            _heartbeat.start()
+
+
+def _disown(job_id):
+    with _owned_lock:
+        _owned.discard(job_id)
+
+
+def _cleanup_expired():
+    """
+    Oublie les jobs terminés depuis plus de JOB_TTL_SECONDS (et supprime leurs fichiers) ;
+    les jobs actifs sans signe de vie depuis STALE_AFTER (processus arrêté) passent en
+    erreur et leur crédit est rendu, une seule fois.
+    """
+    db.ensure_schema("download_jobs", SCHEMA)
+    now = time.time()
+    cutoff = now - config.JOB_TTL_SECONDS
+    with db.transaction() as conn:
+        expired = [row["file_path"] for row in conn.execute(
+            "SELECT file_path FROM download_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))]
+        conn.execute("DELETE FROM download_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        abandoned = conn.execute(
+            "SELECT id, user_id, paid FROM download_jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (QUEUED, RUNNING, now - STALE_AFTER)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE download_jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+            [(ERROR, "Téléchargement interrompu", now, now, row["id"]) for row in abandoned]
+        )
+    for path in expired:
+        _remove_file(path)
+    for row in abandoned:
+        if row["paid"]:
+            try:
+                refund_credit(row["user_id"], details="Téléchargement interrompu")
+            except Exception:
+                pass
+
+
+def _run(job_id, url, mode, quality, on_error):
+    try:
+        _execute(job_id, url, mode, quality, on_error)
+    finally:
+        _disown(job_id)
+
+
+def _execute(job_id, url, mode, quality, on_error):
+    # Le job a pu être passé en erreur (et remboursé) pendant son attente
+    if not _update(job_id, expected=QUEUED, status=RUNNING):
+        return
+    last_progress = {"percent": 0.0, "speed": "N/A", "eta": "N/A"}
+
+    def on_progress(progress):
+        last_progress.update(progress)
+        _web_progress.report(job_id, progress, lambda p: _update(job_id, progress=p),
+                             signature=int(progress["percent"]))
+
+    try:
+        file_path, info = download_content(url, mode, progress_callback=on_progress, quality=quality)
+    except Exception as e:
+        _web_progress.discard(job_id)
+        if not _update(job_id, expected=RUNNING, status=ERROR, error=str(e), finished_at=time.time()):
+            return   # déjà passé en erreur et remboursé par le nettoyage
+        if on_error:
+            try:
+                on_error(e)
+            except Exception:
+                pass
+        return
+    _web_progress.discard(job_id)
+    if not _update(job_id, expected=RUNNING, status=DONE, file_path=file_path, info=info,
+                   finished_at=time.time(), progress=dict(last_progress, percent=100.0)):
+        _remove_file(file_path)   # job abandonné entre-temps : personne ne viendra chercher le fichier
+
+
+def submit(user_id, url, mode, quality=None, on_error=None, paid=False):
+    """
+    Met un téléchargement en file et retourne son identifiant.
+    `on_error(exc)` est appelé si le téléchargement échoue (ex : rembourser le crédit) ;
+    `paid` : un crédit a été débité, il est rendu si le job est abandonné (processus arrêté).
+    Lève QueueFullError si MAX_PENDING_JOBS jobs sont déjà en attente ou en cours.
+    """
+    _cleanup_expired()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with db.transaction() as conn:
+        active = conn.execute("SELECT COUNT(*) FROM download_jobs WHERE status IN (?, ?)",
+                              (QUEUED, RUNNING)).fetchone()[0]
+        if active >= config.MAX_PENDING_JOBS:
+            raise QueueFullError("Trop de téléchargements en cours, réessayez dans un instant.")
+        conn.execute(
+            "INSERT INTO download_jobs (id, user_id, url, mode, quality, status, progress, paid, created_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, str(user_id), url, mode, quality, QUEUED,
+             json.dumps({"percent": 0.0, "speed": "N/A", "eta": "N/A"}), int(paid), now, now)
+        )
+    _own(job_id)
+    _executor.submit(_run, job_id, url, mode, quality, on_error)
+    return job_id
+
+
+def get_job(job_id, user_id):
+    """Retourne le job s'il appartient à `user_id`, sinon None."""
+    db.ensure_schema("download_jobs", SCHEMA)
+    row = db.get_connection().execute(
+        "SELECT * FROM download_jobs WHERE id = ? AND user_id = ?", (job_id, str(user_id))
+    ).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"])
+    job["info"] = json.loads(job["info"]) if job["info"] else None
+    return job
+
+
+def release(job_id):
+    """Oublie un job et supprime son fichier (après envoi au client)."""
+    db.ensure_schema("download_jobs", SCHEMA)
+    with db.transaction() as conn:
+        row = conn.execute("SELECT file_path FROM download_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.execute("DELETE FROM download_jobs WHERE id = ?", (job_id,))
+    if row:
+        _remove_file(row["file_path"])
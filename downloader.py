@@ -1,118 +1,360 @@
-import yt_dlp
 import os
+import shutil
 import re
-import zipfile
-from robust_engine import get_bypass_config
+import struct
+import time
+import zlib
+import threading
+import media_cache
+import ydl_pool
+import connection_budget
+import transcoder
+import quality_ladder
+from progress_reporter import ProgressReporter
+import config
+import telegram_dispatcher
+
+# Téléchargeur externe (ex : aria2c) utilisé seulement s'il est installé
+EXTERNAL_DOWNLOADER = config.EXTERNAL_DOWNLOADER if config.EXTERNAL_DOWNLOADER and shutil.which(config.EXTERNAL_DOWNLOADER) else None
+
+# Éditions Telegram de la barre de progression (limitées pour éviter le flood)
+telegram_progress = ProgressReporter(config.PROGRESS_EDIT_INTERVAL, name="telegram-progress")
 
 def clean_progress_text(text):
     ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-a-z])')
     return ansi_escape.sub('', text)
 
+def parse_progress(d):
+    """Extrait pourcentage, vitesse et ETA d'un événement 'downloading' de yt-dlp."""
+    p_str = clean_progress_text(d.get('_percent_str', '0%'))
+    return {
+        'percent': float(p_str.replace('%', '').strip()),
+        'speed': clean_progress_text(d.get('_speed_str', 'N/A')),
+        'eta': clean_progress_text(d.get('_eta_str', 'N/A')),
+    }
+
 def progress_hook(d, bot, chat_id, message_id):
     if d['status'] == 'downloading':
         try:
-            p_str = clean_progress_text(d.get('_percent_str', '0%'))
-            p_float = float(p_str.replace('%', '').strip())
-            speed = clean_progress_text(d.get('_speed_str', 'N/A'))
-            eta = clean_progress_text(d.get('_eta_str', 'N/A'))
-            filled = int(p_float // 10)
+            p = parse_progress(d)
+            filled = int(p['percent'] // 10)
             bar = "▓" * filled + "░" * (10 - filled)
             msg = (f"📥 **Téléchargement Cloud...**\n\n"
-                   f"[{bar}] {p_float:.1f}%\n"
-                   f"⚡ {speed} | ⏳ {eta}")
-            bot.edit_message_text(msg, chat_id, message_id, parse_mode="Markdown")
+                   f"[{bar}] {p['percent']:.1f}%\n"
+                   f"⚡ {p['speed']} | ⏳ {p['eta']}")
+            # Au plus une édition par intervalle, et seulement quand la barre change
+            telegram_progress.report(
+                (chat_id, message_id), msg,
+                lambda text: telegram_dispatcher.submit(bot, "edit_message_text", text, chat_id, message_id,
+                                                        target_chat=chat_id, parse_mode="Markdown"),
+                signature=bar
+            )
         except: pass
 
-def download_content(url, mode, bot=None, chat_id=None, message_id=None):
+def callback_progress_hook(d, progress_callback):
+    """Transmet la progression yt-dlp à un callback (ex : jobs web)."""
+    if d['status'] == 'downloading':
+        try:
+            progress_callback(parse_progress(d))
+        except Exception:
+            pass
+
+class _Flight:
+    """Téléchargement en cours partagé entre toutes les demandes identiques simultanées."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.hooks = []      # hooks de progression de tous les demandeurs
+        self.waiters = 0
+        self.results = []    # une copie (lien) du fichier par demandeur en attente
+        self.error = None
+
+    def progress(self, d):
+        for hook in list(self.hooks):
+            hook(d)
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _end_flight(key, flight):
+    """Retire le vol terminé (sans toucher à un éventuel nouveau vol pour la même clé)."""
+    with _inflight_lock:
+        if _inflight.get(key) is flight:
+            del _inflight[key]
+
+def download_content(url, mode, bot=None, chat_id=None, message_id=None, progress_callback=None, quality=None):
     """
     Download content from YouTube using standard yt-dlp quality.
+
+    Les demandes simultanées pour la même vidéo (même mode) sont regroupées :
+    une seule exécute yt-dlp, les autres reçoivent leur propre copie du résultat.
     
     Args:
         url: YouTube URL
-        mode: 'mp3' or 'mp4'
+        mode: 'audio' (piste native), 'mp3' or 'mp4'
         bot, chat_id, message_id: For Telegram progress updates
+        progress_callback: Optional callable receiving {'percent', 'speed', 'eta'}
+        quality: palier de quality_ladder.TIERS[mode] (par défaut : le meilleur)
     
     Returns:
         tuple: (filename, info_dict) - filename and video info for display
     """
     download_path = "downloads"
     if not os.path.exists(download_path): os.makedirs(download_path)
-    ydl_opts = get_bypass_config()
-    
-    # Standard yt-dlp format selection (simple and reliable)
-    if mode == 'mp3':
-        ydl_opts.update({
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        })
-    else:
-        # Standard best quality MP4
-        ydl_opts.update({
-            'format': 'best[ext=mp4]/best',
-        })
-    
-    ydl_opts.update({
-        'outtmpl': f'{download_path}/%(title)s.%(ext)s',
-        'noplaylist': True, 'quiet': True, 'no_color': True,
-    })
-    
+    if not quality_ladder.is_valid(mode, quality):
+        quality = quality_ladder.TIERS[mode][0]
+
+    # Cache : un média déjà téléchargé est servi sans yt-dlp ni ffmpeg
+    video_id = media_cache.extract_video_id(url)
+    try:
+        cached = media_cache.get(video_id, mode, quality, dest_dir=download_path)
+    except Exception:
+        cached = None  # Le cache ne doit jamais bloquer un téléchargement
+    if cached:
+        return cached
+
+    hooks = []
     if bot and chat_id and message_id:
-        ydl_opts['progress_hooks'] = [lambda d: progress_hook(d, bot, chat_id, message_id)]
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        filename = ydl.prepare_filename(info)
-        
-        # Extract useful info for display
-        download_info = {
-            'title': info.get('title', 'Unknown'),
-            'duration': info.get('duration', 0),
-            'uploader': info.get('uploader', 'Unknown'),
-            'view_count': info.get('view_count', 0),
-            'resolution': info.get('resolution', 'N/A'),
-            'filesize': info.get('filesize') or info.get('filesize_approx', 0),
-        }
-        
-        if mode == 'mp3':
-            # FFmpeg postprocessor changes extension to .mp3
-            new_name = filename.rsplit('.', 1)[0] + '.mp3'
-            if os.path.exists(new_name):
-                return new_name, download_info
-            # Fallback: rename if not auto-converted
-            if os.path.exists(filename):
-                os.rename(filename, new_name)
-                return new_name, download_info
-            # If neither exists, raise an error
-            raise FileNotFoundError(f"Fichier audio non trouvé après conversion: {new_name}")
+        hooks.append(lambda d: progress_hook(d, bot, chat_id, message_id))
+    if progress_callback:
+        hooks.append(lambda d: callback_progress_hook(d, progress_callback))
+
+    try:
+        return _coalesced_download(url, mode, quality, download_path, video_id, hooks)
+    finally:
+        if bot and chat_id and message_id:
+            # Plus aucune édition de progression après la fin : le message va changer
+            telegram_progress.discard((chat_id, message_id))
+
+def _coalesced_download(url, mode, quality, download_path, video_id, hooks):
+    """Un seul téléchargement réel par (vidéo, mode, palier) ; les demandes simultanées le partagent."""
+    if not video_id:
+        return _download(url, mode, quality, download_path, video_id, hooks)
+
+    key = (video_id, mode, quality)
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+        else:
+            flight.waiters += 1
+        flight.hooks.extend(hooks)
+
+    if not leader:
+        # Même vidéo déjà en cours de téléchargement : on attend son résultat
+        flight.done.wait()
+        if flight.error:
+            raise flight.error
+        return flight.results.pop()
+
+    try:
+        filename, download_info = _download(url, mode, quality, download_path, video_id, [flight.progress])
+        _end_flight(key, flight)
+        # Chaque demandeur reçoit son propre lien : il peut le supprimer après envoi
+        flight.results = [(media_cache.link_copy(filename, download_path), download_info)
+                          for _ in range(flight.waiters)]
         return filename, download_info
+    except Exception as e:
+        _end_flight(key, flight)
+        flight.error = e
+        raise
+    finally:
+        flight.done.set()
+
+def transfer_options(connections):
+    """
+    Options de transfert yt-dlp pour `connections` connexions : fragments DASH/HLS en
+    parallèle, requêtes HTTP par blocs et, si configuré, téléchargeur externe multi-connexions.
+    """
+    options = {
+        'concurrent_fragment_downloads': connections,
+        'http_chunk_size': config.HTTP_CHUNK_SIZE or None,
+    }
+    if EXTERNAL_DOWNLOADER:
+        options['external_downloader'] = {'default': EXTERNAL_DOWNLOADER}
+        if EXTERNAL_DOWNLOADER == 'aria2c':
+            options['external_downloader_args'] = {'aria2c': [
+                '-x', str(connections), '-s', str(connections), '-k', '1M', '--console-log-level=warn']}
+    return options
+
+def _extract_and_name(ydl, url):
+    info = ydl.extract_info(url, download=True)
+    return info, ydl.prepare_filename(info)
+
+def _download(url, mode, quality, download_path, video_id, hooks):
+    """Exécute réellement yt-dlp, puis l'étage ffmpeg si besoin (MP3, remux audio), et alimente le cache."""
+    # Instance yt-dlp déjà initialisée (profil 'audio', 'mp3' ou 'mp4'), prêtée pour ce
+    # seul job ; l'ID et le palier dans le nom évitent que deux fichiers s'écrasent
+    # Connexions parallèles prises sur le budget de l'hôte, partagé avec les autres jobs
+    with connection_budget.reserve(url, config.DOWNLOAD_CONNECTIONS) as connections:
+        # Meilleure stratégie de contournement d'abord, puis les suivantes si elle est bloquée
+        info, filename = ydl_pool.run(
+            mode, lambda ydl: _extract_and_name(ydl, url),
+            outtmpl=f'{download_path}/%(title)s [%(id)s] {quality}.%(ext)s',
+            format=quality_ladder.format_spec(mode, quality),
+            progress_hooks=hooks, params=transfer_options(connections))
+
+    # Extract useful info for display
+    download_info = {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'view_count': info.get('view_count', 0),
+        'resolution': info.get('resolution', 'N/A'),
+        'filesize': info.get('filesize') or info.get('filesize_approx', 0),
+    }
+
+    if mode == 'mp3':
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"Fichier audio non trouvé après téléchargement: {filename}")
+        source = filename
+        filename = source.rsplit('.', 1)[0] + '.mp3'
+        if source != filename:
+            # Conversion par l'étage ffmpeg borné (l'instance yt-dlp est déjà rendue au pool)
+            try:
+                transcoder.to_mp3(source, filename, quality_ladder.audio_bitrate(quality)).result()
+            finally:
+                os.remove(source)
+    elif mode == 'audio' and filename.rsplit('.', 1)[-1] not in quality_ladder.NATIVE_AUDIO_EXTS:
+        # Piste native sans ré-encodage, dans le conteneur qui accepte son codec (opus/vorbis
+        # -> ogg, AAC -> m4a) ; codec inconnu : conversion MP3 plutôt qu'un remux voué à l'échec
+        source = filename
+        container = quality_ladder.audio_container(info.get('acodec'))
+        try:
+            if container:
+                filename = source.rsplit('.', 1)[0] + '.' + container[0]
+                transcoder.remux_audio(source, filename, container[1]).result()
+            else:
+                filename = source.rsplit('.', 1)[0] + '.mp3'
+                transcoder.to_mp3(source, filename).result()
+        finally:
+            os.remove(source)
+    try:
+        media_cache.put(video_id, mode, filename, download_info, quality)
+    except Exception:
+        pass
+    return filename, download_info
+
+ZIP_READ_BLOCK = 1024 * 1024
+
+class ZipPart:
+    """
+    Partie .zip.NNN lue à la demande : une vue sur une plage d'octets d'une archive
+    ZIP virtuelle (en-têtes en mémoire + contenu lu directement dans le fichier source).
+    S'utilise comme un fichier ouvert en lecture (ex : bot.send_document(chat_id, part)).
+    """
+
+    def __init__(self, name, segments, start, length):
+        self.name = name
+        self._segments = segments  # [(début virtuel, bytes ou (chemin, offset), longueur)]
+        self._start = start
+        self._length = length
+        self._pos = 0
+        self._files = {}
+        self.closed = False
+
+    def __len__(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._length
+        self._pos = max(0, min(offset, self._length))
+        return self._pos
+
+    def read(self, size=-1):
+        remaining = self._length - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        out = []
+        pos = self._start + self._pos
+        end = pos + size
+        for seg_start, source, seg_len in self._segments:
+            seg_end = seg_start + seg_len
+            if seg_end <= pos or seg_start >= end:
+                continue
+            lo, hi = max(pos, seg_start) - seg_start, min(end, seg_end) - seg_start
+            if isinstance(source, bytes):
+                out.append(source[lo:hi])
+            else:
+                path, offset = source
+                f = self._files.get(path)
+                if f is None:
+                    f = self._files[path] = open(path, 'rb')
+                f.seek(offset + lo)
+                out.append(f.read(hi - lo))
+        data = b"".join(out)
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = (max(t.tm_year, 1980) - 1980) << 9 | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
 
 def split_file(file_path, chunk_size=45 * 1024 * 1024):
-    """Compresse en ZIP puis découpe en parties .zip.001, .zip.002..."""
-    parts = []
+    """
+    Découpe le média en parties .zip.001, .zip.002... d'une archive ZIP (sans compression)
+    sans écrire d'archive ni de parties sur le disque : chaque partie est une vue lue
+    à la demande sur le fichier source (mémoire bornée par la taille d'un bloc lu).
+    Le fichier source doit rester présent jusqu'à l'envoi de toutes les parties.
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size > 0xFFFFFFFF:
+        raise ValueError("Fichier trop volumineux pour une archive ZIP sans ZIP64.")
+
+    # CRC32 calculé en une passe de lecture, sans copie
+    crc = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(ZIP_READ_BLOCK), b""):
+            crc = zlib.crc32(block, crc)
+
+    arcname = os.path.basename(file_path)
+    name_bytes = arcname.encode('utf-8')
+    flags = 0x0800 if not arcname.isascii() else 0  # nom de fichier UTF-8
+    dos_time, dos_date = _dos_datetime(os.path.getmtime(file_path))
+    local_header = struct.pack(
+        "<IHHHHHIIIHH", 0x04034b50, 20, flags, 0, dos_time, dos_date,
+        crc, file_size, file_size, len(name_bytes), 0
+    ) + name_bytes
+    central_dir = struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014b50, 20, 20, flags, 0, dos_time, dos_date,
+        crc, file_size, file_size, len(name_bytes), 0, 0, 0, 0, 0, 0
+    ) + name_bytes
+    cd_offset = len(local_header) + file_size
+    end_record = struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, 1, 1, len(central_dir), cd_offset, 0)
+    trailer = central_dir + end_record
+
+    segments = [
+        (0, local_header, len(local_header)),
+        (len(local_header), (file_path, 0), file_size),
+        (cd_offset, trailer, len(trailer)),
+    ]
+    total = cd_offset + len(trailer)
     zip_filename = file_path + ".zip"
-    
-    # 1. Création de l'archive ZIP réelle
-    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_STORED) as z:
-        z.write(file_path, os.path.basename(file_path))
-    
-    # 2. Découpage binaire du fichier ZIP
-    with open(zip_filename, 'rb') as f:
-        part_num = 1
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk: break
-            part_name = f"{zip_filename}.{part_num:03d}" # Exemple: video.mp4.zip.001
-            with open(part_name, 'wb') as p:
-                p.write(chunk)
-            parts.append(part_name)
-            part_num += 1
-            
-    # Nettoyage du ZIP temporaire et du fichier original
-    if os.path.exists(zip_filename): os.remove(zip_filename)
-    if os.path.exists(file_path): os.remove(file_path)
-    
-    return parts
\ No newline at end of file
+    return [
+        ZipPart(f"{zip_filename}.{n + 1:03d}", segments, start, min(chunk_size, total - start))  # Exemple: video.mp4.zip.001
+        for n, start in enumerate(range(0, total, chunk_size))
+    ]
@@ -1,93 +1,34 @@
 """
 Email utility module for sending OTP codes and notifications.
 """
-import os
 import random
 import string
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta, timezone
-import json
 import config
+import otp_store
 
-# OTP storage file
-OTP_FILE = "otp_data.json"
 OTP_VALIDITY_MINUTES = 10  # OTP valid for 10 minutes
 
 def generate_otp(length=6):
     """Generate a random OTP code."""
     return ''.join(random.choices(string.digits, k=length))
 
-def load_otp_data():
-    """Load OTP data from file."""
-    if not os.path.exists(OTP_FILE):
-        return {}
-    try:
-        with open(OTP_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
-def save_otp_data(data):
-    """Save OTP data to file."""
-    with open(OTP_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-
 def store_otp(email, otp):
-    """Store OTP for email with expiration time."""
-    data = load_otp_data()
-    expiry = (datetime.now(timezone.utc) + timedelta(minutes=OTP_VALIDITY_MINUTES)).isoformat()
-    data[email] = {
-        "otp": otp,
-        "expiry": expiry,
-        "attempts": 0
-    }
-    save_otp_data(data)
+    """Store OTP for email with expiration time (replaces any previous code)."""
+    otp_store.get_store().put(email, otp, OTP_VALIDITY_MINUTES * 60)
 
 def verify_otp(email, otp):
     """
     Verify OTP for email.
     Returns (True, "") if valid, (False, reason) if invalid.
     """
-    data = load_otp_data()
-    
-    if email not in data:
-        return False, "Code de vérification non trouvé ou expiré."
-    
-    stored = data[email]
-    
-    # Check expiry
-    expiry = datetime.fromisoformat(stored["expiry"])
-    if datetime.now(timezone.utc) > expiry:
-        del data[email]
-        save_otp_data(data)
-        return False, "Code de vérification expiré. Demandez-en un nouveau."
-    
-    # Check attempts
-    if stored["attempts"] >= 3:
-        del data[email]
-        save_otp_data(data)
-        return False, "Trop de tentatives. Demandez un nouveau code."
-    
-    # Check OTP
-    if stored["otp"] != otp:
-        stored["attempts"] += 1
-        save_otp_data(data)
-        attempts_left = 3 - stored["attempts"]
-        return False, f"Code incorrect. Tentatives restantes : {attempts_left}"
-    
-    # Success - remove OTP
-    del data[email]
-    save_otp_data(data)
-    return True, ""
+    return otp_store.get_store().verify(email, otp)
 
 def clear_otp(email):
     """Clear OTP for email."""
-    data = load_otp_data()
-    if email in data:
-        del data[email]
-        save_otp_data(data)
+    otp_store.get_store().discard(email)
 
 def send_otp_email(email, otp):
     """
@@ -0,0 +1,69 @@
+"""
+file_id_cache.py — Mémorise les file_id Telegram des médias déjà envoyés.
+
+Après un premier envoi, Telegram renvoie un file_id réutilisable : les demandes
+suivantes pour la même vidéo (même mode/qualité) sont renvoyées instantanément,
+sans téléchargement ni upload. Un file_id n'est valable que pour le bot qui l'a
+obtenu, d'où la présence de l'identifiant du bot dans la clé.
+"""
+import time
+
+import db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS telegram_file_ids (
+    bot_id      TEXT NOT NULL,
+    video_id    TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    quality     TEXT NOT NULL,
+    file_id     TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (bot_id, video_id, mode, quality)
+);
+"""
+
+
+def _bot_id(bot):
+    return str(bot.token).split(":", 1)[0]
+
+
+def get_file_id(bot, video_id, mode, quality="default"):
+    """Retourne le file_id mémorisé pour ce média, ou None."""
+    if not video_id:
+        return None
+    db.ensure_schema("telegram_file_ids", SCHEMA)
+    row = db.get_connection().execute(
+        "SELECT file_id FROM telegram_file_ids WHERE bot_id = ? AND video_id = ? AND mode = ? AND quality = ?",
+        (_bot_id(bot), video_id, mode, quality)
+    ).fetchone()
+    return row["file_id"] if row else None
+
+
+def save_file_id(bot, video_id, mode, file_id, quality="default"):
+    if not video_id or not file_id:
+        return
+    db.ensure_schema("telegram_file_ids", SCHEMA)
+    with db.transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO telegram_file_ids (bot_id, video_id, mode, quality, file_id, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (_bot_id(bot), video_id, mode, quality, file_id, time.time())
+        )
+
+
+def forget_file_id(bot, video_id, mode, quality="default"):
+    """Oublie un file_id refusé par Telegram."""
+    db.ensure_schema("telegram_file_ids", SCHEMA)
+    with db.transaction() as conn:
+        conn.execute(
+            "DELETE FROM telegram_file_ids WHERE bot_id = ? AND video_id = ? AND mode = ? AND quality = ?",
+            (_bot_id(bot), video_id, mode, quality)
+        )
+
+
+def sent_file_id(message, mode):
+    """Extrait le file_id du message renvoyé par send_video / send_audio."""
+    media = message.video if mode == "mp4" else message.audio
+    if media is None:
+        media = message.document  # Telegram peut requalifier le média en document
+    return media.file_id if media else None
@@ -0,0 +1,106 @@
+"""
+file_streaming.py — Envoi de fichiers en flux par blocs, avec support HTTP Range / If-Range.
+
+Le fichier est lu bloc par bloc pendant l'envoi ; un client interrompu peut reprendre
+avec un en-tête Range. `on_complete` est appelé uniquement quand le dernier octet du
+fichier a été envoyé (ex : supprimer le fichier), jamais sur une coupure.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date
+
+import config
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_disposition(download_name):
+    ascii_name = download_name.encode("ascii", "ignore").decode("ascii").replace('"', "")
+    if ascii_name == download_name:
+        return f'attachment; filename="{download_name}"'
+    return f"attachment; filename=\"{ascii_name or 'download'}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+def _parse_range(header, size):
+    """
+    Retourne (début, fin) inclus pour un en-tête Range à plage unique,
+    None si l'en-tête est absent/ignoré, ou "invalid" si la plage est insatisfaisable.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None  # plages multiples ou syntaxe inconnue : on envoie le fichier entier
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N : les N derniers octets
+        length = int(end)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(if_range, etag, mtime):
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and int(mtime) <= date.timestamp()
+
+
+def stream_file_response(path, download_name=None, on_complete=None, mimetype="application/octet-stream"):
+    """Construit une réponse Flask qui envoie `path` en flux (200 ou 206 selon l'en-tête Range)."""
+    stat = os.stat(path)
+    size, mtime = stat.st_size, stat.st_mtime
+    etag = f'"{size:x}-{int(mtime):x}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": http_date(mtime),
+        "Content-Disposition": content_disposition(download_name or os.path.basename(path)),
+    }
+
+    byte_range = None
+    if _if_range_matches(request.headers.get("If-Range"), etag, mtime):
+        byte_range = _parse_range(request.headers.get("Range"), size)
+    if byte_range == "invalid":
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    status = 200
+    start, end = 0, size - 1
+    if byte_range:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    # Une plage « suffixe » (bytes=-N) sert à sonder la fin du fichier : ce n'est pas un envoi complet
+    reaches_end = end == size - 1 and not (byte_range and request.headers["Range"].strip().startswith("bytes=-"))
+
+    def generate():
+        remaining = end - start + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(config.STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        # Atteint seulement si le client a tout reçu jusqu'au dernier octet du fichier
+        if on_complete and reaches_end:
+            on_complete()
+
+    return Response(generate(), status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
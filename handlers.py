@@ -1,24 +1,27 @@
-import time, os, uuid, re
+import os, uuid, re
 from telebot import types
+from telebot.apihelper import ApiTelegramException
 from limiteur import get_user_data, spend_credit
 from downloader import download_content, split_file 
-from queue_manager import add_to_queue, get_queue_position, remove_from_queue
+from queue_manager import add_to_queue
+from media_cache import extract_video_id
+from file_id_cache import get_file_id, save_file_id, forget_file_id, sent_file_id
+from video_probe import probe, check_limits, allowed_modes, allowed_qualities, VideoUnavailable
+import config
+import quality_ladder
+import telegram_dispatcher
+from rate_limiter import RateLimiter
 
 # Stockage temporaire des liens pour éviter l'erreur BUTTON_DATA_INVALID
 url_storage = {}
 
-# SÉCURITÉ : Rate limiting par utilisateur pour éviter les abus
-user_rate_limit = {}
+# SÉCURITÉ : Rate limiting par utilisateur pour éviter les abus (même moteur que le site)
 RATE_LIMIT_SECONDS = 5  # Minimum 5 secondes entre chaque téléchargement
+user_rate_limit = RateLimiter("telegram", 1, RATE_LIMIT_SECONDS)
 
 def check_rate_limit(user_id):
     """Vérifie si l'utilisateur respecte le rate limit."""
-    now = time.time()
-    last_request = user_rate_limit.get(user_id, 0)
-    if now - last_request < RATE_LIMIT_SECONDS:
-        return False
-    user_rate_limit[user_id] = now
-    return True
+    return user_rate_limit.hit(user_id)
 
 def sanitize_youtube_url(url):
     """Valide et nettoie l'URL YouTube pour éviter les injections."""
@@ -31,13 +34,84 @@ def sanitize_youtube_url(url):
         return None
     return url
 
+def send(bot, method, chat_id, *args, **kwargs):
+    """Appel `bot.<method>(chat_id, ...)` via la file d'envoi, en priorité haute (réponse directe)."""
+    return telegram_dispatcher.call(bot, method, chat_id, *args, target_chat=chat_id,
+                                    priority=telegram_dispatcher.HIGH, **kwargs)
+
+def reply(bot, message, text, **kwargs):
+    """Répond à `message` via la file d'envoi, en priorité haute."""
+    return telegram_dispatcher.call(bot, "reply_to", message, text, target_chat=message.chat.id,
+                                    priority=telegram_dispatcher.HIGH, **kwargs)
+
+def send_media(bot, chat_id, media, mode):
+    """Envoie une vidéo ou un audio (fichier ouvert ou file_id) et retourne le message Telegram."""
+    if mode == "mp4":
+        return send(bot, "send_video", chat_id, media, caption="🎥 Vidéo prête !", timeout=300)
+    return send(bot, "send_audio", chat_id, media, caption="🎵 Audio prêt !", timeout=300)
+
+def send_cached_file_id(bot, chat_id, video_id, mode, quality):
+    """Renvoie le média via son file_id mémorisé ; False si absent ou refusé par Telegram."""
+    file_id = get_file_id(bot, video_id, mode, quality)
+    if not file_id:
+        return False
+    try:
+        send_media(bot, chat_id, file_id, mode)
+        return True
+    except ApiTelegramException:
+        # file_id expiré ou invalide : on l'oublie et on repasse par l'upload
+        forget_file_id(bot, video_id, mode, quality)
+        return False
+
+def run_download(bot, user_id, chat_id, message_id, url, mode, link_id, quality):
+    """Télécharge, envoie le fichier et débite le crédit (exécuté par un worker de queue_manager)."""
+    file_path = None
+    video_id = extract_video_id(url)
+    try:
+        # Média déjà envoyé une fois par ce bot : renvoi instantané, sans téléchargement ni upload
+        if send_cached_file_id(bot, chat_id, video_id, mode, quality):
+            spend_credit(user_id)
+            send(bot, "delete_message", chat_id, message_id)
+            return
+
+        file_path, _info = download_content(url, mode, bot, chat_id, message_id, quality=quality)
+        file_size = os.path.getsize(file_path)
+
+        if file_size > config.TELEGRAM_UPLOAD_LIMIT:
+            telegram_dispatcher.call(bot, "edit_message_text", "📦 **Gros fichier.** Découpage en cours...", chat_id,
+                                     message_id, target_chat=chat_id)
+            parts = split_file(file_path)
+            send(bot, "send_message", chat_id, "💡 **Note :** Ouvrez la partie **.001** avec ZArchiver pour tout extraire.")
+            for part in parts:
+                # Chaque partie est lue directement dans le fichier source, sans fichier temporaire
+                with part:
+                    send(bot, "send_document", chat_id, part, timeout=300)
+        else:
+            with open(file_path, 'rb') as f:
+                sent = send_media(bot, chat_id, f, mode)
+            try:
+                save_file_id(bot, video_id, mode, sent_file_id(sent, mode), quality)
+            except Exception:
+                pass  # Le média est envoyé : le cache de file_id est facultatif
+
+        spend_credit(user_id)
+        send(bot, "delete_message", chat_id, message_id)
+
+    except Exception as e:
+        send(bot, "send_message", chat_id, f"❌ Erreur : {str(e)}")
+
+    finally:
+        if file_path and os.path.exists(file_path): os.remove(file_path)
+        # Nettoyage de la mémoire
+        url_storage.pop(link_id, None)
+
 def register_handlers(bot):
 
     @bot.message_handler(commands=['start', 'menu'])
     def send_welcome(message):
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
         markup.add("💰 Mes Crédits", "🛒 Boutique")
-        bot.send_message(message.chat.id, "👋 **Bienvenue sur Genius Bot !**", reply_markup=markup)
+        send(bot, "send_message", message.chat.id, "👋 **Bienvenue sur Genius Bot !**", reply_markup=markup)
 
     @bot.message_handler(func=lambda m: "youtu" in m.text)
     def handle_youtube_link(message):
@@ -45,29 +119,53 @@ def register_handlers(bot):
         
         # SÉCURITÉ : Rate limiting
         if not check_rate_limit(user_id):
-            bot.reply_to(message, "⏱️ **Ralentis !** Attends quelques secondes entre chaque téléchargement.")
+            reply(bot, message, "⏱️ **Ralentis !** Attends quelques secondes entre chaque téléchargement.")
             return
         
         # SÉCURITÉ : Validation de l'URL
         url = sanitize_youtube_url(message.text)
         if not url:
-            bot.reply_to(message, "❌ **URL invalide.** Envoie un lien YouTube valide.")
+            reply(bot, message, "❌ **URL invalide.** Envoie un lien YouTube valide.")
             return
         
         if get_user_data(user_id)['credits'] > 0:
+            # Analyse préalable (mise en cache) : rien n'est téléchargé ni débité si la vidéo est refusée
+            try:
+                meta = probe(url)
+            except VideoUnavailable:
+                reply(bot, message, "❌ **Vidéo indisponible** (privée, supprimée ou introuvable).")
+                return
+            except Exception:
+                meta = None  # Analyse impossible : on laisse le téléchargement décider
+            if meta:
+                error = check_limits(meta)
+                if error:
+                    reply(bot, message, f"🚫 {error}")
+                    return
+
             # On génère un ID court unique pour ce lien (lowercase pour cohérence)
             link_id = str(uuid.uuid4())[:8].lower()
             url_storage[link_id] = url
             
+            modes = allowed_modes(meta) if meta else quality_ladder.MODES
+            icons = {"audio": "🎧", "mp3": "🎵", "mp4": "🎥"}
             markup = types.InlineKeyboardMarkup()
-            # On envoie seulement l'ID court dans le callback_data
-            markup.row(
-                types.InlineKeyboardButton("🎵 MP3", callback_data=f"dl_mp3|{link_id}"),
-                types.InlineKeyboardButton("🎥 MP4", callback_data=f"dl_mp4|{link_id}")
-            )
-            bot.reply_to(message, "✅ **Lien détecté !** Choisissez le format :", reply_markup=markup)
+            # Une ligne par format, un bouton par palier ; ⭐ = le meilleur qui tient dans un envoi Telegram
+            for mode in modes:
+                qualities = allowed_qualities(meta, mode) if meta else quality_ladder.TIERS[mode]
+                default = quality_ladder.default_quality(mode, meta['sizes'] if meta else None)
+                # On envoie seulement l'ID court dans le callback_data
+                markup.row(*[types.InlineKeyboardButton(
+                    f"{'⭐ ' if q == default else ''}{icons[mode]} {quality_ladder.LABELS[q]}",
+                    callback_data=f"dl_{mode}_{q}|{link_id}") for q in qualities])
+            text = "✅ **Lien détecté !** Choisissez le format et la qualité :"
+            if meta:
+                duration = meta['duration']
+                text = (f"✅ **{meta['title']}** ({duration // 60}:{duration % 60:02d})\n"
+                        f"Choisissez le format et la qualité (⭐ = envoi sans découpage) :")
+            reply(bot, message, text, reply_markup=markup)
         else:
-            bot.reply_to(message, "🚫 **Crédits insuffisants.**")
+            reply(bot, message, "🚫 **Crédits insuffisants.**")
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("dl_"))
     def process_selection(call):
@@ -89,47 +187,34 @@ def register_handlers(bot):
             bot.answer_callback_query(call.id, "❌ Lien expiré, veuillez renvoyer le lien.")
             return
 
-        mode = "mp3" if "mp3" in action else "mp4"
+        match = re.match(r'^dl_(audio|mp3|mp4)(?:_([a-z0-9]+))?$', action)
+        if not match:
+            bot.answer_callback_query(call.id, "❌ Données invalides.")
+            return
+        mode, quality = match.groups()
         user_id = call.from_user.id
 
+        # Métadonnées déjà en cache depuis l'envoi du lien : vérification gratuite du palier choisi
+        try:
+            meta = probe(url)
+            if not quality_ladder.is_valid(mode, quality):
+                quality = quality_ladder.default_quality(mode, meta['sizes'])
+            error = check_limits(meta, mode, quality)
+        except Exception:
+            error = None
+        if not quality_ladder.is_valid(mode, quality):
+            quality = quality_ladder.FALLBACK[mode]
+        if error:
+            bot.answer_callback_query(call.id, f"🚫 {error}")
+            return
+
         if get_user_data(user_id)['credits'] > 0:
-            status_msg = bot.send_message(call.message.chat.id, "📡 **Analyse...**")
-            add_to_queue(user_id, url, mode, status_msg.message_id, bot, call.message.chat.id)
-            
-            while get_queue_position(user_id, url) > 1:
-                time.sleep(1)
-            
-            file_path = None
-            try:
-                file_path = download_content(url, mode, bot, call.message.chat.id, status_msg.message_id)
-                file_size = os.path.getsize(file_path)
-
-                if file_size > 45 * 1024 * 1024:
-                    bot.edit_message_text("📦 **Gros fichier.** Découpage en cours...", call.message.chat.id, status_msg.message_id)
-                    parts = split_file(file_path)
-                    bot.send_message(call.message.chat.id, "💡 **Note :** Ouvrez la partie **.001** avec ZArchiver pour tout extraire.")
-                    for p in parts:
-                        with open(p, 'rb') as f:
-                            bot.send_document(call.message.chat.id, f, timeout=300)
-                        if os.path.exists(p): os.remove(p)
-                else:
-                    with open(file_path, 'rb') as f:
-                        if mode == "mp4":
-                            bot.send_video(call.message.chat.id, f, caption="🎥 Vidéo prête !", timeout=300)
-                        else:
-                            bot.send_audio(call.message.chat.id, f, caption="🎵 Audio prêt !", timeout=300)
-
-                spend_credit(user_id)
-                bot.delete_message(call.message.chat.id, status_msg.message_id)
-
-            except Exception as e:
-                bot.send_message(call.message.chat.id, f"❌ Erreur : {str(e)}")
-            
-            finally:
-                if file_path and os.path.exists(file_path): os.remove(file_path)
-                remove_from_queue(user_id, url)
-                # Nettoyage de la mémoire
-                if link_id in url_storage: del url_storage[link_id]
+            chat_id = call.message.chat.id
+            status_msg = send(bot, "send_message", chat_id, "📡 **Analyse...**")
+            # Le téléchargement est exécuté par un créneau du scheduler : ce thread telebot est libéré
+            add_to_queue(user_id, url, mode, status_msg.message_id, bot, chat_id,
+                         job=lambda: run_download(bot, user_id, chat_id, status_msg.message_id, url, mode, link_id,
+                                                  quality))
 
     @bot.message_handler(func=lambda m: m.text == "💰 Mes Crédits")
     def profile(m):
@@ -137,7 +222,7 @@ def register_handlers(bot):
         d = get_user_data(user_id)
         exp = d.get('expiration', '01/03/2026')
         message_profil = (f"👤 **PROFIL**\n🆔 ID : `{user_id}`\n💰 Crédits : **{d['credits']}**\n⏳ Expire le : {exp}")
-        bot.send_message(m.chat.id, message_profil, parse_mode="Markdown")
+        send(bot, "send_message", m.chat.id, message_profil, parse_mode="Markdown")
 
     @bot.message_handler(func=lambda m: m.text == "🛒 Boutique")
     def shop(m):
@@ -0,0 +1,179 @@
+"""
+media_cache.py — Cache disque des médias déjà téléchargés, partagé par le site et le bot.
+
+Clé : identifiant YouTube canonique + mode (mp3/mp4) + qualité. L'index (taille,
+dernier accès, infos yt-dlp) est dans SQLite pour être partagé entre processus ;
+les fichiers sont dans MEDIA_CACHE_DIR. Éviction LRU au-delà de MEDIA_CACHE_MAX_BYTES
+et expiration après MEDIA_CACHE_TTL_SECONDS.
+
+Un hit ne relance ni yt-dlp ni ffmpeg : le fichier est exposé à l'appelant via un
+lien physique (copie en dernier recours), que l'appelant peut supprimer librement.
+"""
+import json
+import os
+import re
+import shutil
+import time
+from urllib.parse import urlparse, parse_qs
+
+import config
+import db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_cache (
+    cache_key   TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    info        TEXT,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_cache_access ON media_cache(last_access);
+"""
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def extract_video_id(url):
+    """Retourne l'identifiant YouTube (11 caractères) d'une URL, ou None."""
+    try:
+        parsed = urlparse(url.strip())
+    except (AttributeError, ValueError):
+        return None
+    host = (parsed.hostname or "").lower()
+    candidate = None
+    if host.endswith("youtu.be"):
+        candidate = parsed.path.lstrip("/").split("/")[0]
+    elif host.endswith("youtube.com"):
+        if parsed.path == "/watch":
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        else:
+            parts = parsed.path.strip("/").split("/")
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+                candidate = parts[1]
+    if candidate and VIDEO_ID_PATTERN.match(candidate):
+        return candidate
+    return None
+
+
+def cache_key(video_id, mode, quality="default"):
+    return f"{video_id}:{mode}:{quality}"
+
+
+def link_copy(src_path, dest_dir, filename=None):
+    """Crée un lien (ou une copie) de `src_path` sous un nom libre de `dest_dir` et le retourne."""
+    filename = filename or os.path.basename(src_path)
+    os.makedirs(dest_dir, exist_ok=True)
+    base, ext = os.path.splitext(filename)
+    for n in range(1, 1000):
+        target = os.path.join(dest_dir, filename if n == 1 else f"{base} ({n}){ext}")
+        try:
+            os.link(src_path, target)
+            return target
+        except FileExistsError:
+            continue
+        except OSError:
+            # Systèmes de fichiers différents ou liens non supportés : copie
+            if os.path.exists(target):
+                continue
+            shutil.copyfile(src_path, target)
+            return target
+    raise FileExistsError(f"Impossible de trouver un nom libre pour {filename}")
+
+
+def _delete_entries(conn, rows):
+    for row in rows:
+        conn.execute("DELETE FROM media_cache WHERE cache_key = ?", (row["cache_key"],))
+        try:
+            os.remove(row["path"])
+        except OSError:
+            pass
+
+
+def get(video_id, mode, quality="default", dest_dir="downloads"):
+    """
+    Cherche le média en cache. Retourne (chemin, infos) avec un chemin propre à
+    l'appelant (à supprimer après usage), ou None si absent/expiré.
+    """
+    if not config.MEDIA_CACHE_ENABLED or not video_id:
+        return None
+    db.ensure_schema("media_cache", SCHEMA)
+    key = cache_key(video_id, mode, quality)
+    conn = db.get_connection()
+    row = conn.execute("SELECT * FROM media_cache WHERE cache_key = ?", (key,)).fetchone()
+    if not row:
+        return None
+    now = time.time()
+    if now - row["created_at"] > config.MEDIA_CACHE_TTL_SECONDS or not os.path.exists(row["path"]):
+        with db.transaction() as conn:
+            _delete_entries(conn, [row])
+        return None
+    try:
+        path = link_copy(row["path"], dest_dir, row["filename"])
+    except FileNotFoundError:
+        return None  # évincé entre-temps par un autre processus
+    conn.execute("UPDATE media_cache SET last_access = ? WHERE cache_key = ?", (now, key))
+    return path, json.loads(row["info"] or "{}")
+
+
+def contains(video_id, mode, quality="default"):
+    """Indique si un média non expiré est en cache, sans l'exposer."""
+    if not config.MEDIA_CACHE_ENABLED or not video_id:
+        return False
+    db.ensure_schema("media_cache", SCHEMA)
+    row = db.get_connection().execute(
+        "SELECT path, created_at FROM media_cache WHERE cache_key = ?", (cache_key(video_id, mode, quality),)
+    ).fetchone()
+    return bool(row) and time.time() - row["created_at"] <= config.MEDIA_CACHE_TTL_SECONDS \
+        and os.path.exists(row["path"])
+
+
+def put(video_id, mode, file_path, info, quality="default"):
+    """Ajoute un fichier fraîchement téléchargé au cache (le fichier d'origine reste à l'appelant)."""
+    if not config.MEDIA_CACHE_ENABLED or not video_id or not os.path.exists(file_path):
+        return
+    db.ensure_schema("media_cache", SCHEMA)
+    os.makedirs(config.MEDIA_CACHE_DIR, exist_ok=True)
+    key = cache_key(video_id, mode, quality)
+    filename = os.path.basename(file_path)
+    ext = os.path.splitext(filename)[1]
+    cached_path = os.path.join(config.MEDIA_CACHE_DIR, f"{video_id}-{mode}-{quality}{ext}")
+    tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+    try:
+        try:
+            os.link(file_path, tmp_path)
+        except OSError:
+            shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    now = time.time()
+    with db.transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO media_cache (cache_key, path, filename, size, info, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, cached_path, filename, os.path.getsize(cached_path), json.dumps(info), now, now)
+        )
+        _evict(conn, now)
+
+
+def _evict(conn, now):
+    """Supprime les entrées expirées puis les moins récemment utilisées au-delà de la taille max."""
+    expired = conn.execute(
+        "SELECT cache_key, path FROM media_cache WHERE created_at < ?",
+        (now - config.MEDIA_CACHE_TTL_SECONDS,)
+    ).fetchall()
+    _delete_entries(conn, expired)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_cache").fetchone()[0]
+    if total <= config.MEDIA_CACHE_MAX_BYTES:
+        return
+    victims = []
+    for row in conn.execute("SELECT cache_key, path, size FROM media_cache ORDER BY last_access"):
+        if total <= config.MEDIA_CACHE_MAX_BYTES:
+            break
+        victims.append(row)
+        total -= row["size"]
+    _delete_entries(conn, victims)
@@ -0,0 +1,150 @@
+"""
+otp_store.py — Codes de vérification email (OTP) à durée de vie limitée.
+
+Un code par email, avec son expiration et son compteur d'essais : émettre ou
+vérifier un code est en O(1) et le compteur est incrémenté sous verrou (ou dans
+une transaction SQLite), deux essais simultanés ne peuvent pas en gagner un.
+Un thread de fond supprime les codes expirés toutes les OTP_SWEEP_INTERVAL
+secondes, même s'ils ne sont jamais vérifiés.
+
+Deux moteurs (OTP_BACKEND) :
+- "memory" : dictionnaire + tas trié par expiration, propre au processus ;
+- "sqlite" : table dans DB_FILE, pour plusieurs workers gunicorn ou un redémarrage.
+"""
+import heapq
+import hmac
+import threading
+import time
+
+import config
+import db
+
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS otp_codes (
+    email       TEXT PRIMARY KEY,
+    otp         TEXT NOT NULL,
+    expires_at  REAL NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_otp_codes_expires ON otp_codes(expires_at);
+"""
+
+
+def _check(entry, otp, now):
+    """
+    Applique les règles de vérification à `entry` (dict otp / expires_at / attempts ou None).
+    Retourne (ok, raison, action) avec action : "delete", "increment" ou None.
+    """
+    if entry is None:
+        return False, "Code de vérification non trouvé ou expiré.", None
+    if now > entry["expires_at"]:
+        return False, "Code de vérification expiré. Demandez-en un nouveau.", "delete"
+    if entry["attempts"] >= MAX_ATTEMPTS:
+        return False, "Trop de tentatives. Demandez un nouveau code.", "delete"
+    if not hmac.compare_digest(entry["otp"], otp):
+        attempts_left = MAX_ATTEMPTS - entry["attempts"] - 1
+        return False, f"Code incorrect. Tentatives restantes : {attempts_left}", "increment"
+    return True, "", "delete"
+
+
+class MemoryOTPStore:
+    """Codes en mémoire ; les expirations sont indexées par un tas pour la purge."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}      # email -> {"otp", "expires_at", "attempts"}
+        self._expiries = []   # tas de (expires_at, email)
+
+    def put(self, email, otp, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._codes[email] = {"otp": otp, "expires_at": expires_at, "attempts": 0}
+            heapq.heappush(self._expiries, (expires_at, email))
+
+    def verify(self, email, otp):
+        with self._lock:
+            entry = self._codes.get(email)
+            ok, reason, action = _check(entry, otp, time.time())
+            if action == "delete":
+                del self._codes[email]
+            elif action == "increment":
+                entry["attempts"] += 1
+        return ok, reason
+
+    def discard(self, email):
+        with self._lock:
+            self._codes.pop(email, None)
+
+    def sweep(self):
+        """Supprime les codes expirés ; retourne leur nombre."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                expires_at, email = heapq.heappop(self._expiries)
+                entry = self._codes.get(email)
+                # Le code a pu être remplacé (renvoi) ou déjà consommé depuis
+                if entry is not None and entry["expires_at"] == expires_at:
+                    del self._codes[email]
+                    removed += 1
+        return removed
+
+
+class SQLiteOTPStore:
+    """Codes dans la base SQLite commune, partagés par tous les processus."""
+
+    def __init__(self, path=None):
+        self.path = path or config.DB_FILE
+        db.ensure_schema("otp_codes", SCHEMA, self.path)
+
+    def put(self, email, otp, ttl):
+        with db.transaction(self.path) as conn:
+            conn.execute("INSERT INTO otp_codes (email, otp, expires_at, attempts) VALUES (?, ?, ?, 0) "
+                         "ON CONFLICT(email) DO UPDATE SET otp = excluded.otp, expires_at = excluded.expires_at, "
+                         "attempts = 0", (email, otp, time.time() + ttl))
+
+    def verify(self, email, otp):
+        with db.transaction(self.path) as conn:
+            row = conn.execute("SELECT otp, expires_at, attempts FROM otp_codes WHERE email = ?",
+                               (email,)).fetchone()
+            ok, reason, action = _check(dict(row) if row else None, otp, time.time())
+            if action == "delete":
+                conn.execute("DELETE FROM otp_codes WHERE email = ?", (email,))
+            elif action == "increment":
+                conn.execute("UPDATE otp_codes SET attempts = attempts + 1 WHERE email = ?", (email,))
+        return ok, reason
+
+    def discard(self, email):
+        with db.transaction(self.path) as conn:
+            conn.execute("DELETE FROM otp_codes WHERE email = ?", (email,))
+
+    def sweep(self):
+        with db.transaction(self.path) as conn:
+            return conn.execute("DELETE FROM otp_codes WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _sweep_loop(store):
+    while True:
+        time.sleep(config.OTP_SWEEP_INTERVAL)
+        try:
+            store.sweep()
+        except Exception:
+            pass   # base momentanément indisponible : nouvel essai au prochain tour
+
+
+def get_store():
+    """Retourne le store configuré (OTP_BACKEND) et démarre sa purge au premier accès."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = SQLiteOTPStore() if config.OTP_BACKEND == "sqlite" else MemoryOTPStore()
+                threading.Thread(target=_sweep_loop, args=(store,), daemon=True, name="otp-sweep").start()
+                _store = store
+    return _store
@@ -0,0 +1,72 @@
+"""
+progress_reporter.py — Diffusion limitée et regroupée des progressions de téléchargement.
+
+Les hooks yt-dlp se déclenchent plusieurs fois par seconde. Le reporter ne garde que
+la dernière valeur de chaque clé (message Telegram, job web, ...) et l'émet depuis
+son propre thread, au plus une fois par intervalle, et seulement si le rendu a changé.
+"""
+import threading
+import time
+
+
+class ProgressReporter:
+    """Regroupe les mises à jour par clé et les émet au plus une fois par `interval` secondes."""
+
+    def __init__(self, interval, name="progress-reporter"):
+        self.interval = interval
+        self.name = name
+        self._pending = {}   # clé -> (payload, sink, signature)
+        self._last = {}      # clé -> (signature émise, instant d'émission)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def report(self, key, payload, sink, signature=None):
+        """
+        Enregistre la dernière progression pour `key` ; `sink(payload)` sera appelé
+        plus tard depuis le thread du reporter. `signature` (par défaut le payload)
+        sert à ignorer les mises à jour dont le rendu n'a pas changé.
+        """
+        signature = payload if signature is None else signature
+        with self._lock:
+            last = self._last.get(key)
+            if last and last[0] == signature:
+                self._pending.pop(key, None)
+                return
+            self._pending[key] = (payload, sink, signature)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+                self._thread.start()
+        self._wake.set()
+
+    def discard(self, key):
+        """Oublie la clé (ex : message supprimé ou job terminé) sans émettre ce qui reste en attente."""
+        with self._lock:
+            self._pending.pop(key, None)
+            self._last.pop(key, None)
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            now = time.monotonic()
+            due = []
+            next_due = None
+            with self._lock:
+                for key, (payload, sink, signature) in list(self._pending.items()):
+                    last = self._last.get(key)
+                    ready_at = last[1] + self.interval if last else now
+                    if ready_at <= now:
+                        del self._pending[key]
+                        self._last[key] = (signature, now)
+                        due.append((sink, payload))
+                    elif next_due is None or ready_at < next_due:
+                        next_due = ready_at
+            for sink, payload in due:
+                try:
+                    sink(payload)
+                except Exception:
+                    pass  # Une erreur d'affichage ne doit jamais interrompre les autres
+            if next_due is not None:
+                time.sleep(max(0.0, min(next_due - time.monotonic(), self.interval)))
+                self._wake.set()
@@ -0,0 +1,179 @@
+"""
+purchase_store.py — Demandes d'achat de crédits (site et bot), remplace pending_purchases.log.
+
+Chaque demande est une ligne SQLite (WAL) : pending -> approved | rejected | closed
+(close : clôturée par l'admin sans crédit ni message). Les transitions sont conditionnelles (WHERE status = 'pending') : un double clic sur
+ACCEPTER ne crédite qu'une fois. Les index par utilisateur et par statut gardent
+rapides la liste des notifications, leur effacement et l'arriéré de l'admin.
+
+Migration unique depuis l'ancien `pending_purchases.log` :
+    python purchase_store.py
+Le journal n'était jamais purgé (les achats validés y restaient) : ses lignes sont
+importées comme `closed`, pour l'historique. Un ancien bouton ACCEPTER/REFUSER encore
+en attente recrée sa demande au clic.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import config
+import db
+
+PENDING_LOG = "pending_purchases.log"
+
+PENDING = "pending"
+APPROVED = "approved"
+REJECTED = "rejected"
+CLOSED = "closed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchase_requests (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id      TEXT NOT NULL,
+    pack         TEXT NOT NULL,
+    source       TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'approved', 'rejected', 'closed')),
+    created_at   INTEGER NOT NULL,
+    resolved_at  INTEGER,
+    resolved_by  TEXT,
+    dismissed    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_purchase_requests_user ON purchase_requests(user_id, status);
+CREATE INDEX IF NOT EXISTS idx_purchase_requests_status ON purchase_requests(status, created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key          TEXT PRIMARY KEY,
+    value        TEXT
+);
+"""
+
+
+class SQLitePurchaseStore:
+    """Demandes d'achat indexées par utilisateur et par statut."""
+
+    def __init__(self, path=None):
+        self.path = path or config.DB_FILE
+        db.ensure_schema("purchase_requests", SCHEMA, self.path)
+
+    def create(self, user_id, pack, source):
+        """Enregistre une demande en attente et retourne son id."""
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("INSERT INTO purchase_requests (user_id, pack, source, created_at) VALUES (?, ?, ?, ?)",
+                               (str(user_id), str(pack), source, int(time.time())))
+        return cur.lastrowid
+
+    def get(self, request_id):
+        row = db.get_connection(self.path).execute(
+            "SELECT * FROM purchase_requests WHERE id = ?", (request_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _resolve(self, request_id, status, resolved_by):
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("UPDATE purchase_requests SET status = ?, resolved_at = ?, resolved_by = ? "
+                               "WHERE id = ? AND status = 'pending'",
+                               (status, int(time.time()), resolved_by, request_id))
+        return cur.rowcount == 1
+
+    def approve(self, request_id, resolved_by=None):
+        """Passe la demande à approved ; False si elle n'était plus en attente (rien n'a changé)."""
+        return self._resolve(request_id, APPROVED, resolved_by)
+
+    def reject(self, request_id, resolved_by=None):
+        """Passe la demande à rejected ; False si elle n'était plus en attente (rien n'a changé)."""
+        return self._resolve(request_id, REJECTED, resolved_by)
+
+    def close(self, request_id, resolved_by=None):
+        """Clôture la demande sans suite (ni crédit ni message) ; False si elle n'était plus en attente."""
+        return self._resolve(request_id, CLOSED, resolved_by)
+
+    def reopen(self, request_id):
+        """Remet en attente une demande approuvée dont le crédit a échoué."""
+        with db.transaction(self.path) as conn:
+            conn.execute("UPDATE purchase_requests SET status = 'pending', resolved_at = NULL, resolved_by = NULL "
+                         "WHERE id = ?", (request_id,))
+
+    def find_pending(self, user_id, pack=None):
+        """Id de la plus ancienne demande en attente de l'utilisateur (pour ce pack), ou None."""
+        query = "SELECT id FROM purchase_requests WHERE user_id = ? AND status = 'pending'"
+        args = [str(user_id)]
+        if pack is not None:
+            query += " AND pack = ?"
+            args.append(str(pack))
+        row = db.get_connection(self.path).execute(query + " ORDER BY id LIMIT 1", args).fetchone()
+        return row["id"] if row else None
+
+    def pending_for_user(self, user_id):
+        """Demandes en attente que l'utilisateur n'a pas masquées, plus récentes d'abord."""
+        rows = db.get_connection(self.path).execute(
+            "SELECT * FROM purchase_requests WHERE user_id = ? AND status = 'pending' AND dismissed = 0 "
+            "ORDER BY id DESC", (str(user_id),)).fetchall()
+        return [dict(row) for row in rows]
+
+    def dismiss_pending(self, user_id):
+        """Masque les demandes en attente de l'utilisateur (elles restent à traiter côté admin)."""
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("UPDATE purchase_requests SET dismissed = 1 "
+                               "WHERE user_id = ? AND status = 'pending' AND dismissed = 0", (str(user_id),))
+        return cur.rowcount
+
+    def backlog(self, limit=10):
+        """Nombre de demandes par statut et les `limit` plus anciennes en attente."""
+        conn = db.get_connection(self.path)
+        counts = {status: 0 for status in (PENDING, APPROVED, REJECTED, CLOSED)}
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM purchase_requests GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        oldest = conn.execute("SELECT * FROM purchase_requests WHERE status = 'pending' "
+                              "ORDER BY created_at LIMIT ?", (limit,)).fetchall()
+        return counts, [dict(row) for row in oldest]
+
+    def migrate_from_log(self, log_file=PENDING_LOG):
+        """
+        Importe (une seule fois) `pending_purchases.log` comme demandes web clôturées :
+        le journal mêle demandes traitées et non traitées, sans moyen de les distinguer.
+        Retourne le nombre de demandes importées (0 si déjà fait).
+        """
+        if not os.path.exists(log_file):
+            return 0
+        rows = []
+        with open(log_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("user") and entry.get("pack"):
+                    rows.append((str(entry["user"]), str(entry["pack"]), "web", CLOSED,
+                                 int(entry.get("ts", 0) or 0), int(time.time()), "migration"))
+        with db.transaction(self.path) as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'pending_log_migrated'").fetchone():
+                return 0
+            conn.executemany("INSERT INTO purchase_requests (user_id, pack, source, status, created_at, resolved_at, "
+                             "resolved_by, dismissed) VALUES (?, ?, ?, ?, ?, ?, ?, 1)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('pending_log_migrated', ?)",
+                         (datetime.utcnow().isoformat() + "Z",))
+        return len(rows)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Retourne le store des demandes d'achat, migrant l'ancien journal au premier accès."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = SQLitePurchaseStore()
+                store.migrate_from_log()
+                _store = store
+    return _store
+
+
+if __name__ == "__main__":
+    n_requests = SQLitePurchaseStore().migrate_from_log()
+    if n_requests:
+        print(f"✅ Migration terminée : {n_requests} demandes importées dans {config.DB_FILE}")
+    else:
+        print("ℹ️ Migration déjà effectuée (ou aucune donnée à importer).")
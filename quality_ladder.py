@@ -0,0 +1,143 @@
+"""
+quality_ladder.py — Formats proposés (audio natif / MP3 / MP4) et leurs paliers de qualité.
+
+Le format 'audio' livre la piste audio native de YouTube (m4a, sinon opus) sans
+ré-encodage ; le MP3 (conversion ffmpeg) reste disponible sur demande. Chaque palier
+donne la sélection de format yt-dlp (et le débit de conversion pour le MP3) ; en MP4,
+la meilleure vidéo du palier est fusionnée avec la piste audio (ffmpeg), les formats
+progressifs dépassant rarement 360p. Le palier par défaut est le meilleur dont la
+taille estimée tient sous la limite d'envoi Telegram (TELEGRAM_UPLOAD_LIMIT) : la
+plupart des fichiers partent sans découpage ZIP, et un fichier plus petit se
+télécharge, se convertit et s'envoie plus vite.
+"""
+import config
+
+# Formats dans l'ordre de présentation, paliers du meilleur au plus léger
+TIERS = {
+    'audio': ['best', 'low'],
+    'mp3': ['192k', '128k', '64k'],
+    'mp4': ['best', '720p', '480p', '360p'],
+}
+LABELS = {
+    '192k': '192 kbps', '128k': '128 kbps', '64k': '64 kbps',
+    'best': 'Max', 'low': 'Léger', '720p': '720p', '480p': '480p', '360p': '360p',
+}
+MODES = list(TIERS)
+# Extensions audio natives livrées telles quelles (le reste est remuxé, voir audio_container)
+NATIVE_AUDIO_EXTS = ('m4a', 'mp3', 'opus', 'ogg')
+# Codec audio -> (extension, format ffmpeg) du conteneur qui l'accepte sans ré-encodage
+AUDIO_CONTAINERS = {'opus': ('opus', 'ogg'), 'vorbis': ('ogg', 'ogg'), 'mp4a': ('m4a', 'ipod'),
+                    'aac': ('m4a', 'ipod'), 'mp3': ('mp3', 'mp3')}
+# Palier retenu quand aucune taille n'a pu être estimée
+FALLBACK = {'audio': 'best', 'mp3': '128k', 'mp4': '480p'}
+
+
+def is_valid(mode, quality):
+    return quality in TIERS.get(mode, ())
+
+
+def audio_bitrate(quality):
+    """Débit (kbps) d'un palier MP3."""
+    return int(quality[:-1])
+
+
+def audio_container(acodec):
+    """(extension, format ffmpeg) pour remuxer ce codec audio sans ré-encodage, ou None si inconnu."""
+    return AUDIO_CONTAINERS.get((acodec or '').split('.')[0].lower())
+
+
+def format_spec(mode, quality):
+    """Sélection de format yt-dlp pour ce palier."""
+    if mode == 'audio':
+        # m4a (AAC) d'abord : lu partout, y compris par le lecteur audio de Telegram
+        if quality == 'best':
+            return 'bestaudio[ext=m4a]/bestaudio/best'
+        return 'worstaudio[ext=m4a]/worstaudio/worst'
+    if mode == 'mp3':
+        # Source audio la plus proche du débit visé : moins d'octets à télécharger
+        return f"bestaudio[abr<={int(audio_bitrate(quality) * 1.25)}]/bestaudio/best"
+    # Vidéo et audio séparés puis fusionnés en mp4 (merge_output_format du profil 'mp4') :
+    # les formats progressifs s'arrêtent le plus souvent à 360p
+    if quality == 'best':
+        return 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best[ext=mp4]/best'
+    height = int(quality[:-1])
+    return (f"bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<={height}]+bestaudio"
+            f"/best[height<={height}]/worst[ext=mp4]/worst")
+
+
+def _best_by_height(formats, height=None):
+    candidates = [f for f in formats if height is None or (f.get('height') or 0) <= height]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+
+
+def _mp4_formats(info, height=None):
+    """Formats que choisirait `format_spec('mp4', ...)` : [vidéo, audio] fusionnés, sinon [progressif]."""
+    formats = info.get('formats') or []
+    videos = [f for f in formats if f.get('vcodec') not in (None, 'none') and f.get('acodec') == 'none']
+    video = _best_by_height([f for f in videos if f.get('ext') == 'mp4'], height) \
+        or _best_by_height(videos, height)
+    audio = _native_audio(info)
+    if video and audio:
+        return [video, audio]
+    progressive = [f for f in formats
+                   if f.get('vcodec') not in (None, 'none') and f.get('acodec') not in (None, 'none')]
+    fmt = _best_by_height(progressive, height)
+    return [fmt] if fmt else []
+
+
+def mp4_height(info, quality):
+    """Hauteur (pixels, 0 si inconnue) que livrerait le téléchargement complet de ce palier MP4."""
+    formats = _mp4_formats(info, None if quality == 'best' else int(quality[:-1]))
+    return formats[0].get('height') or 0 if formats else 0
+
+
+def _native_audio(info, best=True):
+    """Piste audio seule que choisirait `format_spec('audio', ...)`."""
+    tracks = [f for f in info.get('formats') or []
+              if f.get('acodec') not in (None, 'none') and f.get('vcodec') in (None, 'none')]
+    tracks = [f for f in tracks if f.get('ext') == 'm4a'] or tracks
+    if not tracks:
+        return None
+    pick = max if best else min
+    return pick(tracks, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+
+
+def estimate_sizes(info):
+    """Taille estimée (octets, 0 si inconnue) de chaque palier : {mode: {palier: taille}}."""
+    duration = info.get('duration') or 0
+    sizes = {'audio': {},
+             'mp3': {q: int(duration * audio_bitrate(q) * 1000 / 8) for q in TIERS['mp3']},
+             'mp4': {}}
+    for q in TIERS['audio']:
+        fmt = _native_audio(info, best=q == 'best')
+        sizes['audio'][q] = (fmt.get('filesize') or fmt.get('filesize_approx')
+                             or int((fmt.get('abr') or fmt.get('tbr') or 0) * 1000 / 8 * duration)) if fmt else 0
+    for q in TIERS['mp4']:
+        formats = _mp4_formats(info, None if q == 'best' else int(q[:-1]))
+        size = 0
+        if formats:
+            size = sum(fmt.get('filesize') or fmt.get('filesize_approx')
+                       or int((fmt.get('tbr') or fmt.get('abr') or 0) * 1000 / 8 * duration)
+                       for fmt in formats)
+        elif q == 'best':
+            size = info.get('filesize') or info.get('filesize_approx') or 0
+        sizes['mp4'][q] = size
+    return sizes
+
+
+def default_quality(mode, sizes=None, limit=None):
+    """
+    Meilleur palier dont la taille estimée tient sous `limit` (par défaut la limite
+    d'envoi Telegram) ; le plus léger si aucun ne tient, FALLBACK si rien n'est estimé.
+    """
+    limit = config.TELEGRAM_UPLOAD_LIMIT if limit is None else limit
+    sizes = (sizes or {}).get(mode) or {}
+    known = [q for q in TIERS[mode] if sizes.get(q)]
+    if not known:
+        return FALLBACK[mode]
+    for q in known:
+        if sizes[q] <= limit:
+            return q
+    return known[-1]
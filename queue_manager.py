@@ -1,50 +1,131 @@
 import threading
-import time
+import itertools
+from collections import OrderedDict, deque
 
-download_queue = []
+import config
+import telegram_dispatcher
+
+# File d'attente par utilisateur (ordre d'insertion = ordre du tourniquet)
+_waiting = OrderedDict()   # user_id -> deque de tâches
+_running = {}              # task_id -> tâche
+_running_per_user = {}     # user_id -> nb de téléchargements en cours
 queue_lock = threading.Lock()
+_queue_cond = threading.Condition(queue_lock)
+_task_ids = itertools.count(1)
+_workers = []
 
-def add_to_queue(user_id, url, mode, message_id, bot, chat_id):
-    """Ajoute à la file avec les infos pour la mise à jour réelle."""
-    with queue_lock:
+def _ordered_waiting():
+    """Ordre dans lequel les tâches en attente seront servies (tourniquet entre utilisateurs)."""
+    queues = [list(q) for q in _waiting.values()]
+    ordered = []
+    for rank in range(max((len(q) for q in queues), default=0)):
+        ordered.extend(q[rank] for q in queues if rank < len(q))
+    return ordered
+
+def _pick_next_task():
+    """Prend la prochaine tâche équitable (doit être appelé sous queue_lock)."""
+    for user_id, tasks in _waiting.items():
+        if _running_per_user.get(user_id, 0) >= config.MAX_DOWNLOADS_PER_USER:
+            continue
+        task = tasks.popleft()
+        # L'utilisateur passe en fin de tourniquet s'il lui reste des tâches
+        del _waiting[user_id]
+        if tasks:
+            _waiting[user_id] = tasks
+        return task
+    return None
+
+def _worker_loop():
+    while True:
+        with _queue_cond:
+            task = _pick_next_task()
+            while task is None:
+                _queue_cond.wait()
+                task = _pick_next_task()
+            task['status'] = "running"
+            _running[task['id']] = task
+            _running_per_user[task['user_id']] = _running_per_user.get(task['user_id'], 0) + 1
+        update_queue_display()
+        try:
+            task['job']()
+        except Exception:
+            pass  # Le job gère et affiche ses propres erreurs
+        finally:
+            with _queue_cond:
+                _running.pop(task['id'], None)
+                _running_per_user[task['user_id']] -= 1
+                if not _running_per_user[task['user_id']]:
+                    del _running_per_user[task['user_id']]
+                _queue_cond.notify()
+            update_queue_display()
+
+def _ensure_workers():
+    """Démarre les BOT_DOWNLOAD_SLOTS workers au premier ajout (doit être appelé sous queue_lock)."""
+    while len(_workers) < config.BOT_DOWNLOAD_SLOTS:
+        worker = threading.Thread(target=_worker_loop, daemon=True, name=f"dl-slot-{len(_workers) + 1}")
+        worker.start()
+        _workers.append(worker)
+
+def add_to_queue(user_id, url, mode, message_id, bot, chat_id, job):
+    """
+    Ajoute à la file avec les infos pour la mise à jour réelle.
+    `job` (callable sans argument) est exécuté par un worker quand un créneau se libère ;
+    la fonction rend la main immédiatement. Retourne la position dans la file.
+    """
+    with _queue_cond:
         task = {
+            "id": next(_task_ids),
             "user_id": user_id,
             "url": url,
             "mode": mode,
             "message_id": message_id,
             "bot": bot,
             "chat_id": chat_id,
+            "job": job,
             "status": "waiting"
         }
-        download_queue.append(task)
-        return len(download_queue)
+        _waiting.setdefault(user_id, deque()).append(task)
+        _ensure_workers()
+        _queue_cond.notify()
+        position = _ordered_waiting().index(task) + 1
+    update_queue_display()
+    return position
 
 def update_queue_display():
     """Met à jour les messages de tous ceux qui attendent."""
     with queue_lock:
-        for i, task in enumerate(download_queue):
-            pos = i + 1
-            if pos == 1:
-                text = "🚀 **C'est votre tour !**\nPréparation du téléchargement..."
-            else:
-                text = f"⏳ **File d'attente...**\nVotre position : **{pos}** / {len(download_queue)}"
-            
-            try:
-                task['bot'].edit_message_text(text, task['chat_id'], task['message_id'])
-            except:
-                pass # Évite les erreurs si le message est déjà identique
+        waiting = _ordered_waiting()
+        started = [t for t in _running.values() if not t.get('announced')]
+        for task in started:
+            task['announced'] = True
+    updates = [(task, "🚀 **C'est votre tour !**\nPréparation du téléchargement...") for task in started]
+    for i, task in enumerate(waiting):
+        text = f"⏳ **File d'attente...**\nVotre position : **{i + 1}** / {len(waiting)}"
+        if task.get('last_text') != text:
+            task['last_text'] = text
+            updates.append((task, text))
+    for task, text in updates:
+        # Envoi différé et limité ; les erreurs (message identique, supprimé...) sont ignorées
+        telegram_dispatcher.submit(task['bot'], "edit_message_text", text, task['chat_id'], task['message_id'],
+                                   target_chat=task['chat_id'])
 
 def remove_from_queue(user_id, url):
-    """Supprime et lance la mise à jour pour les suivants."""
+    """Retire les demandes encore en attente et lance la mise à jour pour les suivants."""
     with queue_lock:
-        global download_queue
-        download_queue = [t for t in download_queue if not (t['user_id'] == user_id and t['url'] == url)]
+        tasks = _waiting.get(user_id)
+        if tasks:
+            remaining = deque(t for t in tasks if t['url'] != url)
+            if remaining:
+                _waiting[user_id] = remaining
+            else:
+                del _waiting[user_id]
     # Mise à jour immédiate des positions pour les autres
     update_queue_display()
 
 def get_queue_position(user_id, url):
+    """Position dans la file d'attente (0 si absent ou déjà en cours)."""
     with queue_lock:
-        for i, task in enumerate(download_queue):
+        for i, task in enumerate(_ordered_waiting()):
             if task['user_id'] == user_id and task['url'] == url:
                 return i + 1
-    return 0
\ No newline at end of file
+    return 0
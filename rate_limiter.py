@@ -0,0 +1,143 @@
+"""
+rate_limiter.py — Limitation de débit (GCRA) partagée par le site et le bot.
+
+Chaque clé (IP, utilisateur Telegram...) ne coûte qu'un nombre : l'heure théorique
+d'arrivée (TAT) de la prochaine requête. Une limite « N requêtes par période P »
+espace les requêtes de P/N secondes et tolère une rafale de N : vérifier et
+enregistrer une requête est en O(1), sans liste d'horodatages.
+
+Deux moteurs (RATE_LIMIT_BACKEND) :
+- "memory" : dictionnaires répartis en SHARDS morceaux, chacun avec son verrou ;
+  les clés inactives (TAT dépassé) sont purgées au fil des accès ;
+- "sqlite" : table partagée dans DB_FILE, pour que la limite tienne entre
+  plusieurs workers gunicorn.
+"""
+import threading
+import time
+import zlib
+
+import config
+import db
+
+SHARDS = 16
+SWEEP_INTERVAL = 60   # secondes entre deux purges des clés inactives (par shard / par processus)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_limits_tat ON rate_limits(tat);
+"""
+
+
+def _gcra(tat, now, interval, tolerance, consume):
+    """Retourne (autorisé, nouveau TAT, attente en secondes) pour une requête arrivant à `now`."""
+    tat = max(tat or now, now)
+    wait = tat - now - tolerance
+    if wait > 0:
+        return False, None, wait
+    return True, tat + interval if consume else None, 0.0
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = {}
+        self.next_sweep = 0.0
+
+
+class MemoryBackend:
+    """TAT en mémoire du processus, répartis par hachage de la clé."""
+
+    def __init__(self, shards=SHARDS):
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def acquire(self, key, interval, tolerance, consume=True):
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            if now >= shard.next_sweep:
+                # Une clé dont le TAT est passé équivaut à une clé absente
+                shard.tats = {k: t for k, t in shard.tats.items() if t > now}
+                shard.next_sweep = now + SWEEP_INTERVAL
+            allowed, tat, wait = _gcra(shard.tats.get(key), now, interval, tolerance, consume)
+            if tat is not None:
+                shard.tats[key] = tat
+        return allowed, wait
+
+    def size(self):
+        return sum(len(shard.tats) for shard in self._shards)
+
+
+class SQLiteBackend:
+    """TAT dans la base SQLite commune : une limite pour tous les processus."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._next_sweep = 0.0
+        db.ensure_schema("rate_limits", SCHEMA, path)
+
+    def acquire(self, key, interval, tolerance, consume=True):
+        now = time.time()
+        with db.transaction(self.path) as conn:
+            if now >= self._next_sweep:
+                conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+                self._next_sweep = now + SWEEP_INTERVAL
+            row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            allowed, tat, wait = _gcra(row["tat"] if row else None, now, interval, tolerance, consume)
+            if tat is not None:
+                conn.execute("INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                             "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat", (key, tat))
+        return allowed, wait
+
+    def size(self):
+        return db.get_connection(self.path).execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Retourne le moteur configuré (RATE_LIMIT_BACKEND), créé au premier accès."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if config.RATE_LIMIT_BACKEND == "sqlite":
+                    _backend = SQLiteBackend()
+                else:
+                    _backend = MemoryBackend()
+    return _backend
+
+
+class RateLimiter:
+    """
+    Au plus `limit` requêtes par `period` secondes et par clé :
+        login_limiter = RateLimiter("login", 10, 60)
+        if not login_limiter.hit(ip): ...
+    """
+
+    def __init__(self, name, limit, period):
+        self.name = name
+        self.interval = period / limit
+        self.tolerance = period - self.interval
+
+    def _acquire(self, key, consume):
+        return get_backend().acquire(f"{self.name}:{key}", self.interval, self.tolerance, consume)
+
+    def hit(self, key):
+        """Enregistre une requête de `key` ; False (et rien n'est compté) si la limite est atteinte."""
+        return self._acquire(key, True)[0]
+
+    def blocked(self, key):
+        """Vrai si la prochaine requête de `key` serait refusée (sans la compter)."""
+        return not self._acquire(key, False)[0]
+
+    def retry_after(self, key):
+        """Secondes à attendre avant que `key` puisse refaire une requête (0 si tout de suite)."""
+        return self._acquire(key, False)[1]
@@ -1,16 +1,140 @@
+"""
+robust_engine.py — Choix adaptatif de la configuration de contournement yt-dlp.
+
+Chaque profil (client YouTube + user agent assorti) a un tableau de scores : taux de
+réussite, latence moyenne (temps avant le premier octet ou durée de l'analyse) et
+échecs consécutifs. Le meilleur profil disponible est préféré ; un profil qui échoue
+est mis de côté avec un délai croissant. Les timeouts sont courts : un profil bloqué
+échoue vite et le téléchargement est relancé avec le profil suivant.
+"""
 import random
+import threading
+import time
+
+import config
+
+USER_AGENTS = {
+    'desktop': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'android': 'Mozilla/5.0 (Android 14; Mobile; rv:122.0) Gecko/122.0 Firefox/122.0',
+    'iphone': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1',
+}
+
+# nom -> (clients YouTube, user agent)
+PROFILES = {
+    'android-ios': (['android', 'ios'], 'android'),
+    'ios': (['ios'], 'iphone'),
+    'android': (['android'], 'android'),
+    'mweb': (['mweb'], 'iphone'),
+    'tv': (['tv'], 'desktop'),
+    'web': (['web'], 'desktop'),
+}
+DEFAULT_PROFILE = 'android-ios'
+
+# Erreurs liées à la vidéo elle-même : changer de profil n'y changera rien
+PERMANENT_ERRORS = ('private video', 'video unavailable', 'has been removed', 'members-only',
+                    'not available in your country', 'is not a valid url', 'live event will begin',
+                    'requested format is not available')
+
+LATENCY_SMOOTHING = 0.3      # poids de la dernière mesure dans la moyenne de latence
+EXPLORATION_RATE = 0.05      # part des choix faits au hasard pour réévaluer les autres profils
+
+
+class _Score:
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None          # secondes, moyenne mobile
+        self.backoff_until = 0.0
+
+    def success_rate(self):
+        # Lissage de Laplace : un profil jamais essayé vaut 50 %
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def value(self):
+        latency = self.latency if self.latency is not None else config.STRATEGY_REFERENCE_LATENCY
+        return self.success_rate() / (1 + latency / config.STRATEGY_REFERENCE_LATENCY)
+
+
+_scores = {name: _Score() for name in PROFILES}
+_lock = threading.Lock()
+
+
+def is_permanent_error(exc):
+    """Vrai si l'erreur vient de la vidéo (privée, supprimée...) et non du profil utilisé."""
+    message = str(exc).lower()
+    return any(marker in message for marker in PERMANENT_ERRORS)
+
+
+def choose_profile(exclude=()):
+    """Meilleur profil disponible (hors `exclude`) ; le moins pénalisé si tous sont en pause."""
+    now = time.monotonic()
+    with _lock:
+        candidates = [name for name in PROFILES if name not in exclude]
+        if not candidates:
+            return None
+        ready = [name for name in candidates if _scores[name].backoff_until <= now]
+        if not ready:
+            return min(candidates, key=lambda name: _scores[name].backoff_until)
+        if len(ready) > 1 and random.random() < EXPLORATION_RATE:
+            return random.choice(ready)
+        return max(ready, key=lambda name: (_scores[name].value(), name == DEFAULT_PROFILE))
+
+
+def profiles_to_try(attempts=None):
+    """Génère jusqu'à `attempts` profils différents, du meilleur au suivant, pour un même job."""
+    tried = []
+    for _ in range(attempts or config.STRATEGY_MAX_ATTEMPTS):
+        name = choose_profile(exclude=tried)
+        if name is None:
+            return
+        tried.append(name)
+        yield name
+
+
+def record_success(profile, latency=None):
+    with _lock:
+        score = _scores[profile]
+        score.successes += 1
+        score.consecutive_failures = 0
+        score.backoff_until = 0.0
+        if latency is not None:
+            score.latency = latency if score.latency is None else \
+                (1 - LATENCY_SMOOTHING) * score.latency + LATENCY_SMOOTHING * latency
+
+
+def record_failure(profile):
+    with _lock:
+        score = _scores[profile]
+        score.failures += 1
+        score.consecutive_failures += 1
+        delay = min(config.STRATEGY_BACKOFF_BASE * 2 ** (score.consecutive_failures - 1),
+                    config.STRATEGY_BACKOFF_MAX)
+        score.backoff_until = time.monotonic() + delay
+
+
+def scoreboard():
+    """État de chaque profil, du meilleur au moins bon."""
+    now = time.monotonic()
+    with _lock:
+        rows = [{
+            'profile': name,
+            'successes': score.successes,
+            'failures': score.failures,
+            'success_rate': round(score.success_rate(), 3),
+            'latency': round(score.latency, 2) if score.latency is not None else None,
+            'backoff': round(max(0.0, score.backoff_until - now)),
+            'score': round(score.value(), 3),
+        } for name, score in _scores.items()]
+    return sorted(rows, key=lambda row: row['score'], reverse=True)
+
 
-def get_bypass_config():
-    """Retourne la configuration de contournement la plus puissante actuelle."""
-    
-    user_agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (Android 14; Mobile; rv:122.0) Gecko/122.0 Firefox/122.0',
-        'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1'
-    ]
+def get_bypass_config(profile=None):
+    """Retourne la configuration de contournement du profil donné (par défaut : le meilleur actuel)."""
+    clients, user_agent = PROFILES[profile or choose_profile()]
 
     return {
-        'user_agent': random.choice(user_agents),
+        'user_agent': USER_AGENTS[user_agent],
         'referer': 'https://www.youtube.com/',
         'http_headers': {
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
@@ -22,10 +146,9 @@ def get_bypass_config():
         },
         'nocheckcertificate': True,
         'geo_bypass': True,
-        # FORCE LE CLIENT ANDROID (Moins de blocage que le Web)
-        'extractor_args': {'youtube': {'player_client': ['android', 'ios']}},
-        # GESTION DES TIMEOUTS (Évite que Termux ne bloque)
-        'socket_timeout': 60,
-        'retries': 10,
-        'fragment_retries': 10,
-    }
\ No newline at end of file
+        'extractor_args': {'youtube': {'player_client': list(clients)}},
+        # Timeouts courts : un profil bloqué échoue vite, on passe au suivant
+        'socket_timeout': config.STRATEGY_SOCKET_TIMEOUT,
+        'retries': config.STRATEGY_RETRIES,
+        'fragment_retries': config.STRATEGY_RETRIES,
+    }
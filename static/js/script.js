@@ -175,9 +175,10 @@ document.addEventListener('DOMContentLoaded', function () {
     if(e.key === 'Escape') closeSidebar();
   });
 
-  // === Notification badge auto-refresh ===
+  // === Notification badge: pushed by the server (SSE), polling as a fallback ===
   const notificationBadge = document.getElementById('notificationBadge');
-  const NOTIFICATION_REFRESH_INTERVAL_MS = 30000; // 30 seconds
+  const NOTIFICATION_REFRESH_INTERVAL_MS = 30000; // 30 seconds (fallback polling only)
+  const NOTIFICATION_STREAM_MAX_ERRORS = 3;
   
   // Store notifications data for modal display
   let notificationsData = [];
@@ -200,19 +201,61 @@ document.addEventListener('DOMContentLoaded', function () {
         if(!response.ok) throw new Error('Network response was not ok');
         return response.json();
       })
-      .then(function(data){
-        updateNotificationBadge(data.count || 0);
-        notificationsData = data.notifications || [];
-      })
+      .then(applyNotifications)
       .catch(function(error){
         console.error('Error fetching notifications:', error);
       });
   }
 
-  // Initial fetch and set interval for auto-refresh
-  if(notificationBadge){
+  function applyNotifications(data){
+    updateNotificationBadge(data.unread !== undefined ? data.unread : (data.count || 0));
+    notificationsData = data.notifications || [];
+  }
+
+  function markNotificationsRead(){
+    const hasUnread = notificationsData.some(function(notif){
+      return notif.id !== undefined && !notif.read;
+    });
+    if(!hasUnread) return;
+    fetch('/api/notifications/read', { method: 'POST' })
+      .then(function(response){ return response.json(); })
+      .then(function(data){
+        if(data.success) applyNotifications(data);
+      })
+      .catch(function(){});
+  }
+
+  let pollTimer = null;
+
+  function startPolling(){
+    if(pollTimer) return;
     fetchNotifications();
-    setInterval(fetchNotifications, NOTIFICATION_REFRESH_INTERVAL_MS);
+    pollTimer = setInterval(fetchNotifications, NOTIFICATION_REFRESH_INTERVAL_MS);
+  }
+
+  function openNotificationStream(){
+    if(!window.EventSource){
+      startPolling();
+      return;
+    }
+    const source = new EventSource('/api/notifications/stream');
+    let errors = 0;
+    source.addEventListener('notifications', function(e){
+      errors = 0;
+      applyNotifications(JSON.parse(e.data));
+    });
+    source.onerror = function(){
+      // Refused (503 when the server is full) or repeatedly cut: fall back to polling
+      errors++;
+      if(source.readyState === EventSource.CLOSED || errors >= NOTIFICATION_STREAM_MAX_ERRORS){
+        source.close();
+        startPolling();
+      }
+    };
+  }
+
+  if(notificationBadge){
+    openNotificationStream();
   }
 
   // === Bag Alert Modal ===
@@ -275,6 +318,7 @@ document.addEventListener('DOMContentLoaded', function () {
     renderNotifications();
     bagAlertModal.classList.add('show');
     document.body.style.overflow = 'hidden';
+    markNotificationsRead();
   }
 
   function closeBagAlertModal(){
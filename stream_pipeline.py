@@ -0,0 +1,195 @@
+"""
+stream_pipeline.py — Envoi « au fil de l'eau » vers le navigateur.
+
+Les octets partent vers le client pendant que la source est encore lue, au lieu
+d'attendre la fin du téléchargement et de la conversion :
+- MP4 : seuls les formats progressifs (un seul fichier mp4 audio + vidéo en HTTP)
+  sont éligibles ; les octets de la source sont relayés tels quels, sans remux ;
+- audio natif : la piste audio (m4a de préférence) est relayée telle quelle ;
+- MP3 : ffmpeg lit la source audio et transcode vers sa sortie standard.
+Une vidéo sans format éligible (DASH/HLS uniquement, ou progressif en dessous du
+palier demandé) lève PipelineUnavailable :
+l'appelant repasse alors par le téléchargement complet (download_jobs).
+"""
+import http.client
+import subprocess
+import urllib.request
+
+import yt_dlp
+from yt_dlp.utils import sanitize_filename
+
+import config
+import quality_ladder
+import transcoder
+import ydl_pool
+
+FORMATS = {
+    'audio': 'bestaudio[ext=m4a][protocol^=http]/bestaudio[protocol^=http]',
+    'mp3': 'bestaudio[protocol^=http]/best[protocol^=http]',
+    'mp4': 'best[ext=mp4][vcodec!=none][acodec!=none][protocol^=http]',
+}
+
+
+def _format_spec(mode, quality):
+    """Format relayable tel quel, limité au palier demandé (hauteur max pour la vidéo)."""
+    if mode == 'mp4' and quality != 'best':
+        return f"{FORMATS['mp4']}[height<={int(quality[:-1])}]"
+    if mode == 'audio' and quality != 'best':
+        return 'worstaudio[ext=m4a][protocol^=http]/worstaudio[protocol^=http]'
+    return FORMATS[mode]
+
+
+# Type MIME selon l'extension du fichier envoyé
+MIMETYPES = {'mp4': 'video/mp4', 'mp3': 'audio/mpeg', 'm4a': 'audio/mp4', 'webm': 'audio/webm',
+             'opus': 'audio/ogg', 'ogg': 'audio/ogg'}
+
+
+class PipelineUnavailable(Exception):
+    """Aucun format ne peut être relayé directement : passer par le téléchargement complet."""
+
+
+class PipelineStream:
+    """Flux ouvert vers la source : itérer dessus produit les blocs à envoyer au client."""
+
+    def __init__(self, info, filename, mimetype, length, first_chunk, read, close, on_error=None):
+        self.info = info
+        self.filename = filename
+        self.mimetype = mimetype
+        self.length = length        # None si inconnue (transcodage)
+        self.on_error = on_error    # appelé si la source échoue en cours d'envoi
+        self._first = first_chunk
+        self._read = read
+        self._close = close
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            if self._first:
+                yield self._first
+            while True:
+                try:
+                    chunk = self._read()
+                except (OSError, http.client.HTTPException) as e:
+                    self._fail(e)
+                    raise
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            # Fin normale, erreur ou client déconnecté (GeneratorExit) : on coupe la source
+            self.close()
+
+    def close(self):
+        """Coupe la source (une seule fois) ; aussi appelé à la fermeture de la réponse HTTP."""
+        if self._closed:
+            return
+        self._closed = True
+        error = self._close()
+        if error:
+            self._fail(error)
+
+    def _fail(self, error):
+        if self.on_error:
+            try:
+                self.on_error(error)
+            except Exception:
+                pass
+            self.on_error = None
+
+
+def _probe(url, mode, quality):
+    try:
+        info = ydl_pool.run('info', lambda ydl: ydl.extract_info(url, download=False),
+                            format=_format_spec(mode, quality))
+    except yt_dlp.utils.DownloadError as e:
+        if 'requested format is not available' in str(e).lower():
+            raise PipelineUnavailable(str(e))
+        raise
+    if not info.get('url') or info.get('requested_formats'):
+        raise PipelineUnavailable("Format fragmenté : relais direct impossible")
+    if mode == 'mp4' and (info.get('height') or 0) < quality_ladder.mp4_height(info, quality):
+        # Le progressif est en dessous du palier : le job (vidéo + audio fusionnés) fait mieux
+        raise PipelineUnavailable("Format progressif inférieur au palier demandé")
+    return info
+
+
+def _download_info(info):
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'view_count': info.get('view_count', 0),
+        'resolution': info.get('resolution', 'N/A'),
+        'filesize': info.get('filesize') or info.get('filesize_approx', 0),
+    }
+
+
+def _open_passthrough(info):
+    request = urllib.request.Request(info['url'], headers=info.get('http_headers') or {})
+    response = urllib.request.urlopen(request, timeout=config.STRATEGY_SOCKET_TIMEOUT)
+    length = response.headers.get('Content-Length')
+    first = response.read(config.STREAM_CHUNK_SIZE)
+
+    def close():
+        response.close()
+
+    return (int(length) if length else None), first, lambda: response.read(config.STREAM_CHUNK_SIZE), close
+
+
+def _open_transcode(info, bitrate):
+    headers = "".join(f"{key}: {value}\r\n" for key, value in (info.get('http_headers') or {}).items())
+    args = ['-hide_banner', '-loglevel', 'error', '-nostdin']
+    if headers:
+        args += ['-headers', headers]
+    args += ['-i', info['url'], '-vn', '-c:a', 'libmp3lame', '-b:a', f'{bitrate}k', '-f', 'mp3', 'pipe:1']
+    # Même borne que la file de conversion : sans place libre, téléchargement complet (en file)
+    if not transcoder.acquire_stream_slot():
+        raise PipelineUnavailable("Toutes les places de conversion sont occupées")
+    try:
+        proc = subprocess.Popen(transcoder.ffmpeg_command(args), stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    except BaseException:
+        transcoder.release_stream_slot()
+        raise
+    # Le premier bloc est lu avant de répondre : une source illisible échoue proprement
+    first = proc.stdout.read1(config.STREAM_CHUNK_SIZE)
+    if not first:
+        proc.wait()
+        transcoder.release_stream_slot()
+        raise RuntimeError(f"ffmpeg : {proc.stderr.read().decode(errors='replace').strip() or 'aucune sortie'}")
+
+    def close():
+        interrupted = proc.poll() is None  # client parti avant la fin : ffmpeg est arrêté
+        if interrupted:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+        transcoder.release_stream_slot()
+        if not interrupted and proc.returncode != 0:
+            return RuntimeError(f"ffmpeg a échoué (code {proc.returncode})")
+        return None
+
+    return None, first, lambda: proc.stdout.read1(config.STREAM_CHUNK_SIZE), close
+
+
+def open_stream(url, mode, on_error=None, quality=None):
+    """
+    Ouvre un flux direct pour `url` en `mode` ('audio', 'mp3' ou 'mp4') au palier `quality` et retourne
+    un PipelineStream dont le premier bloc est déjà lu. Lève PipelineUnavailable si aucun
+    format ne s'y prête. `on_error(exc)` est appelé si la source échoue après le début de l'envoi.
+    """
+    if mode not in FORMATS:
+        raise ValueError(f"Mode inconnu : {mode}")
+    if not quality_ladder.is_valid(mode, quality):
+        quality = quality_ladder.TIERS[mode][0]
+    info = _probe(url, mode, quality)
+    if mode == 'mp3':
+        length, first, read, close = _open_transcode(info, quality_ladder.audio_bitrate(quality))
+        ext = 'mp3'
+    else:
+        length, first, read, close = _open_passthrough(info)
+        ext = info.get('ext') or ('m4a' if mode == 'audio' else 'mp4')
+    filename = sanitize_filename(f"{info.get('title', 'video')} [{info.get('id', '')}].{ext}")
+    mimetype = MIMETYPES.get(ext, 'application/octet-stream')
+    return PipelineStream(_download_info(info), filename, mimetype, length, first, read, close, on_error)
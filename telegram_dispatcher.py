@@ -0,0 +1,229 @@
+"""
+telegram_dispatcher.py — File d'envoi commune vers l'API Telegram.
+
+Tous les appels sortants non critiques (messages admin, diffusions, file d'attente,
+progression) passent par ici :
+- seaux à jetons par bot (global) et par chat, pour rester sous les limites Telegram ;
+- respect du `retry_after` des erreurs 429 (le chat, ou le bot entier, est mis en pause) ;
+- files prioritaires : réponses aux utilisateurs > mises à jour de statut > diffusions ;
+- compteurs (profondeur des files, envoyés, échecs, 429) via `stats()`.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+import config
+
+HIGH = 0     # réponses directes aux utilisateurs
+NORMAL = 1   # statuts de file d'attente, progression
+BULK = 2     # diffusions de masse
+LANE_NAMES = {HIGH: "high", NORMAL: "normal", BULK: "bulk"}
+PRUNE_INTERVAL = 60  # s entre deux purges des seaux de chat inactifs et des pauses expirées
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons/seconde, au plus `capacity` en réserve."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def is_full(self, now):
+        """Vrai si le seau est de nouveau plein : il équivaut alors à un seau neuf."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def reserve(self, now):
+        """Consomme un jeton et retourne 0, ou retourne le délai avant le prochain jeton."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+_lanes = {HIGH: deque(), NORMAL: deque(), BULK: deque()}
+_delayed = []                  # tas (prêt_à, seq, requête) des envois reportés
+_global_buckets = {}           # bot_id -> TokenBucket
+_chat_buckets = {}             # (bot_id, chat_id) -> TokenBucket
+_paused_until = {}             # bot_id ou (bot_id, chat_id) -> instant de reprise (429)
+_counters = {"sent": 0, "failed": 0, "retried": 0, "rate_limited": 0}
+_lock = threading.Lock()
+_cond = threading.Condition(_lock)
+_seq = itertools.count()
+_workers = []
+_last_prune = time.monotonic()
+
+
+def _bot_id(bot):
+    return str(bot.token).split(":", 1)[0]
+
+
+def _retry_after(exc):
+    """Délai demandé par Telegram pour une erreur 429, sinon None."""
+    if not isinstance(exc, ApiTelegramException) or exc.error_code != 429:
+        return None
+    params = (exc.result_json or {}).get("parameters") or {}
+    return float(params.get("retry_after", 1))
+
+
+def _wait_time(request, now):
+    """
+    Retourne (délai, portée) avant de pouvoir envoyer `request` : (0, None) si c'est
+    possible tout de suite (jeton consommé), sinon la portée "chat" ou "bot" qui bloque.
+    """
+    bot_id, chat_id = request["bot_id"], request["chat_id"]
+    pause = _paused_until.get(bot_id, 0) - now
+    if pause > 0:
+        return pause, "bot"
+    pause = _paused_until.get((bot_id, chat_id), 0) - now
+    if pause > 0:
+        return pause, "chat"
+    chat_bucket = None
+    if chat_id is not None:
+        chat_bucket = _chat_buckets.setdefault(
+            (bot_id, chat_id), TokenBucket(config.TELEGRAM_CHAT_RATE, config.TELEGRAM_CHAT_BURST))
+        wait = chat_bucket.reserve(now)
+        if wait:
+            return wait, "chat"
+    global_bucket = _global_buckets.setdefault(
+        bot_id, TokenBucket(config.TELEGRAM_GLOBAL_RATE, config.TELEGRAM_GLOBAL_RATE))
+    wait = global_bucket.reserve(now)
+    if wait:
+        if chat_bucket:
+            chat_bucket.tokens += 1  # Rend le jeton du chat : l'envoi n'a pas lieu maintenant
+        return wait, "bot"
+    return 0.0, None
+
+
+def _prune(now):
+    """
+    Oublie les seaux de chat pleins (aucun envoi récent) et les pauses 429 expirées,
+    sans quoi chaque chat contacté une fois resterait en mémoire (appelé sous _lock).
+    """
+    global _last_prune
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    for key in [key for key, bucket in _chat_buckets.items() if bucket.is_full(now)]:
+        del _chat_buckets[key]
+    for key in [key for key, until in _paused_until.items() if until <= now]:
+        del _paused_until[key]
+
+
+def _next_request():
+    """Retourne la prochaine requête envoyable (appelé sous _lock, attend si besoin)."""
+    while True:
+        now = time.monotonic()
+        _prune(now)
+        due = []
+        while _delayed and _delayed[0][0] <= now:
+            due.append(heapq.heappop(_delayed)[2])
+        # Les envois reportés repassent en tête de leur file, dans leur ordre d'origine
+        for request in reversed(due):
+            _lanes[request["priority"]].appendleft(request)
+        timeout = None
+        for priority in (HIGH, NORMAL, BULK):
+            lane = _lanes[priority]
+            for _ in range(len(lane)):
+                request = lane.popleft()
+                wait, scope = _wait_time(request, now)
+                if not wait:
+                    return request
+                if scope == "bot":
+                    # Limite globale du bot atteinte : inutile de parcourir le reste de la file
+                    lane.appendleft(request)
+                    timeout = wait
+                    break
+                heapq.heappush(_delayed, (now + wait, next(_seq), request))
+            if timeout is not None:
+                break
+        if _delayed:
+            delayed_wait = _delayed[0][0] - now
+            timeout = delayed_wait if timeout is None else min(timeout, delayed_wait)
+        _cond.wait(timeout)
+
+
+def _worker_loop():
+    while True:
+        with _cond:
+            request = _next_request()
+        future = request["future"]
+        if request["attempts"] == 0 and not future.set_running_or_notify_cancel():
+            continue
+        try:
+            result = getattr(request["bot"], request["method"])(*request["args"], **request["kwargs"])
+        except Exception as exc:
+            retry_after = _retry_after(exc)
+            if retry_after is not None and request["attempts"] < config.TELEGRAM_MAX_RETRIES:
+                with _cond:
+                    _counters["rate_limited"] += 1
+                    _counters["retried"] += 1
+                    key = request["bot_id"] if request["chat_id"] is None else (request["bot_id"], request["chat_id"])
+                    _paused_until[key] = time.monotonic() + retry_after
+                    request["attempts"] += 1
+                    heapq.heappush(_delayed, (time.monotonic() + retry_after, next(_seq), request))
+                    _cond.notify()
+                continue
+            with _lock:
+                _counters["failed"] += 1
+            future.set_exception(exc)
+        else:
+            with _lock:
+                _counters["sent"] += 1
+            future.set_result(result)
+
+
+def _ensure_workers():
+    """Démarre les workers d'envoi (appelé sous _lock)."""
+    while len(_workers) < config.TELEGRAM_SEND_WORKERS:
+        worker = threading.Thread(target=_worker_loop, daemon=True, name=f"tg-send-{len(_workers) + 1}")
+        worker.start()
+        _workers.append(worker)
+
+
+def submit(bot, method, *args, target_chat=None, priority=NORMAL, **kwargs):
+    """
+    Met en file l'appel `bot.<method>(*args, **kwargs)` et retourne un Future.
+    `target_chat` (le chat destinataire) sert uniquement à appliquer la limite par chat.
+    """
+    future = Future()
+    request = {
+        "bot": bot,
+        "bot_id": _bot_id(bot),
+        "method": method,
+        "args": args,
+        "kwargs": kwargs,
+        "chat_id": str(target_chat) if target_chat is not None else None,
+        "priority": priority,
+        "attempts": 0,
+        "future": future,
+    }
+    with _cond:
+        _ensure_workers()
+        _lanes[priority].append(request)
+        _cond.notify()
+    return future
+
+
+def call(bot, method, *args, target_chat=None, priority=HIGH, wait=None, **kwargs):
+    """
+    Comme `submit` mais attend le résultat, au plus `wait` secondes (les exceptions
+    Telegram sont relevées). `timeout` reste un paramètre de la méthode Telegram.
+    """
+    return submit(bot, method, *args, target_chat=target_chat, priority=priority, **kwargs).result(wait)
+
+
+def stats():
+    """Profondeur des files et compteurs d'envoi."""
+    with _lock:
+        queued = {LANE_NAMES[p]: len(lane) for p, lane in _lanes.items()}
+        queued["delayed"] = len(_delayed)
+        return dict(_counters, queued=queued, depth=sum(queued.values()))
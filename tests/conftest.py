@@ -0,0 +1,11 @@
+"""
+Configuration commune des tests : modules du projet importables depuis la racine et
+base SQLite temporaire (jamais la base de production).
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="genius-tests-"), "test.db"))
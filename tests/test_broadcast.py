@@ -0,0 +1,43 @@
+import broadcast
+import db
+
+
+def _status(broadcast_id):
+    return db.get_connection().execute(
+        "SELECT status FROM broadcasts WHERE id = ?", (broadcast_id,)
+    ).fetchone()["status"]
+
+
+def test_crashed_broadcast_is_marked_failed(monkeypatch):
+    monkeypatch.setattr(broadcast, "resolve_targets", lambda: ["101", "102"])
+    monkeypatch.setattr(broadcast, "_launch", lambda *a: None)
+
+    def broken_submit(*args, **kwargs):
+        raise RuntimeError("dispatcher arrêté")
+
+    monkeypatch.setattr(broadcast.telegram_dispatcher, "submit", broken_submit)
+    broadcast_id, total = broadcast.start_broadcast(None, None, "Maintenance", None, "")
+    assert total == 2 and broadcast.running_broadcast_id() == broadcast_id
+
+    broadcast._run(None, None, broadcast_id)
+
+    assert _status(broadcast_id) == "failed"
+    assert broadcast.running_broadcast_id() is None
+    assert broadcast.resume_broadcasts(None, None) == 0
+    assert broadcast_id not in broadcast._running
+
+
+def test_second_start_is_refused_while_running(monkeypatch):
+    monkeypatch.setattr(broadcast, "resolve_targets", lambda: ["101"])
+    monkeypatch.setattr(broadcast, "_launch", lambda *a: None)
+    broadcast_id, _ = broadcast.start_broadcast(None, None, "Maintenance", None, "")
+    assert broadcast.start_broadcast(None, None, "Maintenance", None, "") is None
+    broadcast._mark_failed(broadcast_id)
+
+
+def test_unlinked_web_accounts_are_not_messaged(monkeypatch):
+    monkeypatch.setattr(broadcast, "list_user_ids", lambda: ["12345", "alice", "777", "888"])
+    monkeypatch.setattr(broadcast.auth, "get_telegram_ids_by_username",
+                        lambda: {"12345": "", "alice": "999", "888": "999"})
+    # "12345" est un compte web sans Telegram : son nom n'est pas un chat id
+    assert broadcast.resolve_targets() == ["999", "777"]
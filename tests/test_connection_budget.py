@@ -0,0 +1,24 @@
+from contextlib import ExitStack
+
+import config
+import connection_budget
+
+
+def test_budget_never_blocks_and_grants_at_least_one(monkeypatch):
+    monkeypatch.setattr(config, "HOST_CONNECTION_BUDGET", 16)
+    with ExitStack() as stack:
+        granted = [stack.enter_context(connection_budget.reserve("https://www.youtube.com/watch?v=x", 4))
+                   for _ in range(8)]
+        assert granted[:4] == [4, 4, 4, 4]
+        assert granted[4:] == [1, 1, 1, 1]
+    assert connection_budget.in_use() == {}
+
+
+def test_budget_is_shared_between_running_jobs(monkeypatch):
+    monkeypatch.setattr(config, "HOST_CONNECTION_BUDGET", 6)
+    with connection_budget.reserve("https://youtu.be/x", 8) as first:
+        with connection_budget.reserve("https://m.youtube.com/watch?v=y", 8) as second:
+            assert (first, second) == (6, 1)
+            assert connection_budget.in_use() == {"youtube.com": 7}
+    with connection_budget.reserve("https://youtube.com/a", 2) as alone:
+        assert alone == 2
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import config
+import db
+import download_jobs
+
+
+def _wait_finished(job_id, user_id):
+    for _ in range(200):
+        job = download_jobs.get_job(job_id, user_id)
+        if job["finished_at"]:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job jamais terminé")
+
+
+def test_job_state_is_shared_through_sqlite(tmp_path, monkeypatch):
+    media = tmp_path / "video.mp4"
+    media.write_bytes(b"data")
+    monkeypatch.setattr(download_jobs, "download_content",
+                        lambda url, mode, progress_callback, quality: (str(media), {"title": "Vidéo"}))
+    job_id = download_jobs.submit("alice", "https://example.com/v", "mp4", "720")
+    _wait_finished(job_id, "alice")
+
+    # Autre thread = autre connexion SQLite, comme un autre worker gunicorn
+    seen = []
+    reader = threading.Thread(target=lambda: seen.append(download_jobs.get_job(job_id, "alice")))
+    reader.start()
+    reader.join()
+    job = seen[0]
+    assert job["status"] == download_jobs.DONE
+    assert job["info"] == {"title": "Vidéo"} and job["progress"]["percent"] == 100.0
+    assert download_jobs.get_job(job_id, "bob") is None
+
+    download_jobs.release(job_id)
+    assert download_jobs.get_job(job_id, "alice") is None
+    assert not media.exists()
+
+
+def test_failed_job_calls_on_error(monkeypatch):
+    def boom(*args, **kwargs):
+        raise RuntimeError("indisponible")
+
+    errors = []
+    monkeypatch.setattr(download_jobs, "download_content", boom)
+    job_id = download_jobs.submit("alice", "https://example.com/x", "mp3", on_error=errors.append)
+    job = _wait_finished(job_id, "alice")
+    assert job["status"] == download_jobs.ERROR and job["error"] == "indisponible"
+    assert len(errors) == 1
+
+
+def _age(job_id, **columns):
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    with db.transaction() as conn:
+        conn.execute(f"UPDATE download_jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+
+def test_long_queue_wait_is_not_abandoned(monkeypatch):
+    monkeypatch.setattr(download_jobs._executor, "submit", lambda *a: None)
+    job_id = download_jobs.submit("alice", "https://example.com/q", "mp4", paid=True)
+    # En file depuis plus que JOB_TTL_SECONDS, mais son processus donne signe de vie
+    _age(job_id, created_at=time.time() - config.JOB_TTL_SECONDS - 1)
+    download_jobs._cleanup_expired()
+    assert download_jobs.get_job(job_id, "alice")["status"] == download_jobs.QUEUED
+
+
+def test_abandoned_job_is_refunded_once_and_never_run(monkeypatch):
+    refunds = []
+    calls = []
+    monkeypatch.setattr(download_jobs._executor, "submit", lambda *a: None)
+    monkeypatch.setattr(download_jobs, "refund_credit", lambda user_id, details: refunds.append(user_id))
+    monkeypatch.setattr(download_jobs, "download_content", lambda *a, **k: calls.append(a))
+    job_id = download_jobs.submit("alice", "https://example.com/y", "mp4", paid=True)
+    _age(job_id, updated_at=time.time() - download_jobs.STALE_AFTER - 1)
+
+    download_jobs._cleanup_expired()
+    download_jobs._cleanup_expired()
+    job = download_jobs.get_job(job_id, "alice")
+    assert job["status"] == download_jobs.ERROR and job["finished_at"]
+    assert refunds == ["alice"]
+
+    # Le worker se réveille après coup : le job n'est ni relancé ni ressuscité
+    errors = []
+    download_jobs._run(job_id, "https://example.com/y", "mp4", None, errors.append)
+    assert calls == [] and errors == []
+    assert download_jobs.get_job(job_id, "alice")["status"] == download_jobs.ERROR
+    assert job_id not in download_jobs._owned
@@ -0,0 +1,32 @@
+import threading
+
+import handlers
+import telegram_dispatcher
+
+
+class FakeBot:
+    token = "42:test"
+
+    def __init__(self):
+        self.calls = []
+
+    def send_video(self, chat_id, media, **kwargs):
+        self.calls.append(("send_video", chat_id, threading.current_thread().name, kwargs))
+        return "sent"
+
+
+def test_media_goes_through_dispatcher_with_high_priority(monkeypatch):
+    submitted = []
+    real_submit = telegram_dispatcher.submit
+
+    def spy(bot, method, *args, target_chat=None, priority=telegram_dispatcher.NORMAL, **kwargs):
+        submitted.append((method, target_chat, priority))
+        return real_submit(bot, method, *args, target_chat=target_chat, priority=priority, **kwargs)
+
+    monkeypatch.setattr(telegram_dispatcher, "submit", spy)
+    bot = FakeBot()
+    assert handlers.send_media(bot, 123, "file-id", "mp4") == "sent"
+    assert submitted == [("send_video", 123, telegram_dispatcher.HIGH)]
+    method, chat_id, thread_name, kwargs = bot.calls[0]
+    # Envoyé par un worker de la file, le timeout d'upload est bien transmis à Telegram
+    assert thread_name.startswith("tg-send-") and kwargs["timeout"] == 300
@@ -0,0 +1,33 @@
+import config
+import app as web
+
+
+def _client():
+    client = web.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'bob'
+    return client
+
+
+def test_unread_streams_release_their_slot(monkeypatch):
+    monkeypatch.setattr(config, "NOTIFICATION_STREAM_MAX_CLIENTS", 3)
+    client = _client()
+    for _ in range(5):
+        # Le serveur WSGI ferme la réponse sans jamais en lire le corps
+        response = client.head('/api/notifications/stream')
+        assert response.status_code == 200
+        response.close()
+    assert web._streams_open == 0
+    response = client.get('/api/notifications/stream', buffered=False)
+    assert response.status_code == 200
+    response.close()
+    assert web._streams_open == 0
+
+
+def test_stream_limit(monkeypatch):
+    monkeypatch.setattr(config, "NOTIFICATION_STREAM_MAX_CLIENTS", 1)
+    client = _client()
+    first = client.get('/api/notifications/stream', buffered=False)
+    assert client.get('/api/notifications/stream', buffered=False).status_code == 503
+    first.close()
+    assert client.get('/api/notifications/stream', buffered=False).status_code == 200
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+import admin
+import config
+import purchase_store
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    sent = {"answers": [], "edits": [], "messages": []}
+    monkeypatch.setattr(admin.bot_admin, "answer_callback_query", lambda cid, text=None: sent["answers"].append(text))
+    monkeypatch.setattr(admin.bot_admin, "edit_message_text", lambda text, *a, **k: sent["edits"].append(text))
+    monkeypatch.setattr(admin, "send_telegram_message", lambda bot, target, text, **k: sent["messages"].append(text) or True)
+    monkeypatch.setattr(admin, "get_maintenance_config", lambda: {"maintenance_text": "", "contact_url": "https://t.me/x"})
+    monkeypatch.setattr(admin, "log_admin_action", lambda *a, **k: None)
+    return sent
+
+
+def _click(data):
+    admin.process_admin_actions(SimpleNamespace(
+        id="1", data=data, from_user=SimpleNamespace(id=config.ADMIN_ID),
+        message=SimpleNamespace(chat=SimpleNamespace(id=1), message_id=2)))
+
+
+def test_missing_credit_account_reopens_request(telegram, monkeypatch):
+    monkeypatch.setattr(admin, "add_credits", lambda user_id, amount: False)
+    store = purchase_store.get_store()
+    request_id = store.create("ghost", "10", "web")
+    _click(f"admin_ok|ghost|10|{request_id}")
+    assert store.get(request_id)["status"] == purchase_store.PENDING
+    assert not telegram["edits"] and not telegram["messages"]
+    assert "introuvable" in telegram["answers"][-1]
+
+
+def test_approval_credits_once(telegram, monkeypatch):
+    credited = []
+    monkeypatch.setattr(admin, "add_credits", lambda user_id, amount: credited.append(amount) or True)
+    store = purchase_store.get_store()
+    request_id = store.create("alice", "50", "web")
+    _click(f"admin_ok|alice|50|{request_id}")
+    _click(f"admin_ok|alice|50|{request_id}")
+    assert credited == [50]
+    assert store.get(request_id)["status"] == purchase_store.APPROVED
+
+
+def test_legacy_log_is_imported_as_closed(tmp_path):
+    log = tmp_path / "pending_purchases.log"
+    log.write_text('{"user": "bob", "pack": "10", "ts": 1700000000}\nnot json\n', encoding="utf-8")
+    store = purchase_store.SQLitePurchaseStore(str(tmp_path / "purchases.db"))
+    assert store.migrate_from_log(str(log)) == 1
+    assert store.migrate_from_log(str(log)) == 0
+    assert store.pending_for_user("bob") == []
+    counts, oldest = store.backlog()
+    assert counts[purchase_store.CLOSED] == 1 and counts[purchase_store.PENDING] == 0 and oldest == []
+
+
+def test_close_command_resolves_without_credit_or_message(telegram, monkeypatch):
+    replies = []
+    credited = []
+    monkeypatch.setattr(admin.bot_admin, "reply_to", lambda message, text: replies.append(text))
+    monkeypatch.setattr(admin, "add_credits", lambda user_id, amount: credited.append(amount) or True)
+    monkeypatch.setattr(admin, "touch_user_web_notifications", lambda user_id: None)
+    store = purchase_store.get_store()
+    request_id = store.create("carol", "10", "web")
+    message = SimpleNamespace(text=f"/clore {request_id}", from_user=SimpleNamespace(id=config.ADMIN_ID))
+    admin.close_purchase(message)
+    admin.close_purchase(message)
+    assert store.get(request_id)["status"] == purchase_store.CLOSED
+    assert credited == [] and not telegram["messages"]
+    assert "clôturée" in replies[0] and "déjà traitée" in replies[1]
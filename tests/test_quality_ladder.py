@@ -0,0 +1,43 @@
+import quality_ladder
+
+INFO = {
+    'duration': 100,
+    'formats': [
+        {'format_id': '18', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'tbr': 500},
+        {'format_id': '136', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 1500},
+        {'format_id': '137', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'tbr': 3000},
+        {'format_id': '248', 'ext': 'webm', 'vcodec': 'vp9', 'acodec': 'none', 'height': 1080, 'tbr': 2500},
+        {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128, 'filesize': 1600000},
+    ],
+}
+
+
+def test_mp4_tiers_merge_separate_video_and_audio():
+    spec = quality_ladder.format_spec('mp4', '720p')
+    assert spec.startswith('bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/')
+    assert '+' in quality_ladder.format_spec('mp4', 'best')
+
+
+def test_mp4_height_follows_merged_video():
+    assert quality_ladder.mp4_height(INFO, '720p') == 720
+    assert quality_ladder.mp4_height(INFO, 'best') == 1080
+    assert quality_ladder.mp4_height(INFO, '360p') == 360
+
+
+def test_mp4_size_estimate_counts_video_and_audio():
+    sizes = quality_ladder.estimate_sizes(INFO)['mp4']
+    assert sizes['720p'] == 1500 * 1000 // 8 * 100 + 1600000
+    assert sizes['best'] > sizes['720p'] > sizes['480p']
+
+
+def test_progressive_only_video_keeps_estimates():
+    info = {'duration': 10, 'formats': [INFO['formats'][0]]}
+    assert quality_ladder.mp4_height(info, '720p') == 360
+    assert quality_ladder.estimate_sizes(info)['mp4']['720p'] == 500 * 1000 // 8 * 10
+
+
+def test_audio_container_matches_codec():
+    assert quality_ladder.audio_container('opus') == ('opus', 'ogg')
+    assert quality_ladder.audio_container('mp4a.40.2') == ('m4a', 'ipod')
+    assert quality_ladder.audio_container('none') is None
+    assert quality_ladder.audio_container(None) is None
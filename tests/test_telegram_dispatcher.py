@@ -0,0 +1,28 @@
+import telegram_dispatcher as td
+
+
+def test_prune_drops_idle_chat_buckets_and_expired_pauses(monkeypatch):
+    monkeypatch.setattr(td, "_chat_buckets", {})
+    monkeypatch.setattr(td, "_paused_until", {})
+    now = 1000.0
+    idle = td.TokenBucket(1, 3)
+    idle.updated = now - 10
+    idle.tokens = 0
+    busy = td.TokenBucket(1, 3)
+    busy.updated = now
+    busy.tokens = 0
+    td._chat_buckets.update({("bot", "idle"): idle, ("bot", "busy"): busy})
+    td._paused_until.update({"bot": now - 1, ("bot", "busy"): now + 30})
+
+    monkeypatch.setattr(td, "_last_prune", now - td.PRUNE_INTERVAL)
+    td._prune(now)
+
+    assert list(td._chat_buckets) == [("bot", "busy")]
+    assert list(td._paused_until) == [("bot", "busy")]
+
+
+def test_prune_is_rate_limited(monkeypatch):
+    monkeypatch.setattr(td, "_chat_buckets", {("bot", "idle"): td.TokenBucket(1, 3)})
+    monkeypatch.setattr(td, "_last_prune", 1000.0)
+    td._prune(1001.0)
+    assert ("bot", "idle") in td._chat_buckets
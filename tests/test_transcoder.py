@@ -0,0 +1,38 @@
+import os
+import threading
+
+import pytest
+
+import config
+import stream_pipeline
+import transcoder
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    # ffmpeg factice : écrit un bloc sur la sortie standard puis attend
+    script = tmp_path / "ffmpeg"
+    script.write_text("#!/bin/sh\necho data\nsleep 5\n")
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(transcoder, "_slots", threading.BoundedSemaphore(1))
+
+
+def test_ffmpeg_runs_through_nice(monkeypatch):
+    monkeypatch.setattr(config, "TRANSCODE_NICENESS", 10)
+    assert transcoder.ffmpeg_command(["-i", "x"])[:4] == ["nice", "-n", "10", "ffmpeg"]
+    monkeypatch.setattr(config, "TRANSCODE_NICENESS", 0)
+    assert transcoder.ffmpeg_command(["-i", "x"]) == ["ffmpeg", "-i", "x"]
+
+
+def test_live_transcodes_share_the_worker_bound(fake_ffmpeg):
+    info = {"url": "http://example.invalid/a"}
+    length, first, read, close = stream_pipeline._open_transcode(info, 128)
+    assert first
+    with pytest.raises(stream_pipeline.PipelineUnavailable):
+        stream_pipeline._open_transcode(info, 128)
+    close()
+    # Place rendue : un nouvel envoi direct peut démarrer
+    _, _, _, close = stream_pipeline._open_transcode(info, 128)
+    close()
+    assert transcoder.stats()["streaming"] == 0
@@ -0,0 +1,24 @@
+import pytest
+import yt_dlp
+
+import video_probe
+
+
+def _failing_run(message):
+    def run(profile, job, **options):
+        raise yt_dlp.utils.DownloadError(message)
+    return run
+
+
+def test_private_video_is_unavailable(monkeypatch):
+    monkeypatch.setattr(video_probe.ydl_pool, "run", _failing_run("ERROR: [youtube] abc: Private video"))
+    with pytest.raises(video_probe.VideoUnavailable):
+        video_probe.probe("https://www.youtube.com/watch?v=privatevid1")
+
+
+def test_transient_failure_is_not_reported_as_unavailable(monkeypatch):
+    monkeypatch.setattr(video_probe.ydl_pool, "run",
+                        _failing_run("ERROR: Sign in to confirm you're not a bot"))
+    with pytest.raises(yt_dlp.utils.DownloadError) as raised:
+        video_probe.probe("https://www.youtube.com/watch?v=botcheck01")
+    assert not isinstance(raised.value, video_probe.VideoUnavailable)
@@ -0,0 +1,28 @@
+import pytest
+import yt_dlp
+
+import downloader
+import ydl_pool
+
+
+def test_acquire_with_params_restores_and_returns_instance():
+    options = downloader.transfer_options(4)
+    with ydl_pool.acquire('mp4', strategy='web') as ydl:
+        before = {name: ydl.params.get(name) for name in options}
+    with ydl_pool.acquire('mp4', params=options, strategy='web') as same:
+        assert same is ydl
+        for name, value in options.items():
+            assert same.params[name] == value
+    # Rendue sous sa clé (profil, stratégie), sans les réglages du job
+    assert ydl_pool._idle[('mp4', 'web')][-1].ydl is ydl
+    assert {name: ydl.params.get(name) for name in options} == before
+
+
+def test_run_with_params():
+    assert ydl_pool.run('mp4', lambda ydl: 42, params=downloader.transfer_options(4)) == 42
+
+
+def test_run_without_any_strategy_raises_download_error(monkeypatch):
+    monkeypatch.setattr(ydl_pool.robust_engine, "profiles_to_try", lambda: iter(()))
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        ydl_pool.run('info', lambda ydl: 42)
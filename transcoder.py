@@ -0,0 +1,112 @@
+"""
+transcoder.py — Étage de conversion audio (ffmpeg), séparé du téléchargement.
+
+Chaque processus ffmpeg (conversions en file comme envois directs de stream_pipeline)
+occupe une des TRANSCODE_WORKERS places (par défaut : une par cœur) et tourne avec une
+priorité CPU réduite (nice, TRANSCODE_NICENESS) : une rafale de MP3 ne peut plus
+saturer la machine ni ralentir le site. Le téléchargement rend son instance yt-dlp avant d'attendre la
+conversion, et les deux étages avancent en parallèle d'un job à l'autre.
+"""
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+MP3_BITRATE_KBPS = 192
+
+
+class TranscodeError(Exception):
+    """ffmpeg a échoué (message d'erreur d'ffmpeg en argument)."""
+
+
+_executor = ThreadPoolExecutor(max_workers=config.TRANSCODE_WORKERS, thread_name_prefix="transcode")
+# Places ffmpeg partagées entre la file de conversion et les envois directs
+_slots = threading.BoundedSemaphore(config.TRANSCODE_WORKERS)
+_counters = {"queued": 0, "running": 0, "streaming": 0, "done": 0, "failed": 0}
+_lock = threading.Lock()
+
+
+def ffmpeg_command(args):
+    """Ligne de commande ffmpeg (`args` sans le nom du programme), préfixée par nice si disponible."""
+    cmd = ["ffmpeg", *args]
+    # nice plutôt que preexec_fn, qui n'est pas sûr dans un processus multi-thread
+    if config.TRANSCODE_NICENESS and shutil.which("nice"):
+        cmd = ["nice", "-n", str(config.TRANSCODE_NICENESS), *cmd]
+    return cmd
+
+
+def acquire_stream_slot():
+    """
+    Réserve une place ffmpeg pour un envoi direct, sans attendre ; False si toutes sont
+    occupées. La place est rendue par release_stream_slot().
+    """
+    if not _slots.acquire(blocking=False):
+        return False
+    with _lock:
+        _counters["streaming"] += 1
+    return True
+
+
+def release_stream_slot():
+    with _lock:
+        _counters["streaming"] -= 1
+    _slots.release()
+
+
+def _run_ffmpeg(src, dest, codec_args, container):
+    _slots.acquire()
+    with _lock:
+        _counters["queued"] -= 1
+        _counters["running"] += 1
+    tmp = dest + ".part"
+    cmd = ffmpeg_command(["-hide_banner", "-loglevel", "error", "-nostdin", "-y", "-i", src,
+                          "-vn", *codec_args, "-f", container, tmp])
+    try:
+        proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            raise TranscodeError(proc.stderr.decode(errors="replace").strip() or f"code {proc.returncode}")
+        # Le fichier n'apparaît sous son nom final qu'une fois complet
+        os.replace(tmp, dest)
+    except BaseException:
+        with _lock:
+            _counters["failed"] += 1
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    else:
+        with _lock:
+            _counters["done"] += 1
+    finally:
+        with _lock:
+            _counters["running"] -= 1
+        _slots.release()
+    return dest
+
+
+def _submit(src, dest, codec_args, container):
+    with _lock:
+        _counters["queued"] += 1
+    return _executor.submit(_run_ffmpeg, src, dest, codec_args, container)
+
+
+def to_mp3(src, dest, bitrate=MP3_BITRATE_KBPS):
+    """Met la conversion `src` -> `dest` (MP3) en file et retourne un Future (chemin du MP3)."""
+    return _submit(src, dest, ["-c:a", "libmp3lame", "-b:a", f"{bitrate}k"], "mp3")
+
+
+def remux_audio(src, dest, container="ogg"):
+    """
+    Change seulement le conteneur de la piste audio, sans ré-encodage : "ogg" pour
+    opus/vorbis (webm -> ogg), "ipod" pour AAC (mp4 -> m4a).
+    """
+    return _submit(src, dest, ["-c:a", "copy"], container)
+
+
+def stats():
+    """Conversions en file, en cours, terminées et échouées ; envois directs en cours."""
+    with _lock:
+        return dict(_counters, workers=config.TRANSCODE_WORKERS)
@@ -0,0 +1,124 @@
+"""
+video_probe.py — Analyse préalable d'une vidéo (métadonnées seules, sans téléchargement).
+
+`probe(url)` appelle `extract_info(download=False)` et garde le résultat dans un cache
+LRU + TTL indexé par ID vidéo : afficher le choix du format est instantané et
+redemander le même lien ne coûte rien. `check_limits` refuse les vidéos trop longues
+ou trop lourdes avant de consommer de la bande passante ou un crédit.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import yt_dlp
+
+import config
+import quality_ladder
+import robust_engine
+import ydl_pool
+from media_cache import extract_video_id
+
+_cache = OrderedDict()   # video_id -> (instant, métadonnées)
+_cache_lock = threading.Lock()
+_probe_locks = {}        # video_id -> Lock : une seule analyse à la fois par vidéo
+
+
+class VideoUnavailable(Exception):
+    """La vidéo n'existe pas, est privée ou inaccessible."""
+
+
+def _summarize(info):
+    return {
+        'id': info.get('id'),
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration') or 0,
+        'uploader': info.get('uploader', 'Unknown'),
+        'view_count': info.get('view_count', 0),
+        'is_live': bool(info.get('is_live')),
+        'sizes': quality_ladder.estimate_sizes(info),   # {mode: {palier: octets}}
+    }
+
+
+def _cached(video_id):
+    with _cache_lock:
+        entry = _cache.get(video_id)
+        if not entry:
+            return None
+        if time.time() - entry[0] > config.VIDEO_INFO_TTL_SECONDS:
+            del _cache[video_id]
+            return None
+        _cache.move_to_end(video_id)
+        return entry[1]
+
+
+def probe(url):
+    """
+    Retourne les métadonnées de la vidéo (titre, durée, tailles estimées par mode...).
+    Lève VideoUnavailable si la vidéo elle-même est illisible (privée, supprimée...) ;
+    les autres échecs de yt-dlp (réseau, anti-bot) sont relevés tels quels.
+    """
+    video_id = extract_video_id(url)
+    if video_id:
+        meta = _cached(video_id)
+        if meta:
+            return meta
+        with _cache_lock:
+            lock = _probe_locks.setdefault(video_id, threading.Lock())
+    else:
+        lock = threading.Lock()
+
+    with lock:
+        try:
+            # Une analyse concurrente du même lien a pu remplir le cache pendant l'attente
+            meta = _cached(video_id) if video_id else None
+            if meta:
+                return meta
+            try:
+                info = ydl_pool.run('info', lambda ydl: ydl.extract_info(url, download=False))
+            except yt_dlp.utils.DownloadError as e:
+                # Seules les erreurs propres à la vidéo la refusent ; un réseau lent ou une
+                # vérification anti-bot remontent telles quelles (le téléchargement décidera)
+                if robust_engine.is_permanent_error(e):
+                    raise VideoUnavailable(str(e).replace('ERROR: ', '', 1))
+                raise
+            meta = _summarize(info)
+            key = video_id or meta['id']
+            if key:
+                with _cache_lock:
+                    _cache[key] = (time.time(), meta)
+                    _cache.move_to_end(key)
+                    while len(_cache) > config.VIDEO_INFO_CACHE_SIZE:
+                        _cache.popitem(last=False)
+            return meta
+        finally:
+            if video_id:
+                with _cache_lock:
+                    _probe_locks.pop(video_id, None)
+
+
+def check_limits(meta, mode=None, quality=None):
+    """
+    Retourne un message d'erreur si la vidéo dépasse les limites, sinon None.
+    Avec `mode` (et éventuellement `quality`), seul ce format / palier est vérifié ;
+    sinon il suffit qu'un palier d'un format respecte la limite de taille.
+    """
+    if meta['is_live']:
+        return "Les directs ne peuvent pas être téléchargés."
+    if config.MAX_VIDEO_DURATION and meta['duration'] > config.MAX_VIDEO_DURATION:
+        return f"Vidéo trop longue (max {config.MAX_VIDEO_DURATION // 60} min)."
+    if config.MAX_DOWNLOAD_BYTES:
+        sizes = [size for m, tiers in meta['sizes'].items() if mode in (None, m)
+                 for q, size in tiers.items() if quality in (None, q)]
+        if sizes and all(size > config.MAX_DOWNLOAD_BYTES for size in sizes):
+            return f"Fichier trop volumineux (max {config.MAX_DOWNLOAD_BYTES // (1024 * 1024)} MB)."
+    return None
+
+
+def allowed_qualities(meta, mode):
+    """Paliers de `mode` dont la taille estimée respecte la limite."""
+    return [q for q in quality_ladder.TIERS[mode] if check_limits(meta, mode, q) is None]
+
+
+def allowed_modes(meta):
+    """Modes ('audio', 'mp3', 'mp4') dont au moins un palier respecte la limite."""
+    return [mode for mode in quality_ladder.MODES if check_limits(meta, mode) is None]
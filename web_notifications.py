@@ -1,76 +1,316 @@
 """
 web_notifications.py — Module for handling web notifications for users without Telegram.
+
+Notifications live in SQLite (WAL), indexed by (user_id, id): reading a page, the
+unread count or clearing only touches the rows of that user. Each user keeps at most
+NOTIFICATION_MAX_PER_USER notifications, none older than NOTIFICATION_RETENTION_DAYS.
+
+Every change bumps the user's version and wakes the threads waiting in
+`wait_for_change` (server-sent events in app.py). Changes written by another process
+(the Telegram bots) are picked up by a single watcher thread that polls the indexed
+version table.
+
+One-time migration from the old `web_notifications.json`:
+    python web_notifications.py
 """
 import json
 import os
+import threading
 import time
-from threading import Lock
+from datetime import datetime
+
+import config
+import db
 
 WEB_NOTIFICATIONS_FILE = "web_notifications.json"
-web_notifications_lock = Lock()
+PRUNE_INTERVAL = 3600   # seconds between two global retention sweeps
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS web_notifications (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     TEXT NOT NULL,
+    type        TEXT NOT NULL,
+    message     TEXT NOT NULL,
+    created_at  INTEGER NOT NULL,
+    read        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_web_notifications_user ON web_notifications(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_web_notifications_unread ON web_notifications(user_id) WHERE read = 0;
+CREATE INDEX IF NOT EXISTS idx_web_notifications_created ON web_notifications(created_at);
+CREATE TABLE IF NOT EXISTS web_notification_versions (
+    user_id     TEXT PRIMARY KEY,
+    version     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_web_notification_versions ON web_notification_versions(version);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+"""
+
+
+def _row_to_dict(row):
+    return {"id": row["id"], "type": row["type"], "message": row["message"],
+            "timestamp": row["created_at"], "read": bool(row["read"])}
+
+
+class SQLiteNotificationStore:
+    """Notifications indexed by user, newest first, paginated by id (cursor)."""
+
+    def __init__(self, path=None):
+        self.path = path or config.DB_FILE
+        db.ensure_schema("web_notifications", SCHEMA, self.path)
+
+    def _bump(self, conn, user_id):
+        conn.execute(
+            "INSERT INTO web_notification_versions (user_id, version) "
+            "VALUES (?, (SELECT COALESCE(MAX(version), 0) + 1 FROM web_notification_versions)) "
+            "ON CONFLICT(user_id) DO UPDATE SET version = excluded.version", (user_id,))
+        return conn.execute("SELECT version FROM web_notification_versions WHERE user_id = ?",
+                            (user_id,)).fetchone()[0]
+
+    def add(self, user_id, message, notif_type):
+        """Insert a notification and apply the retention limits of this user; returns the new version."""
+        now = int(time.time())
+        with db.transaction(self.path) as conn:
+            conn.execute("INSERT INTO web_notifications (user_id, type, message, created_at) VALUES (?, ?, ?, ?)",
+                         (user_id, notif_type, message, now))
+            conn.execute(
+                "DELETE FROM web_notifications WHERE user_id = ? AND id <= "
+                "(SELECT id FROM web_notifications WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (user_id, user_id, config.NOTIFICATION_MAX_PER_USER))
+            conn.execute("DELETE FROM web_notifications WHERE user_id = ? AND created_at < ?",
+                         (user_id, now - config.NOTIFICATION_RETENTION_DAYS * 86400))
+            return self._bump(conn, user_id)
+
+    def page(self, user_id, limit, before=None):
+        """Up to `limit` notifications older than id `before` (newest first)."""
+        conn = db.get_connection(self.path)
+        if before:
+            rows = conn.execute("SELECT * FROM web_notifications WHERE user_id = ? AND id < ? "
+                                "ORDER BY id DESC LIMIT ?", (user_id, before, limit)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM web_notifications WHERE user_id = ? "
+                                "ORDER BY id DESC LIMIT ?", (user_id, limit)).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def counts(self, user_id):
+        """(total, unread) for this user."""
+        row = db.get_connection(self.path).execute(
+            "SELECT COUNT(*), COALESCE(SUM(read = 0), 0) FROM web_notifications WHERE user_id = ?",
+            (user_id,)).fetchone()
+        return row[0], row[1]
+
+    def mark_read(self, user_id, up_to=None):
+        """Mark as read every notification of the user (or those with id <= `up_to`)."""
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("UPDATE web_notifications SET read = 1 WHERE user_id = ? AND read = 0 "
+                               "AND id <= ?", (user_id, up_to or 2 ** 62))
+            if not cur.rowcount:
+                return None
+            return self._bump(conn, user_id)
+
+    def clear(self, user_id):
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("DELETE FROM web_notifications WHERE user_id = ?", (user_id,))
+            if not cur.rowcount:
+                return None
+            return self._bump(conn, user_id)
+
+    def delete(self, user_id, notification_id):
+        with db.transaction(self.path) as conn:
+            cur = conn.execute("DELETE FROM web_notifications WHERE user_id = ? AND id = ?",
+                               (user_id, notification_id))
+            if not cur.rowcount:
+                return None
+            return self._bump(conn, user_id)
+
+    def touch(self, user_id):
+        """Bump the user's version without changing its notifications (state kept elsewhere changed)."""
+        with db.transaction(self.path) as conn:
+            return self._bump(conn, user_id)
+
+    def changes_since(self, version):
+        """(user_id, version) of the users changed after `version`."""
+        return db.get_connection(self.path).execute(
+            "SELECT user_id, version FROM web_notification_versions WHERE version > ? ORDER BY version",
+            (version,)).fetchall()
+
+    def latest_version(self):
+        return db.get_connection(self.path).execute(
+            "SELECT COALESCE(MAX(version), 0) FROM web_notification_versions").fetchone()[0]
+
+    def prune(self):
+        """Remove the notifications older than the retention period, for every user."""
+        cutoff = int(time.time()) - config.NOTIFICATION_RETENTION_DAYS * 86400
+        with db.transaction(self.path) as conn:
+            return conn.execute("DELETE FROM web_notifications WHERE created_at < ?", (cutoff,)).rowcount
+
+    def migrate_from_json(self, json_file=WEB_NOTIFICATIONS_FILE):
+        """
+        Import `web_notifications.json` once.
+        Returns the number of notifications imported (0 if already done).
+        """
+        if not os.path.exists(json_file):
+            return 0
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return 0
+        rows = [(str(user_id), n.get("type", "admin_message"), n.get("message", ""),
+                 int(n.get("timestamp", 0) or 0), int(bool(n.get("read"))))
+                for user_id, notifications in data.items() for n in notifications]
+        rows.sort(key=lambda row: row[3])
+        with db.transaction(self.path) as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'web_notifications_json_migrated'").fetchone():
+                return 0
+            conn.executemany("INSERT INTO web_notifications (user_id, type, message, created_at, read) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('web_notifications_json_migrated', ?)",
+                         (datetime.utcnow().isoformat() + "Z",))
+        return len(rows)
 
 
-def _load_web_notifications():
-    """Internal: Load web notifications from file (must be called within lock)."""
-    if not os.path.exists(WEB_NOTIFICATIONS_FILE):
-        return {}
-    try:
-        with open(WEB_NOTIFICATIONS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, OSError):
-        return {}
+_store = None
+_store_lock = threading.Lock()
 
 
-def _save_web_notifications(data):
-    """Internal: Save web notifications to file (must be called within lock)."""
-    with open(WEB_NOTIFICATIONS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def get_store():
+    """Return the notification store, migrating the old JSON file on first access."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = SQLiteNotificationStore()
+                store.migrate_from_json()
+                _store = store
+    return _store
 
 
+# === Change notifications (server-sent events) ===
+_changes = threading.Condition()
+_version = 0
+_user_versions = {}      # user_id -> last in-process change for this user
+_own_versions = set()    # store versions written by this process (already notified)
+_watcher = None
+
+
+def notify(user_id, store_version=None):
+    """Wake the streams of `user_id` after a change."""
+    global _version
+    with _changes:
+        _version += 1
+        _user_versions[str(user_id)] = _version
+        if store_version is not None and _watcher is not None:
+            _own_versions.add(store_version)
+        _changes.notify_all()
+
+
+def current_version():
+    """Version to pass to `wait_for_change` to wait for the next change."""
+    with _changes:
+        return _version
+
+
+def _watch(seen):
+    next_prune = 0.0
+    while True:
+        time.sleep(config.NOTIFICATION_WATCH_INTERVAL)
+        try:
+            store = get_store()
+            for row in store.changes_since(seen):
+                seen = max(seen, row["version"])
+                with _changes:
+                    own = row["version"] in _own_versions
+                    _own_versions.discard(row["version"])
+                if not own:
+                    notify(row["user_id"])
+            if time.monotonic() >= next_prune:
+                store.prune()
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+        except Exception:
+            pass   # database briefly unavailable: try again on the next tick
+
+
+def _ensure_watcher():
+    global _watcher
+    with _changes:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, args=(get_store().latest_version(),),
+                                        daemon=True, name="web-notifications-watch")
+            _watcher.start()
+
+
+def wait_for_change(user_id, since, timeout):
+    """
+    Block until a change concerning `user_id` happens after version `since`, or `timeout`
+    seconds. Returns the new version, or None on timeout.
+    """
+    _ensure_watcher()
+    user_id = str(user_id)
+    with _changes:
+        if _changes.wait_for(lambda: _user_versions.get(user_id, 0) > since, timeout):
+            return _version
+        return None
+
+
+# === Public API ===
 def add_web_notification(user_id, message, notif_type="admin_message"):
     """Add a notification for a web user."""
-    with web_notifications_lock:
-        data = _load_web_notifications()
-        user_id = str(user_id)
-        if user_id not in data:
-            data[user_id] = []
-        data[user_id].append({
-            "type": notif_type,
-            "message": message,
-            "timestamp": int(time.time()),
-            "read": False
-        })
-        _save_web_notifications(data)
-
-
-def get_user_web_notifications(user_id):
-    """Get notifications for a specific user."""
-    with web_notifications_lock:
-        data = _load_web_notifications()
-        return data.get(str(user_id), [])
+    user_id = str(user_id)
+    notify(user_id, get_store().add(user_id, message, notif_type))
+
+
+def get_user_web_notifications(user_id, limit=None, before=None):
+    """Get a page of notifications for a specific user (newest first, older than id `before`)."""
+    return get_store().page(str(user_id), limit or config.NOTIFICATION_PAGE_SIZE, before)
+
+
+def count_user_web_notifications(user_id):
+    """(total, unread) notifications for a specific user."""
+    return get_store().counts(str(user_id))
+
+
+def mark_user_web_notifications_read(user_id, up_to=None):
+    """Mark the notifications of a user as read (all, or up to id `up_to`)."""
+    user_id = str(user_id)
+    version = get_store().mark_read(user_id, up_to)
+    if version is None:
+        return False
+    notify(user_id, version)
+    return True
 
 
 def clear_user_web_notifications(user_id):
     """Clear all notifications for a specific user."""
-    with web_notifications_lock:
-        data = _load_web_notifications()
-        user_id = str(user_id)
-        if user_id in data:
-            data[user_id] = []
-            _save_web_notifications(data)
-            return True
+    user_id = str(user_id)
+    version = get_store().clear(user_id)
+    if version is None:
         return False
+    notify(user_id, version)
+    return True
+
+
+def touch_user_web_notifications(user_id):
+    """Wake the streams of `user_id`, in every process, after a change stored elsewhere (purchases)."""
+    user_id = str(user_id)
+    notify(user_id, get_store().touch(user_id))
 
 
-def delete_single_notification(user_id, timestamp):
-    """Delete a single notification by timestamp."""
-    with web_notifications_lock:
-        data = _load_web_notifications()
-        user_id = str(user_id)
-        if user_id in data:
-            original_len = len(data[user_id])
-            data[user_id] = [n for n in data[user_id] if n.get("timestamp") != timestamp]
-            if len(data[user_id]) < original_len:
-                _save_web_notifications(data)
-                return True
+def delete_single_notification(user_id, notification_id):
+    """Delete a single notification by id."""
+    user_id = str(user_id)
+    version = get_store().delete(user_id, notification_id)
+    if version is None:
         return False
+    notify(user_id, version)
+    return True
+
+
+if __name__ == "__main__":
+    n_notifications = SQLiteNotificationStore().migrate_from_json()
+    if n_notifications:
+        print(f"✅ Migration terminée : {n_notifications} notifications importées dans {config.DB_FILE}")
+    else:
+        print("ℹ️ Migration déjà effectuée (ou aucune donnée à importer).")
@@ -0,0 +1,160 @@
+"""
+ydl_pool.py — Réserve d'instances yt_dlp.YoutubeDL réutilisables.
+
+Créer un YoutubeDL coûte cher (chargement des extracteurs, session HTTP, cookies) :
+les instances sont gardées au chaud par profil ('audio', 'mp3', 'mp4', 'info') et prêtées à
+un seul job à la fois. Les réglages propres au job (hooks de progression, modèle de
+nom de fichier, sélection de format) sont appliqués au prêt puis retirés au retour.
+Une instance est recyclée après YDL_POOL_MAX_USES prêts, YDL_POOL_MAX_AGE secondes
+ou une erreur. Les instances sont aussi séparées par stratégie de contournement
+(robust_engine) : `run` essaie la meilleure puis les suivantes en cas d'échec.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import yt_dlp
+
+import config
+import robust_engine
+
+COMMON_OPTIONS = {'noplaylist': True, 'quiet': True, 'no_color': True}
+
+PROFILES = {
+    'audio': {'format': 'bestaudio[ext=m4a]/bestaudio/best'},  # piste native, livrée telle quelle
+    'mp3': {'format': 'bestaudio/best'},  # conversion MP3 faite ensuite par transcoder.py
+    'mp4': {'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+            'merge_output_format': 'mp4'},  # vidéo + audio séparés, fusionnés par ffmpeg
+    'info': {},  # métadonnées seules (extract_info(download=False))
+}
+
+
+class _Entry:
+    def __init__(self, profile, strategy):
+        options = robust_engine.get_bypass_config(strategy)
+        options.update(COMMON_OPTIONS)
+        options.update(PROFILES[profile])
+        self.ydl = yt_dlp.YoutubeDL(options)
+        self.created = time.monotonic()
+        self.uses = 0
+
+    def worn_out(self):
+        return (self.uses >= config.YDL_POOL_MAX_USES
+                or time.monotonic() - self.created > config.YDL_POOL_MAX_AGE)
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception:
+            pass
+
+
+_idle = {}   # (profil, stratégie) -> instances libres, la plus récente en dernier
+_lock = threading.Lock()
+_counters = {"created": 0, "reused": 0, "recycled": 0}
+
+
+def _take(key):
+    with _lock:
+        idle = _idle.setdefault(key, [])
+        while idle:
+            entry = idle.pop()
+            if not entry.worn_out():
+                _counters["reused"] += 1
+                return entry
+            _counters["recycled"] += 1
+            entry.close()
+        _counters["created"] += 1
+    return _Entry(*key)
+
+
+def _give_back(key, entry, healthy):
+    entry.uses += 1
+    with _lock:
+        if healthy and not entry.worn_out() and len(_idle[key]) < config.YDL_POOL_SIZE:
+            _idle[key].append(entry)
+            return
+        _counters["recycled"] += 1
+    entry.close()
+
+
+@contextmanager
+def acquire(profile, outtmpl=None, progress_hooks=(), format=None, params=None, strategy=None):
+    """
+    Prête une instance YoutubeDL du profil donné, configurée pour ce job uniquement :
+        with ydl_pool.acquire('mp4', outtmpl=..., progress_hooks=[hook]) as ydl:
+            info = ydl.extract_info(url, download=True)
+    `params` : options yt-dlp lues au moment du téléchargement (ex : concurrent_fragment_downloads).
+    `strategy` : profil de contournement robust_engine (par défaut : le meilleur actuel).
+    """
+    pool_key = (profile, strategy or robust_engine.choose_profile())
+    entry = _take(pool_key)
+    ydl = entry.ydl
+    saved_outtmpl = dict(ydl.params['outtmpl'])
+    saved_format = ydl.params.get('format')
+    saved_selector = ydl.format_selector
+    saved_params = {name: ydl.params[name] for name in params or {} if name in ydl.params}
+    ydl.params.update(params or {})
+    if outtmpl:
+        ydl.params['outtmpl'] = dict(saved_outtmpl, default=outtmpl)
+    if format:
+        ydl.params['format'] = format
+        ydl.format_selector = ydl.build_format_selector(format)
+    ydl._progress_hooks = list(progress_hooks)
+    healthy = False
+    try:
+        yield ydl
+        healthy = True
+    finally:
+        # Aucun réglage du job ne doit fuiter vers le suivant
+        for name in params or {}:
+            ydl.params.pop(name, None)
+        ydl.params.update(saved_params)
+        ydl.params['outtmpl'] = saved_outtmpl
+        ydl.params['format'] = saved_format
+        ydl.format_selector = saved_selector
+        ydl._progress_hooks = []
+        ydl._download_retcode = 0
+        _give_back(pool_key, entry, healthy)
+
+
+def run(profile, job, **options):
+    """
+    Exécute `job(ydl)` avec la meilleure stratégie de contournement, puis les suivantes si
+    yt-dlp échoue pour une raison liée à la stratégie (blocage, timeout...). Chaque essai
+    alimente le tableau de scores de robust_engine ; la latence mesurée est le temps avant
+    le premier octet téléchargé (ou la durée totale pour une simple analyse).
+    """
+    caller_hooks = list(options.pop('progress_hooks', ()))
+    last_error = None
+    for strategy in robust_engine.profiles_to_try():
+        first_byte = []
+
+        def on_progress(d, first_byte=first_byte):
+            if not first_byte and d.get('status') == 'downloading':
+                first_byte.append(time.monotonic())
+
+        started = time.monotonic()
+        try:
+            with acquire(profile, strategy=strategy, progress_hooks=caller_hooks + [on_progress], **options) as ydl:
+                result = job(ydl)
+        except yt_dlp.utils.DownloadError as e:
+            if robust_engine.is_permanent_error(e):
+                raise
+            robust_engine.record_failure(strategy)
+            last_error = e
+            continue
+        robust_engine.record_success(strategy, (first_byte[0] if first_byte else time.monotonic()) - started)
+        return result
+    if last_error is None:
+        raise yt_dlp.utils.DownloadError("Aucune stratégie de contournement disponible")
+    raise last_error
+
+
+def stats():
+    """Instances libres par profil et compteurs de création / réutilisation / recyclage."""
+    with _lock:
+        idle = {}
+        for (profile, _strategy), entries in _idle.items():
+            idle[profile] = idle.get(profile, 0) + len(entries)
+        return dict(_counters, idle=idle)